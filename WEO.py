@@ -1,27 +1,58 @@
 import configparser
+import functools
+import os
 import sys
+import time
+from contextlib import contextmanager
 from enum import Enum
+from typing import Callable
 
 import click
-from rich.console import Console
 
 from config.version import WEO_VERSION
+from exceptions.CompressionNotSupportedError import CompressionNotSupportedError
+from exceptions.EnvironmentArchiveError import EnvironmentArchiveError
 from exceptions.ConfigNotFoundError import ConfigNotFoundError
 from exceptions.EnvironmentExistsError import EnvironmentExistsError
 from exceptions.EnvironmentNotFoundError import EnvironmentNotFoundError
+from exceptions.EnvironmentNotUpdatableError import EnvironmentNotUpdatableError
+from exceptions.WeoError import WeoError
 from exceptions.OrchestratorError import OrchestratorError
+from exceptions.ServiceError import ServiceError
+from exceptions.SlimmingProfileError import SlimmingProfileError
+from exceptions.TemplateExistsError import TemplateExistsError
+from exceptions.TemplateNotFoundError import TemplateNotFoundError
+from exceptions.UserNotFoundError import UserNotFoundError
+from orchestrator.artifact_cache import ArtifactCache
+from orchestrator.environment_archive import EnvironmentTransfer
 from orchestrator.orchestrator import Orchestrator
 from orchestrator.orchestrator_factory import OrchestratorFactory, OrchestratorFactoryStatus
+from orchestrator.rootfs_compression import Compression, CompressionSettings
+from orchestrator.rootfs_diff import RootfsDiffReport
+from orchestrator.rootfs_slimming import RootfsReport, SlimmingFilter
+from tracing.tracer import Tracer, get_tracer, set_tracer
+from wsl.wsl_api import WslApiError
+from wsl.wsl_registry import WslInstanceState, WslRegistry
+
+
+DEFAULT_ARTIFACT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".weo", "artifacts")
 
 
 class ExitCodes(Enum):
     INIT_FAILURE = 16
     CREATION_FAILURE = 26
+    CACHE_FAILURE = 36
+    TRANSFER_FAILURE = 46
+    SERVICE_FAILURE = 56
+    TEMPLATE_FAILURE = 66
+    GC_FAILURE = 76
+    UPDATE_FAILURE = 86
 
 
-def _get_orchestrator(verbose: bool) -> Orchestrator:
+def _get_orchestrator(verbose: bool, recheck: bool = False) -> Orchestrator:
     click.secho(f"Checking WEO status", fg="blue")
-    orchestrator_factory = OrchestratorFactory(verbose)
+    with get_tracer().span("Checking orchestrator", "weo", recheck=recheck):
+        orchestrator_factory = OrchestratorFactory(verbose, recheck)
     match orchestrator_factory.status:
         case OrchestratorFactoryStatus.OK:
             click.secho(f"WEO already initialized. Continuing...", fg="blue")
@@ -32,22 +63,135 @@ def _get_orchestrator(verbose: bool) -> Orchestrator:
                        "orchestrator instance...", fg="blue")
 
     try:
-        orchestrator_factory.initialize(overwrite=True)
-        return orchestrator_factory.create_orchestrator()
+        with get_tracer().span("Initializing orchestrator", "weo", status=orchestrator_factory.status.name):
+            orchestrator_factory.initialize(overwrite=True)
+            return orchestrator_factory.create_orchestrator()
     except OrchestratorError as e:
         click.secho(f"{e}", fg="red")
         sys.exit(ExitCodes.INIT_FAILURE.value)
 
 
+def _connect_service(recheck: bool = False):
+    # Profiles and full verifications need the orchestrator within this process
+    if recheck or get_tracer().enabled:
+        return None
+    from service.service_info import ServiceInfoFile
+    if not os.path.exists(ServiceInfoFile.default_path()):
+        return None
+    from service.service_client import ServiceClient
+    service = ServiceClient.connect()
+    if service:
+        click.secho(f"Using WEO service (pid {service.pid})", fg="blue")
+    return service
+
+
+def _get_compression_settings(compression: str | None, level: int | None,
+                              threads: int | None) -> CompressionSettings | None:
+    if compression is None:
+        if level is not None or threads is not None:
+            raise click.UsageError("--compression-level and --compression-threads require --compression")
+        return None
+    try:
+        CompressionSettings(Compression(compression.lower()), level)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--compression-level")
+    try:
+        return CompressionSettings(Compression(compression.lower()), level, 1 if threads is None else threads)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--compression-threads")
+
+
+def _get_slimming_filter(profiles: tuple[str, ...]) -> SlimmingFilter | None:
+    if not profiles:
+        return None
+    try:
+        return SlimmingFilter.load(list(profiles))
+    except SlimmingProfileError as e:
+        raise click.BadParameter(str(e), param_hint="--slim")
+
+
+def _format_bytes(value: float) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(value) < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TiB"
+
+
+def _format_age(seconds: float) -> str:
+    for unit, length in [("d", 24 * 60 * 60), ("h", 60 * 60), ("m", 60)]:
+        if seconds >= length:
+            return f"{seconds / length:.0f}{unit}"
+    return f"{max(seconds, 0):.0f}s"
+
+
+def _print_docker_daemon_statistics(orchestrator: Orchestrator) -> None:
+    docker_daemon = orchestrator.docker_daemon
+    ready_times = ", ".join(f"{ready_time:.2f}s" for ready_time in docker_daemon.ready_times) or "-"
+    click.secho(f"[DEBUG:] Docker daemon started {docker_daemon.start_count} time(s), "
+                f"stopped {docker_daemon.stop_count} time(s), time to ready: {ready_times}", fg="cyan")
+
+
+def _print_transfer(message: str, transfer: EnvironmentTransfer) -> None:
+    ratio = transfer.archive_size / transfer.rootfs_size if transfer.rootfs_size else 0.0
+    click.secho(f"{message} in {transfer.duration:.1f}s", fg="blue")
+    click.secho(f"Rootfs:     {_format_bytes(transfer.rootfs_size)}", fg="blue")
+    click.secho(f"Archive:    {_format_bytes(transfer.archive_size)} (ratio {ratio:.3f})", fg="blue")
+    click.secho(f"Throughput: {transfer.throughput / 1000 / 1000:.1f} MB/s", fg="blue")
+
+
+def _print_rootfs_report(report: RootfsReport) -> None:
+    slimming = report.slimming
+    if slimming:
+        duration = "while packing" if slimming.duration is None else f"in {slimming.duration:.1f}s"
+        click.secho(f"Rootfs:  slimmed by {_format_bytes(slimming.saved)} ({_format_bytes(slimming.size_before)} -> "
+                    f"{_format_bytes(slimming.size_after)}, {slimming.removed_entries} entries) {duration}", fg="blue")
+    if report.piped:
+        click.secho(f"Import:  {_format_bytes(report.archive_size)} piped into wsl --import in "
+                    f"{report.import_duration:.1f}s", fg="blue")
+        return
+    click.secho(f"Archive: {_format_bytes(report.archive_size)}, packed in {report.pack_duration:.1f}s", fg="blue")
+    click.secho(f"Import:  {report.import_duration:.1f}s from a staging file", fg="blue")
+
+
+@contextmanager
+def _profile(path: str | None):
+    if not path:
+        yield
+        return
+    tracer = Tracer(enabled=True)
+    set_tracer(tracer)
+    try:
+        yield
+    finally:
+        # The trace is also written if the command fails, as those runs are often the interesting ones
+        tracer.write_chrome_trace(path)
+        click.secho(f"Wrote {len(tracer.spans)} trace span(s) to {path}", fg="blue")
+
+
+def _profiled(command):
+    @click.option("--profile", "profile_path",
+                  type=click.Path(dir_okay=False, writable=True),
+                  help="Write a Chrome trace of the run to this file. It can be opened in "
+                       "chrome://tracing or ui.perfetto.dev.")
+    @functools.wraps(command)
+    def profiled_command(*args, profile_path=None, **kwargs):
+        with _profile(profile_path):
+            return command(*args, **kwargs)
+    return profiled_command
+
+
 @click.group()
 def cli():
     pass
 
 
 @cli.command(help="Creates a new wsl environment")
-@click.option("-d", "--docker-image", required=True,
+@click.option("-d", "--docker-image",
               help="The name of the docker image to use as "
                    "environment base")
+@click.option("-t", "--from-template",
+              help="The name of a template to clone the environment from instead of building a docker image.")
 @click.option("-e", "--environment-name", required=True,
               help="The name of the new environment that will be created")
 @click.option("-l", '--local',
@@ -64,38 +208,252 @@ def cli():
               required=False,
               help="The user that should be used within the environment. "
                    "This user needs to exist in the image.")
+@click.option("-s", "--streaming",
+              is_flag=True,
+              required=False,
+              help="Rewrite the exported rootfs in a single streaming pass instead of "
+                   "extracting and repacking it on the orchestrator.")
+@click.option("-c", "--compression",
+              type=click.Choice([compression.value for compression in Compression], case_sensitive=False),
+              help="The compression of the packed rootfs when it is staged in a file. "
+                   "Defaults to the orchestrator configuration.")
+@click.option("--compression-level",
+              type=int,
+              help="The compression level, dependent on the compression used.")
+@click.option("--compression-threads",
+              type=click.IntRange(min=0),
+              help="The number of threads used for compression. 0 uses all cores.")
+@click.option("--artifact-cache", "artifact_cache_dir",
+              default=DEFAULT_ARTIFACT_CACHE_DIR,
+              envvar="WEO_ARTIFACT_CACHE",
+              show_default=True,
+              help="Directory of the rootfs artifact cache. Can be a directory shared by several machines.")
+@click.option("--no-artifact-cache",
+              is_flag=True,
+              required=False,
+              help="Neither use nor fill the rootfs artifact cache.")
+@click.option("--fill-artifact-cache",
+              is_flag=True,
+              required=False,
+              help="Also store a rootfs which is not streamed in the artifact cache. It is copied out of the "
+                   "orchestrator once more for that.")
+@click.option("--slim", "slim_profiles",
+              multiple=True,
+              metavar="PROFILE",
+              help="Remove files matching a slimming profile from the rootfs before it is packed. One of "
+                   f"{', '.join(SlimmingFilter.profile_names())} or a file with .dockerignore syntax. "
+                   "Can be given multiple times.")
+@click.option("--build-timeout",
+              type=click.IntRange(min=1),
+              help="Abort the docker build of an environment after this many seconds.")
+@click.option("--recheck",
+              is_flag=True,
+              required=False,
+              help="Fully verify the orchestrator instead of trusting the cached health stamp.")
 @click.option("-v", "--verbose",
               is_flag=True,
               required=False,
               help="Print verbose log outputs.")
-def create(docker_image, environment_name, local, environment_password, user, verbose):
-    orchestrator = _get_orchestrator(verbose)
+@_profiled
+def create(docker_image, from_template, environment_name, local, environment_password, user, streaming, compression,
+           compression_level, compression_threads, artifact_cache_dir, no_artifact_cache, fill_artifact_cache,
+           slim_profiles, build_timeout, recheck, verbose):
+    if bool(docker_image) == bool(from_template):
+        raise click.UsageError("Either --docker-image or --from-template is required")
+    if from_template and (local or streaming or compression or slim_profiles or build_timeout):
+        raise click.UsageError("--local, --streaming, --compression, --slim and --build-timeout cannot be used "
+                               "with --from-template")
+    if fill_artifact_cache and no_artifact_cache:
+        raise click.UsageError("--fill-artifact-cache cannot be used with --no-artifact-cache")
+    compression_settings = _get_compression_settings(compression, compression_level, compression_threads)
+    slimming = _get_slimming_filter(slim_profiles)
+    if local:
+        # The service resolves relative paths against its own working directory
+        docker_image = os.path.abspath(docker_image)
+    service = _connect_service(recheck)
+    orchestrator = None if service else _get_orchestrator(verbose, recheck)
+
+    def create_environment(log_func: Callable[[str], None]) -> RootfsReport:
+        if from_template:
+            # Clones only differ in their configuration and password, so they are a single import of the template
+            return (service or orchestrator).create_from_template(log_func, from_template, environment_name,
+                                                                  environment_password, user)
+        if service:
+            return service.create(log_func, docker_image, environment_name, local, environment_password, user,
+                                  streaming, compression_settings, None if no_artifact_cache else artifact_cache_dir,
+                                  build_timeout=build_timeout, slimming_profiles=slimming.names if slimming else None,
+                                  fill_artifact_cache=fill_artifact_cache)
+        artifact_cache = None if no_artifact_cache else ArtifactCache(artifact_cache_dir)
+        return orchestrator.create(log_func, docker_image, environment_name, local, environment_password, user,
+                                   streaming, compression_settings, artifact_cache, build_timeout=build_timeout,
+                                   slimming=slimming, fill_artifact_cache=fill_artifact_cache)
+
     try:
         click.secho(f"Creating environment {environment_name}", fg="blue")
         if not verbose:
+            from rich.console import Console
             console = Console()
             with console.status("[bold dodger_blue1]Working on creation...") as status:
-                log_func = lambda str : status.update(f"[bold dodger_blue1] {str}")
-                orchestrator.create(log_func, docker_image, environment_name, local, environment_password, user)
+                report = create_environment(lambda str : status.update(f"[bold dodger_blue1] {str}"))
         else:
-            log_func = lambda str : click.secho(f"[PROGRESS:] {str}", fg="blue")
-            orchestrator.create(log_func, docker_image, environment_name, local, environment_password, user)
+            report = create_environment(lambda str : click.secho(f"[PROGRESS:] {str}", fg="blue"))
+            if orchestrator:
+                _print_docker_daemon_statistics(orchestrator)
 
         click.secho(f"Successfully created environment {environment_name}", fg="blue")
-    except (OrchestratorError, configparser.Error, EnvironmentExistsError) as e:
+        if report and (slimming or verbose):
+            _print_rootfs_report(report)
+    except (OrchestratorError, configparser.Error, EnvironmentExistsError, CompressionNotSupportedError,
+            WslApiError, ServiceError, TemplateNotFoundError, EnvironmentArchiveError, UserNotFoundError) as e:
+        click.secho(f"{e}", fg="red")
+        sys.exit(ExitCodes.CREATION_FAILURE.value)
+
+
+@cli.command(name="create-many", help="Creates all wsl environments listed in a manifest")
+@click.option("-m", "--manifest", required=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help="A json, toml or yaml manifest listing the environments with image, name, "
+                   "local, user and password.")
+@click.option("-w", "--workers",
+              type=click.IntRange(min=1),
+              default=2,
+              show_default=True,
+              help="The maximum number of environments created concurrently.")
+@click.option("-s", "--streaming",
+              is_flag=True,
+              required=False,
+              help="Rewrite the exported rootfs in a single streaming pass instead of "
+                   "extracting and repacking it on the orchestrator.")
+@click.option("-c", "--compression",
+              type=click.Choice([compression.value for compression in Compression], case_sensitive=False),
+              help="The compression of the packed rootfs when it is staged in a file. "
+                   "Defaults to the orchestrator configuration.")
+@click.option("--compression-level",
+              type=int,
+              help="The compression level, dependent on the compression used.")
+@click.option("--compression-threads",
+              type=click.IntRange(min=0),
+              help="The number of threads used for compression. 0 uses all cores.")
+@click.option("--artifact-cache", "artifact_cache_dir",
+              default=DEFAULT_ARTIFACT_CACHE_DIR,
+              envvar="WEO_ARTIFACT_CACHE",
+              show_default=True,
+              help="Directory of the rootfs artifact cache. Can be a directory shared by several machines.")
+@click.option("--no-artifact-cache",
+              is_flag=True,
+              required=False,
+              help="Do not use the persistent rootfs artifact cache. Images are still only built once per batch.")
+@click.option("--slim", "slim_profiles",
+              multiple=True,
+              metavar="PROFILE",
+              help="Remove files matching a slimming profile from the rootfs before it is packed. One of "
+                   f"{', '.join(SlimmingFilter.profile_names())} or a file with .dockerignore syntax. "
+                   "Can be given multiple times.")
+@click.option("--build-timeout",
+              type=click.IntRange(min=1),
+              help="Abort the docker build of an environment after this many seconds.")
+@click.option("--recheck",
+              is_flag=True,
+              required=False,
+              help="Fully verify the orchestrator instead of trusting the cached health stamp.")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+@_profiled
+def create_many(manifest, workers, streaming, compression, compression_level, compression_threads,
+                artifact_cache_dir, no_artifact_cache, slim_profiles, build_timeout, recheck, verbose):
+    # The scheduler and the rich progress display are only loaded for batch creation to keep the startup fast
+    from rich.console import Console
+    from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
+    from rich.table import Table
+
+    from exceptions.ManifestError import ManifestError
+    from orchestrator.build_scheduler import BuildJobResult, BuildJobStatus, BuildScheduler
+    from orchestrator.environment_manifest import EnvironmentManifest
+
+    compression_settings = _get_compression_settings(compression, compression_level, compression_threads)
+    slimming = _get_slimming_filter(slim_profiles)
+    try:
+        environments = EnvironmentManifest.load(manifest).environments
+    except ManifestError as e:
+        click.secho(f"{e}", fg="red")
+        sys.exit(ExitCodes.CREATION_FAILURE.value)
+    artifact_cache = None if no_artifact_cache else ArtifactCache(artifact_cache_dir)
+    orchestrator = _get_orchestrator(verbose, recheck)
+    scheduler = BuildScheduler(orchestrator, workers, streaming, compression_settings, artifact_cache, build_timeout,
+                               slimming)
+
+    click.secho(f"Creating {len(environments)} environment(s) with {workers} worker(s)", fg="blue")
+    try:
+        if not verbose:
+            with Progress(SpinnerColumn(finished_text=" "),
+                          TextColumn("[bold]{task.fields[environment]}"),
+                          TextColumn("{task.description}"),
+                          TimeElapsedColumn()) as progress:
+                task_ids = {spec.environment_name: progress.add_task("Queued", total=1, start=False,
+                                                                     environment=spec.environment_name)
+                            for spec in environments}
+
+                def on_step(result: BuildJobResult, description: str) -> None:
+                    task_id = task_ids[result.spec.environment_name]
+                    if result.status == BuildJobStatus.RUNNING:
+                        progress.start_task(task_id)
+                    progress.update(task_id, description=f"[dodger_blue1]{description}")
+
+                def on_finished(result: BuildJobResult) -> None:
+                    description = "[green]Created" if result.status == BuildJobStatus.SUCCEEDED else "[red]Failed"
+                    progress.update(task_ids[result.spec.environment_name], description=description, completed=1)
+
+                results = scheduler.run(environments, on_step, on_finished)
+        else:
+            on_step = lambda result, description: click.secho(
+                f"[PROGRESS:] {result.spec.environment_name}: {description}", fg="blue")
+            on_finished = lambda result: click.secho(
+                f"[PROGRESS:] {result.spec.environment_name}: {result.status.value} "
+                f"after {result.duration:.1f}s", fg="blue")
+            results = scheduler.run(environments, on_step, on_finished)
+            _print_docker_daemon_statistics(orchestrator)
+    except (OrchestratorError, configparser.Error) as e:
         click.secho(f"{e}", fg="red")
         sys.exit(ExitCodes.CREATION_FAILURE.value)
 
+    table = Table()
+    columns = ["Environment", "Image", "Status", "Duration", "Archive"] + (["Slimmed"] if slimming else []) + ["Error"]
+    for column in columns:
+        table.add_column(column)
+    for result in results:
+        status_color = "green" if result.status == BuildJobStatus.SUCCEEDED else "red"
+        report = result.report
+        archive = _format_bytes(report.archive_size) if report else ""
+        slimmed = [_format_bytes(report.slimming.saved) if report and report.slimming else ""] if slimming else []
+        table.add_row(result.spec.environment_name, result.spec.docker_image,
+                      f"[{status_color}]{result.status.value}", f"{result.duration:.1f}s", archive, *slimmed,
+                      result.error or "")
+    Console().print(table)
+
+    failed = [result for result in results if result.status != BuildJobStatus.SUCCEEDED]
+    if failed:
+        click.secho(f"{len(failed)} of {len(results)} environment(s) could not be created", fg="red")
+        sys.exit(ExitCodes.CREATION_FAILURE.value)
+    click.secho(f"Successfully created {len(results)} environment(s)", fg="blue")
+
 
 @cli.command(help="Removes an existing wsl environment")
 @click.option("-e", "--environment-name", required=True,
               help="The name of the new environment that will be removed")
+@click.option("--recheck",
+              is_flag=True,
+              required=False,
+              help="Fully verify the orchestrator instead of trusting the cached health stamp.")
 @click.option("-v", "--verbose",
               is_flag=True,
               required=False,
               help="Print verbose log outputs.")
-def remove(environment_name, verbose):
-    orchestrator = _get_orchestrator(verbose)
+@_profiled
+def remove(environment_name, recheck, verbose):
+    service = _connect_service(recheck)
+    orchestrator = service or _get_orchestrator(verbose, recheck)
     try:
         click.secho(f"Removing environment {environment_name}", fg="blue")
         orchestrator.remove(environment_name)
@@ -106,21 +464,659 @@ def remove(environment_name, verbose):
         click.secho(f"The environment {environment_name} was not created by WEO. Aborting...", fg="red")
     except configparser.Error:
         click.secho(f"The environment {environment_name} does not have a valid WEO configuration file. Aborting...", fg="red")
-    except OrchestratorError as e:
+    except (OrchestratorError, ServiceError) as e:
         click.secho(f"{e}", fg="red")
         sys.exit(ExitCodes.CREATION_FAILURE.value)
 
 
-# ToDo: Implement
-# @cli.command()
-# def export_env():
-#     pass
+@cli.command(help="Updates an existing wsl environment to a changed image by applying only the changed files, "
+                  "leaving user data alone")
+@click.option("-e", "--environment-name", required=True,
+              help="The name of the environment that will be updated")
+@click.option("-d", "--docker-image",
+              help="The docker image to update the environment to. Defaults to the image the environment was "
+                   "created from.")
+@click.option("-l", '--local',
+              type=click.Choice(['FILE', 'DIR'], case_sensitive=False),
+              help="If this is set the option \"-d\" will be interpreted as a local path to a dockerfile or to a "
+                   "directory containing a dockerfile and it's build assets dependent on the value.")
+@click.option("-k", "--keep", "keep_patterns",
+              multiple=True,
+              metavar="PATTERN",
+              help="A path with .dockerignore syntax, relative to the root of the environment, which is never "
+                   "touched by the update in addition to home directories, WSL files and files changed in the "
+                   "environment. Can be given multiple times.")
+@click.option("-n", "--dry-run",
+              is_flag=True,
+              required=False,
+              help="Only list the changes which would be applied.")
+@click.option("-f", "--force",
+              is_flag=True,
+              required=False,
+              help="Compare the environment with the image even if the image digest did not change.")
+@click.option("--build-timeout",
+              type=click.IntRange(min=1),
+              help="Abort the docker build of the image after this many seconds.")
+@click.option("--recheck",
+              is_flag=True,
+              required=False,
+              help="Fully verify the orchestrator instead of trusting the cached health stamp.")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+@_profiled
+def update(environment_name, docker_image, local, keep_patterns, dry_run, force, build_timeout, recheck, verbose):
+    if local and not docker_image:
+        raise click.UsageError("--local requires --docker-image")
+    if local:
+        # The service resolves relative paths against its own working directory
+        docker_image = os.path.abspath(docker_image)
+    service = _connect_service(recheck)
+    orchestrator = service or _get_orchestrator(verbose, recheck)
 
+    def update_environment(log_func: Callable[[str], None]) -> RootfsDiffReport:
+        return orchestrator.update(log_func, environment_name, docker_image, local, list(keep_patterns), dry_run,
+                                   force, build_timeout)
 
-# ToDo: Implement
-# @cli.command()
-# def import_env():
-#     pass
+    try:
+        click.secho(f"Updating environment {environment_name}" + (" (dry run)" if dry_run else ""), fg="blue")
+        if not verbose:
+            from rich.console import Console
+            with Console().status("[bold dodger_blue1]Working on update...") as status:
+                report = update_environment(lambda str : status.update(f"[bold dodger_blue1] {str}"))
+        else:
+            report = update_environment(lambda str : click.secho(f"[PROGRESS:] {str}", fg="blue"))
+    except EnvironmentNotFoundError:
+        click.secho(f"Environment {environment_name} does not exist", fg="red")
+        sys.exit(ExitCodes.UPDATE_FAILURE.value)
+    except ConfigNotFoundError:
+        click.secho(f"The environment {environment_name} was not created by WEO. Aborting...", fg="red")
+        sys.exit(ExitCodes.UPDATE_FAILURE.value)
+    except (OrchestratorError, configparser.Error, EnvironmentNotUpdatableError, WslApiError, ServiceError,
+            OSError) as e:
+        click.secho(f"{e}", fg="red")
+        sys.exit(ExitCodes.UPDATE_FAILURE.value)
+
+    if report.up_to_date:
+        click.secho(f"Environment {environment_name} is up to date with its image", fg="blue")
+        return
+    if dry_run:
+        for prefix, paths, color in [("+", report.added, "green"), ("~", report.changed, "yellow"),
+                                     ("-", report.removed, "red")]:
+            for path in sorted(paths):
+                click.secho(f"{prefix} /{path}", fg=color)
+        for path, name in sorted(report.added_accounts):
+            click.secho(f"+ {name} in /{path}", fg="green")
+    if report.modified:
+        # Paths of the image which were changed or removed by hand are never reset
+        click.secho(f"Keeping {len(report.modified)} entries of the image which were changed in the environment"
+                    + ("" if verbose or dry_run else ", use -v to list them"), fg="yellow")
+        if verbose or dry_run:
+            for path in sorted(report.modified):
+                click.secho(f"= /{path}", fg="yellow")
+    summary = (f"{len(report.added)} added, {len(report.changed)} changed and {len(report.removed)} removed "
+               f"entries, {len(report.added_accounts)} added accounts, {_format_bytes(report.transfer_size)} to "
+               f"transfer")
+    if dry_run:
+        click.secho(f"Would apply {summary}", fg="blue")
+        return
+    click.secho(f"Successfully updated environment {environment_name}: {summary}", fg="blue")
+    if verbose:
+        click.secho(f"Kept:    {report.kept_entries} entries of protected paths", fg="blue")
+        click.secho(f"Timing:  indexed in {report.index_duration:.1f}s, compared in {report.diff_duration:.1f}s, "
+                    f"applied in {report.apply_duration:.1f}s", fg="blue")
+
+
+@cli.command(name="list", help="Lists all wsl instances")
+@click.option("-r", "--running",
+              is_flag=True,
+              required=False,
+              help="Only list running instances.")
+def list_instances(running):
+    from rich.console import Console
+    from rich.table import Table
+
+    instances = WslRegistry().instances()
+    if running:
+        instances = [instance for instance in instances if instance.state == WslInstanceState.RUNNING]
+    if not instances:
+        click.secho("No wsl instances found", fg="yellow")
+        return
+
+    table = Table()
+    for column in ["", "Name", "State", "Version"]:
+        table.add_column(column)
+    for instance in instances:
+        name = instance.name
+        if name == OrchestratorFactory.orchestrator_instance_name():
+            name += " [cyan](WEO orchestrator)"
+        state_color = "green" if instance.state == WslInstanceState.RUNNING else "white"
+        table.add_row("*" if instance.default else "", name, f"[{state_color}]{instance.state.value}",
+                      str(instance.version or "-"))
+    Console().print(table)
+
+
+@cli.command(help="Fully verifies the orchestrator and refreshes its health stamp")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+def doctor(verbose):
+    click.secho("Verifying orchestrator", fg="blue")
+    try:
+        orchestrator_factory = OrchestratorFactory(verbose, recheck=True)
+    except (WeoError, WslApiError, configparser.Error) as e:
+        click.secho(f"Orchestrator could not be verified: {e}", fg="red")
+        sys.exit(ExitCodes.INIT_FAILURE.value)
+
+    problems = 0
+    instance_name = OrchestratorFactory.orchestrator_instance_name()
+    instance = orchestrator_factory.wsl_api.registry.get(instance_name)
+    match orchestrator_factory.status:
+        case OrchestratorFactoryStatus.OK:
+            click.secho(f"Instance:   {instance_name} ({instance.state.value}, WSL {instance.version or '?'})",
+                        fg="blue")
+            if instance.version != 2:
+                click.secho("The orchestrator needs to run on WSL 2", fg="red")
+                problems += 1
+        case OrchestratorFactoryStatus.NO_ORCHESTRATOR:
+            click.secho("WEO not initialized yet. Running any command initializes it.", fg="yellow")
+            problems += 1
+        case OrchestratorFactoryStatus.INCOMPATIBLE_ORCHESTRATOR:
+            click.secho("Orchestrator instance incompatible with WEO version. Running any command "
+                        "adjusts it.", fg="yellow")
+            problems += 1
+
+    if orchestrator_factory.status == OrchestratorFactoryStatus.OK:
+        try:
+            missing_tools = orchestrator_factory.create_orchestrator().missing_tools()
+        except (OrchestratorError, WslApiError) as e:
+            click.secho(f"{e}", fg="red")
+            sys.exit(ExitCodes.INIT_FAILURE.value)
+        if missing_tools:
+            click.secho(f"Missing tools on the orchestrator: {', '.join(missing_tools)}", fg="red")
+            problems += 1
+        else:
+            click.secho("Tools:      complete", fg="blue")
+
+    stamp = orchestrator_factory.stamp
+    if stamp:
+        verified_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(stamp.verified_at))
+        click.secho(f"Version:    {stamp.version}", fg="blue")
+        click.secho(f"GUID:       {stamp.instance_guid or 'unknown'}", fg="blue")
+        click.secho(f"Verified:   {verified_at}", fg="blue")
+
+    if problems:
+        click.secho(f"Found {problems} problem(s)", fg="red")
+        sys.exit(ExitCodes.INIT_FAILURE.value)
+    click.secho("Orchestrator is healthy", fg="blue")
+
+
+@cli.group(help="Inspects and prunes the docker cache of the orchestrator")
+def cache():
+    pass
+
+
+@cache.command(name="show", help="Shows the disk usage of the docker cache")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+def cache_show(verbose):
+    orchestrator = _get_orchestrator(verbose)
+    try:
+        usage = orchestrator.docker_cache_usage()
+    except OrchestratorError as e:
+        click.secho(f"{e}", fg="red")
+        sys.exit(ExitCodes.CACHE_FAILURE.value)
+
+    click.secho(f"Images:      {_format_bytes(usage.image_bytes)}", fg="blue")
+    click.secho(f"Build cache: {_format_bytes(usage.build_cache_bytes)}", fg="blue")
+    click.secho(f"Budget:      {_format_bytes(usage.budget_bytes)}", fg="blue")
+    for image in sorted(usage.images, key=lambda image: image.last_used, reverse=True):
+        last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(image.last_used)) if image.last_used else "never"
+        tags = ", ".join(image.tags) or "<none>"
+        click.echo(f"  {image.image_id[7:19]}  {_format_bytes(image.size):>10}  last used {last_used}  {tags}")
+
+
+@cache.command(name="prune", help="Evicts least recently used images until the cache fits its budget")
+@click.option("-a", "--all", "everything",
+              is_flag=True,
+              required=False,
+              help="Remove all images and the whole build cache.")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+def cache_prune(everything, verbose):
+    orchestrator = _get_orchestrator(verbose)
+    try:
+        evicted = orchestrator.prune_docker_cache(everything)
+    except OrchestratorError as e:
+        click.secho(f"{e}", fg="red")
+        sys.exit(ExitCodes.CACHE_FAILURE.value)
+    if everything:
+        click.secho("Removed all cached images and the build cache", fg="blue")
+        return
+    for image in evicted:
+        click.secho(f"Evicted {', '.join(image.tags) or image.image_id[7:19]} ({_format_bytes(image.size)})",
+                    fg="blue")
+    click.secho(f"Evicted {len(evicted)} image(s)", fg="blue")
+
+
+@cli.command(help="Builds images ahead of time and parks their rootfs in the artifact cache, so a later create "
+                  "only applies the environment configuration and password")
+@click.option("-d", "--docker-image", "docker_images",
+              multiple=True,
+              help="An image to prefetch, can be repeated.")
+@click.option("-l", '--local',
+              type=click.Choice(['FILE', 'DIR'], case_sensitive=False),
+              help="Interpret all images of \"-d\" as local paths to a dockerfile or to a directory containing a "
+                   "dockerfile.")
+@click.option("-m", "--manifest",
+              type=click.Path(exists=True, dir_okay=False),
+              help="Prefetch all images of a create-many manifest.")
+@click.option("--refresh",
+              is_flag=True,
+              required=False,
+              help="Rebuild images even if their rootfs is already cached.")
+@click.option("--interval",
+              type=click.IntRange(min=1),
+              help="Repeat the prefetch every this many minutes until stopped with Ctrl+C.")
+@click.option("--status",
+              is_flag=True,
+              required=False,
+              help="Show the cached rootfs with age, last use and size instead of prefetching.")
+@click.option("--artifact-cache", "artifact_cache_dir",
+              default=DEFAULT_ARTIFACT_CACHE_DIR,
+              envvar="WEO_ARTIFACT_CACHE",
+              show_default=True,
+              help="Directory of the rootfs artifact cache. Can be a directory shared by several machines.")
+@click.option("--build-timeout",
+              type=click.IntRange(min=1),
+              help="Abort the docker build of an image after this many seconds.")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+@_profiled
+def prefetch(docker_images, local, manifest, refresh, interval, status, artifact_cache_dir, build_timeout,
+             verbose):
+    artifact_cache = ArtifactCache(artifact_cache_dir)
+    if status:
+        _print_artifact_cache_status(artifact_cache)
+        return
+
+    targets = {(docker_image, local): None for docker_image in docker_images}
+    if manifest:
+        from exceptions.ManifestError import ManifestError
+        from orchestrator.environment_manifest import EnvironmentManifest
+        try:
+            environments = EnvironmentManifest.load(manifest).environments
+        except ManifestError as e:
+            click.secho(f"{e}", fg="red")
+            sys.exit(ExitCodes.CACHE_FAILURE.value)
+        # Environments of the same image share one cached rootfs, whatever user they are created with
+        for spec in environments:
+            targets[(spec.docker_image, spec.local)] = None
+    if not targets:
+        raise click.UsageError("Nothing to prefetch, use -d or -m")
+
+    orchestrator = _get_orchestrator(verbose)
+    while True:
+        failures = 0
+        # The daemon is shared by all images of a run, but not kept running between scheduled runs
+        with orchestrator.docker_daemon:
+            for docker_image, image_local in targets:
+                if not _prefetch_image(orchestrator, artifact_cache, docker_image, image_local, refresh,
+                                       build_timeout, verbose):
+                    failures += 1
+        if verbose:
+            _print_docker_daemon_statistics(orchestrator)
+        if not interval:
+            break
+        next_run = time.strftime("%H:%M", time.localtime(time.time() + interval * 60))
+        click.secho(f"Next prefetch at {next_run}, press Ctrl+C to stop", fg="blue")
+        try:
+            time.sleep(interval * 60)
+        except KeyboardInterrupt:
+            return
+    if failures:
+        click.secho(f"{failures} of {len(targets)} image(s) could not be prefetched", fg="red")
+        sys.exit(ExitCodes.CACHE_FAILURE.value)
+
+
+def _prefetch_image(orchestrator: Orchestrator, artifact_cache: ArtifactCache, docker_image: str, local: str | None,
+                    refresh: bool, build_timeout: int | None, verbose: bool) -> bool:
+    start = time.monotonic()
+    try:
+        if not verbose:
+            from rich.console import Console
+            with Console().status(f"[bold dodger_blue1]Prefetching {docker_image}...") as status:
+                entry, built = orchestrator.prefetch(
+                    lambda str: status.update(f"[bold dodger_blue1] {docker_image}: {str}"), docker_image, local,
+                    artifact_cache, refresh, build_timeout)
+        else:
+            entry, built = orchestrator.prefetch(
+                lambda str: click.secho(f"[PROGRESS:] {docker_image}: {str}", fg="blue"), docker_image, local,
+                artifact_cache, refresh, build_timeout)
+    except (WeoError, WslApiError, configparser.Error, OSError) as e:
+        click.secho(f"{docker_image} could not be prefetched: {e}", fg="red")
+        return False
+    if built:
+        click.secho(f"Prefetched {docker_image} in {time.monotonic() - start:.1f}s "
+                    f"({_format_bytes(entry.size)})", fg="blue")
+    else:
+        click.secho(f"{docker_image} is already warm (built {_format_age(time.time() - entry.created)} ago, "
+                    f"{_format_bytes(entry.size)})", fg="blue")
+    return True
+
+
+def _print_artifact_cache_status(artifact_cache: ArtifactCache) -> None:
+    from rich.console import Console
+    from rich.table import Table
+
+    entries = sorted(artifact_cache.entries(), key=lambda entry: entry.created, reverse=True)
+    if not entries:
+        click.secho(f"No rootfs cached in {artifact_cache.cache_dir}", fg="yellow")
+        return
+    now = time.time()
+    current = set()
+    table = Table()
+    for column in ["Image", "User", "Built", "Last used", "Size", ""]:
+        table.add_column(column)
+    for entry in entries:
+        # Only the newest rootfs of an image is used, older ones are left to the eviction
+        superseded = entry.image in current
+        current.add(entry.image)
+        table.add_row(entry.image, entry.user, f"{_format_age(now - entry.created)} ago",
+                      f"{_format_age(now - entry.last_used)} ago", _format_bytes(entry.size),
+                      "[yellow]superseded" if superseded else "[green]warm")
+    Console().print(table)
+    click.secho(f"{len(entries)} rootfs, {_format_bytes(sum(entry.size for entry in entries))} "
+                f"in {artifact_cache.cache_dir}", fg="blue")
+
+
+@cli.command(name="export", help="Exports a wsl environment into a compressed archive with manifest")
+@click.option("-e", "--environment-name", required=True,
+              help="The name of the environment that will be exported")
+@click.option("-o", "--output",
+              type=click.Path(dir_okay=False, writable=True),
+              help="The archive file. Defaults to the environment name in the current directory.")
+@click.option("-c", "--compression",
+              type=click.Choice([compression.value for compression in Compression if compression != Compression.ZSTD],
+                                case_sensitive=False),
+              default=Compression.GZIP.value,
+              show_default=True,
+              help="The compression of the archive.")
+@click.option("--compression-level",
+              type=int,
+              help="The compression level, dependent on the compression used.")
+@click.option("--compression-threads",
+              type=click.IntRange(min=0),
+              default=0,
+              show_default=True,
+              help="The number of threads used for compression. 0 uses all cores.")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+@_profiled
+def export_env(environment_name, output, compression, compression_level, compression_threads, verbose):
+    compression_settings = _get_compression_settings(compression, compression_level, compression_threads)
+    output = output or compression_settings.file_name(environment_name)
+    orchestrator = _get_orchestrator(verbose)
+    try:
+        click.secho(f"Exporting environment {environment_name} to {output}", fg="blue")
+        transfer = orchestrator.export_environment(environment_name, output, compression_settings)
+    except EnvironmentNotFoundError:
+        click.secho(f"Environment {environment_name} does not exist. Aborting...", fg="red")
+        sys.exit(ExitCodes.TRANSFER_FAILURE.value)
+    except ConfigNotFoundError:
+        click.secho(f"The environment {environment_name} was not created by WEO. Aborting...", fg="red")
+        sys.exit(ExitCodes.TRANSFER_FAILURE.value)
+    except (OrchestratorError, WslApiError, configparser.Error, CompressionNotSupportedError, OSError) as e:
+        click.secho(f"{e}", fg="red")
+        sys.exit(ExitCodes.TRANSFER_FAILURE.value)
+    _print_transfer(f"Exported environment {environment_name}", transfer)
+
+
+@cli.command(name="import", help="Imports a wsl environment from an archive created by export")
+@click.option("-i", "--input", "archive",
+              required=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help="The archive file. Its manifest is expected next to it.")
+@click.option("-e", "--environment-name",
+              help="The name of the imported environment. Defaults to the name in the manifest.")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+@_profiled
+def import_env(archive, environment_name, verbose):
+    orchestrator = _get_orchestrator(verbose)
+    try:
+        click.secho(f"Importing environment from {archive}", fg="blue")
+        transfer = orchestrator.import_environment(archive, environment_name)
+    except EnvironmentExistsError:
+        click.secho(f"Environment {environment_name or 'of the archive'} already exists. Aborting...", fg="red")
+        sys.exit(ExitCodes.TRANSFER_FAILURE.value)
+    except (WeoError, WslApiError) as e:
+        click.secho(f"{e}", fg="red")
+        sys.exit(ExitCodes.TRANSFER_FAILURE.value)
+    _print_transfer(f"Imported environment {transfer.environment_name}", transfer)
+
+
+@cli.command(name="gc", help="Finds and reclaims what failed or killed runs left behind: work dirs, temporary docker "
+                             "images and build contexts in the orchestrator, orphaned docker daemons, storage dirs of "
+                             "unregistered instances and partial files")
+@click.option("-n", "--dry-run",
+              is_flag=True,
+              required=False,
+              help="Only report what would be reclaimed.")
+@click.option("--artifact-cache", "artifact_cache_dir",
+              default=DEFAULT_ARTIFACT_CACHE_DIR,
+              envvar="WEO_ARTIFACT_CACHE",
+              show_default=True,
+              help="Directory of the rootfs artifact cache, whose partial files are reclaimed as well.")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+@_profiled
+def gc(dry_run, artifact_cache_dir, verbose):
+    from rich.console import Console
+    from rich.table import Table
+
+    from orchestrator.garbage_collector import GarbageKind
+
+    # The resident service holds the docker daemon, it is no orphan while the service runs
+    service = _connect_service()
+    if service:
+        service.close()
+    orchestrator = _get_orchestrator(verbose)
+    try:
+        click.secho("Looking for garbage" if dry_run else "Collecting garbage", fg="blue")
+        report = orchestrator.collect_garbage(dry_run, [artifact_cache_dir], keep_docker_daemon=service is not None)
+    except (OrchestratorError, WslApiError, configparser.Error, OSError) as e:
+        click.secho(f"{e}", fg="red")
+        sys.exit(ExitCodes.GC_FAILURE.value)
+
+    if report.garbage:
+        table = Table()
+        for column in ["Kind", "Location", "Size", "Status"]:
+            table.add_column(column)
+        for garbage in report.garbage:
+            status = "[yellow]found" if dry_run else "[red]" + garbage.error if garbage.error else "[green]reclaimed"
+            size = "-" if garbage.kind == GarbageKind.DOCKER_DAEMON else _format_bytes(garbage.size)
+            table.add_row(garbage.kind.value, garbage.location, size, status)
+        Console().print(table)
+    if report.in_use:
+        click.secho(f"Skipped {report.in_use} work dir(s) of running operations", fg="blue")
+    if dry_run:
+        click.secho(f"Would reclaim {_format_bytes(report.reclaimed)} in {len(report.garbage)} item(s)", fg="blue")
+        return
+    click.secho(f"Reclaimed {_format_bytes(report.reclaimed)} in {len(report.garbage) - len(report.failed)} "
+                f"item(s)", fg="blue")
+    if report.failed:
+        click.secho(f"{len(report.failed)} item(s) could not be reclaimed", fg="red")
+        sys.exit(ExitCodes.GC_FAILURE.value)
+
+
+@cli.group(help="Manages templates, environments stored once from which new environments are cloned with "
+                "create --from-template")
+def template():
+    pass
+
+
+@template.command(name="add", help="Stores an existing environment as template")
+@click.option("-e", "--environment-name", required=True,
+              help="The name of the environment that will be stored as template")
+@click.option("-t", "--template-name",
+              help="The name of the template. Defaults to the environment name.")
+@click.option("-f", "--force",
+              is_flag=True,
+              required=False,
+              help="Replace an existing template with the same name.")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+@_profiled
+def template_add(environment_name, template_name, force, verbose):
+    template_name = template_name or environment_name
+    orchestrator = _get_orchestrator(verbose)
+    try:
+        orchestrator.templates.path(template_name)
+        click.secho(f"Storing environment {environment_name} as template {template_name}", fg="blue")
+        transfer = orchestrator.add_template(environment_name, template_name, force)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--template-name")
+    except TemplateExistsError:
+        click.secho(f"Template {template_name} already exists, use --force to replace it. Aborting...", fg="red")
+        sys.exit(ExitCodes.TEMPLATE_FAILURE.value)
+    except EnvironmentNotFoundError:
+        click.secho(f"Environment {environment_name} does not exist. Aborting...", fg="red")
+        sys.exit(ExitCodes.TEMPLATE_FAILURE.value)
+    except ConfigNotFoundError:
+        click.secho(f"The environment {environment_name} was not created by WEO. Aborting...", fg="red")
+        sys.exit(ExitCodes.TEMPLATE_FAILURE.value)
+    except (OrchestratorError, WslApiError, configparser.Error, OSError) as e:
+        click.secho(f"{e}", fg="red")
+        sys.exit(ExitCodes.TEMPLATE_FAILURE.value)
+    _print_transfer(f"Stored template {template_name}", transfer)
+
+
+@template.command(name="list", help="Lists all templates")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+def template_list(verbose):
+    from rich.console import Console
+    from rich.table import Table
+
+    orchestrator = _get_orchestrator(verbose)
+    templates = orchestrator.templates.templates()
+    if not templates:
+        click.secho(f"No templates in {orchestrator.templates.templates_dir}", fg="blue")
+        return
+    table = Table()
+    for column in ["Template", "Environment", "Image", "User", "Created", "Size"]:
+        table.add_column(column)
+    for template in templates:
+        manifest = template.manifest
+        table.add_row(template.name, manifest.environment_name,
+                      manifest.weo_config.get("general", {}).get("base_image", ""), manifest.user or "",
+                      time.strftime("%Y-%m-%d %H:%M", time.localtime(manifest.created)),
+                      _format_bytes(manifest.size))
+    Console().print(table)
+
+
+@template.command(name="remove", help="Removes a template, environments cloned from it are kept")
+@click.option("-t", "--template-name", required=True,
+              help="The name of the template that will be removed")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+def template_remove(template_name, verbose):
+    orchestrator = _get_orchestrator(verbose)
+    try:
+        orchestrator.templates.remove(template_name)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--template-name")
+    except TemplateNotFoundError:
+        click.secho(f"Template {template_name} does not exist. Skipping...", fg="yellow")
+        return
+    except OSError as e:
+        click.secho(f"{e}", fg="red")
+        sys.exit(ExitCodes.TEMPLATE_FAILURE.value)
+    click.secho(f"Removed template {template_name}", fg="blue")
+
+
+@cli.command(help="Runs a resident service which keeps the orchestrator and its docker daemon warm for other "
+                  "WEO commands")
+@click.option("-w", "--workers",
+              type=click.IntRange(min=1),
+              default=2,
+              show_default=True,
+              help="The maximum number of requests processed concurrently.")
+@click.option("--status",
+              is_flag=True,
+              required=False,
+              help="Show the state of the running service.")
+@click.option("--stop",
+              is_flag=True,
+              required=False,
+              help="Stop the running service once its running requests are finished.")
+@click.option("-v", "--verbose",
+              is_flag=True,
+              required=False,
+              help="Print verbose log outputs.")
+def serve(workers, status, stop, verbose):
+    from service.service_client import ServiceClient
+    from service.weo_service import WeoService
+
+    service = ServiceClient.connect()
+    if status or stop:
+        if not service:
+            click.secho("No WEO service is running", fg="yellow")
+            sys.exit(ExitCodes.SERVICE_FAILURE.value)
+        try:
+            if stop:
+                service.stop()
+                click.secho(f"Stopping WEO service (pid {service.pid})", fg="blue")
+                return
+            service_status = service.status()
+        except ServiceError as e:
+            click.secho(f"{e}", fg="red")
+            sys.exit(ExitCodes.SERVICE_FAILURE.value)
+        click.secho(f"PID:        {service_status['pid']}", fg="blue")
+        click.secho(f"Version:    {service_status['version']}", fg="blue")
+        click.secho(f"Uptime:     {service_status['uptime']:.0f}s", fg="blue")
+        click.secho(f"Requests:   {service_status['handled']} handled, {service_status['active']} running, "
+                    f"{service_status['workers']} worker(s)", fg="blue")
+        click.secho(f"Dockerd:    started {service_status['docker_daemon_starts']} time(s)", fg="blue")
+        return
+    if service:
+        service.close()
+        click.secho(f"A WEO service is already running (pid {service.pid})", fg="red")
+        sys.exit(ExitCodes.SERVICE_FAILURE.value)
+
+    orchestrator = _get_orchestrator(verbose)
+    weo_service = WeoService(orchestrator, workers,
+                             log=lambda message: click.secho(f"[{time.strftime('%H:%M:%S')}] {message}", fg="blue"))
+    click.secho(f"WEO service running with {workers} worker(s), press Ctrl+C to stop it", fg="blue")
+    try:
+        weo_service.serve()
+    except KeyboardInterrupt:
+        pass
+    except (OrchestratorError, OSError) as e:
+        click.secho(f"{e}", fg="red")
+        sys.exit(ExitCodes.SERVICE_FAILURE.value)
+    click.secho("WEO service stopped", fg="blue")
 
 
 # ToDo: Implement
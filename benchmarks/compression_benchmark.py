@@ -0,0 +1,110 @@
+import os
+import random
+import shutil
+import subprocess
+import tarfile
+import time
+from tempfile import TemporaryDirectory
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+from orchestrator.rootfs_compression import Compression, CompressionSettings
+
+
+def _create_synthetic_rootfs(root: str, size_mb: int) -> int:
+    rng = random.Random(42)
+    words = [b"lib", b"usr", b"share", b"config", b"python", b"error", b"return", b"value", b"docker", b"0x00"]
+    target_size = size_mb * 1024 * 1024
+    total_size = 0
+    index = 0
+    while total_size < target_size:
+        directory = os.path.join(root, "usr", "lib", f"pkg{index // 200}")
+        os.makedirs(directory, exist_ok=True)
+        kind = index % 10
+        if kind < 6:
+            # Text like content such as scripts, configs and docs
+            content = b" ".join(rng.choice(words) for _ in range(rng.randint(50, 4000)))
+        elif kind < 9:
+            # Binaries compress moderately
+            content = bytes(rng.getrandbits(4) for _ in range(rng.randint(1000, 60000)))
+        else:
+            # Already compressed assets
+            content = rng.randbytes(rng.randint(10000, 200000))
+        with open(os.path.join(directory, f"file{index}"), "wb") as file:
+            file.write(content)
+        total_size += len(content)
+        index += 1
+    return total_size
+
+
+def _bench_in_process(source_dir: str, target_file: str, settings: CompressionSettings) -> float:
+    start = time.perf_counter()
+    with open(target_file, "wb") as file, settings.open_writer(file) as writer:
+        with tarfile.open(fileobj=writer, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+            tar.add(source_dir, arcname=".")
+    return time.perf_counter() - start
+
+
+def _bench_shell(source_dir: str, target_file: str, settings: CompressionSettings) -> float:
+    compressor = settings.shell_command()
+    command = f"tar -cf - -C '{source_dir}' ."
+    if compressor:
+        command += f" | {compressor}"
+    start = time.perf_counter()
+    with open(target_file, "wb") as file:
+        subprocess.run(command, shell=True, check=True, stdout=file)
+    return time.perf_counter() - start
+
+
+def _shell_available(settings: CompressionSettings) -> bool:
+    compressor = settings.shell_command()
+    return shutil.which("tar") is not None and (not compressor or shutil.which(compressor.split()[0]) is not None)
+
+
+@click.command(help="Compares wall time and artifact size of the rootfs compression codecs")
+@click.option("--size-mb", default=128, show_default=True, help="Size of the synthetic rootfs")
+@click.option("--threads", default=0, show_default=True, help="Threads of the multi-threaded variants, 0 uses all cores")
+@click.option("--shell/--no-shell", default=True, show_default=True,
+              help="Also benchmark the orchestrator side shell compressors found on this host")
+def main(size_mb, threads, shell):
+    console = Console()
+    variants = [
+        CompressionSettings(Compression.NONE),
+        CompressionSettings(Compression.GZIP, 1),
+        CompressionSettings(Compression.GZIP),
+        CompressionSettings(Compression.GZIP, None, threads),
+        CompressionSettings(Compression.BZIP2),
+        CompressionSettings(Compression.BZIP2, None, threads),
+        CompressionSettings(Compression.ZSTD, None, 1),
+        CompressionSettings(Compression.ZSTD, None, threads),
+    ]
+    with TemporaryDirectory() as temp_dir:
+        source_dir = os.path.join(temp_dir, "rootfs")
+        with console.status("Creating synthetic rootfs..."):
+            raw_size = _create_synthetic_rootfs(source_dir, size_mb)
+
+        table = Table(title=f"Rootfs compression ({raw_size / 1024 / 1024:.1f} MiB synthetic rootfs)")
+        for column in ["Codec", "Mode", "Wall time [s]", "Size [MiB]", "Ratio", "Throughput [MiB/s]"]:
+            table.add_column(column)
+
+        for settings in variants:
+            runs = []
+            if settings.streamable:
+                runs.append(("in-process", _bench_in_process))
+            if shell and _shell_available(settings):
+                runs.append(("shell", _bench_shell))
+            for mode, bench in runs:
+                target_file = os.path.join(temp_dir, settings.file_name("rootfs"))
+                with console.status(f"Compressing with {settings} ({mode})..."):
+                    duration = bench(source_dir, target_file, settings)
+                size = os.path.getsize(target_file)
+                os.remove(target_file)
+                table.add_row(str(settings), mode, f"{duration:.2f}", f"{size / 1024 / 1024:.1f}",
+                              f"{size / raw_size:.3f}", f"{raw_size / 1024 / 1024 / duration:.1f}")
+        console.print(table)
+
+
+if __name__ == '__main__':
+    main()
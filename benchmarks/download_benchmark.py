@@ -0,0 +1,251 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+from typing import Callable
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+from exceptions.DownloadError import DownloadError
+from orchestrator.download_cache import DownloadCache
+
+
+FILE_NAME = "alpine-minirootfs.tar.gz"
+
+
+class ServedRequest:
+    def __init__(self, path: str, range_header: str | None, status: int, sent: int):
+        self.path = path
+        self.range_header = range_header
+        self.status = status
+        self.sent = sent
+
+
+class FileServer:
+    # Stand-in for the download server of the orchestrator image, which can misbehave like real servers do
+    def __init__(self, content: bytes):
+        self.content = content
+        self.sha256 = hashlib.sha256(content).hexdigest()
+        # Number of responses which are cut off after half of their body
+        self.interruptions = 0
+        self.ignore_range = False
+        self.status: int | None = None
+        self.requests: list[ServedRequest] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/{FILE_NAME}"
+
+    def reset(self) -> None:
+        self.interruptions = 0
+        self.ignore_range = False
+        self.status = None
+        self.requests = []
+
+    def __enter__(self) -> "FileServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                range_header = self.headers.get("Range")
+                if server.status is not None:
+                    self._respond(server.status, b"", range_header)
+                elif self.path.endswith(".sha256"):
+                    self._respond(200, f"{server.sha256}  {FILE_NAME}\n".encode("utf-8"), range_header)
+                elif range_header and not server.ignore_range:
+                    offset = int(range_header[len("bytes="):].rstrip("-"))
+                    if offset >= len(server.content):
+                        self._respond(416, b"", range_header)
+                    else:
+                        self._respond(206, server.content[offset:], range_header,
+                                      {"Content-Range": f"bytes {offset}-{len(server.content) - 1}/"
+                                                        f"{len(server.content)}"})
+                else:
+                    self._respond(200, server.content, range_header)
+
+            def _respond(self, status: int, body: bytes, range_header: str | None,
+                         headers: dict[str, str] | None = None) -> None:
+                with server._lock:
+                    interrupted = bool(body) and server.interruptions > 0 and not self.path.endswith(".sha256")
+                    if interrupted:
+                        server.interruptions -= 1
+                    # An interrupted response announces the whole body but the connection drops halfway
+                    sent = body[:len(body) // 2] if interrupted else body
+                    # Requests are recorded before they are answered, the client may be done right after
+                    server.requests.append(ServedRequest(self.path, range_header, status, len(sent)))
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(sent)
+                self.wfile.flush()
+                if interrupted:
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class ScenarioResult:
+    def __init__(self, name: str, duration: float, requests: list[ServedRequest], failure: str | None):
+        self.name = name
+        self.duration = duration
+        self.requests = requests
+        self.failure = failure
+
+
+def _expect_download(server: FileServer, path: str) -> str | None:
+    with open(path, "rb") as file:
+        if file.read() != server.content:
+            return "The downloaded file differs from the served one"
+    if os.path.exists(path + ".part"):
+        return "The partial file was left behind"
+    return None
+
+
+def _expect_error(action: Callable[[], str], message: str) -> str | None:
+    try:
+        action()
+    except DownloadError as e:
+        if message not in str(e):
+            return f"Unexpected error: {e}"
+        return None
+    return "The download did not fail"
+
+
+def _scenarios(server: FileServer) -> dict[str, Callable[[str], str | None]]:
+    content_size = len(server.content)
+
+    def plain(cache_dir: str):
+        path = DownloadCache(cache_dir).fetch(server.url)
+        if [request.path.endswith(".sha256") for request in server.requests] != [True, False]:
+            return "Expected one checksum and one file request"
+        return _expect_download(server, path)
+
+    def cached(cache_dir: str):
+        path = DownloadCache(cache_dir).fetch(server.url)
+        if server.requests:
+            return "A cached file was downloaded again"
+        return _expect_download(server, path)
+
+    def resumed(cache_dir: str):
+        server.interruptions = 1
+        path = DownloadCache(cache_dir).fetch(server.url, server.sha256)
+        ranges = [request.range_header for request in server.requests]
+        if ranges != [None, f"bytes={content_size // 2}-"]:
+            return f"Expected a resumed second request, got ranges {ranges}"
+        if sum(request.sent for request in server.requests) != content_size:
+            return "Bytes were transferred twice"
+        return _expect_download(server, path)
+
+    def range_ignored(cache_dir: str):
+        server.interruptions = 1
+        server.ignore_range = True
+        path = DownloadCache(cache_dir).fetch(server.url, server.sha256)
+        if [request.status for request in server.requests] != [200, 200]:
+            return "Expected two complete responses"
+        return _expect_download(server, path)
+
+    def already_complete(cache_dir: str):
+        # A partial file which is already complete is answered with 416 on resume
+        target_dir = os.path.join(cache_dir, server.sha256)
+        os.makedirs(target_dir, exist_ok=True)
+        with open(os.path.join(target_dir, FILE_NAME + ".part"), "wb") as file:
+            file.write(server.content)
+        path = DownloadCache(cache_dir).fetch(server.url, server.sha256)
+        if [request.status for request in server.requests] != [416]:
+            return "Expected a single 416 response"
+        return _expect_download(server, path)
+
+    def retries_exhausted(cache_dir: str):
+        server.status = 503
+        failure = _expect_error(lambda: DownloadCache(cache_dir).fetch(server.url, server.sha256),
+                                "could not be downloaded")
+        if not failure and len(server.requests) != DownloadCache.RETRIES:
+            return f"Expected {DownloadCache.RETRIES} attempts, got {len(server.requests)}"
+        return failure
+
+    def not_found(cache_dir: str):
+        server.status = 404
+        failure = _expect_error(lambda: DownloadCache(cache_dir).fetch(server.url, server.sha256), "HTTP 404")
+        if not failure and len(server.requests) != 1:
+            return "A client error was retried"
+        return failure
+
+    def checksum_mismatch(cache_dir: str):
+        sha256 = hashlib.sha256(b"other").hexdigest()
+        failure = _expect_error(lambda: DownloadCache(cache_dir).fetch(server.url, sha256), "Checksum mismatch")
+        if not failure and os.path.exists(os.path.join(cache_dir, sha256, FILE_NAME + ".part")):
+            return "The mismatching file was kept"
+        return failure
+
+    def offline(cache_dir: str):
+        return _expect_error(lambda: DownloadCache(cache_dir, offline=True).fetch(server.url + "?offline"),
+                             "downloads are disabled")
+
+    return {
+        "download": plain,
+        "cached": cached,
+        "resume after interruption": resumed,
+        "server ignores range": range_ignored,
+        "partial file complete (416)": already_complete,
+        "retries exhausted (503)": retries_exhausted,
+        "client error (404)": not_found,
+        "checksum mismatch": checksum_mismatch,
+        "offline without cache": offline,
+    }
+
+
+@click.command(help="Runs the download cache against a local HTTP server which interrupts responses, ignores "
+                    "ranges and fails, and checks resume, retries and checksum verification")
+@click.option("--size-mb", default=8, show_default=True, help="Size of the served file")
+def main(size_mb):
+    console = Console()
+    results = []
+    with TemporaryDirectory(prefix="weo-download-") as temp_dir, \
+            FileServer(os.urandom(size_mb * 1024 * 1024)) as server:
+        cache_dir = temp_dir
+        for name, scenario in _scenarios(server).items():
+            # Every scenario starts with an empty cache, except the one checking the cache of the previous download
+            if name != "cached":
+                cache_dir = os.path.join(temp_dir, str(len(results)))
+            server.reset()
+            start = time.perf_counter()
+            try:
+                failure = scenario(cache_dir)
+            except Exception as e:
+                failure = f"{type(e).__name__}: {e}"
+            results.append(ScenarioResult(name, time.perf_counter() - start, server.requests, failure))
+
+    table = Table(title="Download cache")
+    for column in ["Scenario", "Wall [ms]", "Requests", "Served [KiB]", "Result"]:
+        table.add_column(column)
+    for result in results:
+        table.add_row(result.name, f"{result.duration * 1000:.0f}", str(len(result.requests)),
+                      f"{sum(request.sent for request in result.requests) / 1024:.1f}",
+                      f"[red]{result.failure}" if result.failure else "[green]ok")
+    console.print(table)
+    if any(result.failure for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
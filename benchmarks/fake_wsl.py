@@ -0,0 +1,743 @@
+import bz2
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import re
+import secrets
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Stand-ins for wsl.exe and the tools of the orchestrator instance which run on any Linux host.
+# Every instance is a directory of the sandbox, absolute paths in the commands run within an
+# instance are redirected into that directory. The tools are executed as
+# "python fake_wsl.py <tool> <arguments>" by small wrapper scripts created by FakeWslSandbox.
+
+SANDBOX_ENV = "WEO_FAKE_SANDBOX"
+ROOT_ENV = "WEO_FAKE_ROOT"
+_BUFFER_SIZE = 1024 * 1024
+_INSTANCE_DIRECTORIES = ["tmp", "etc", "var", "usr", "home", "root", "opt", "run"]
+# A bare "/" is the root of the instance as well, e.g. in "cd /" or "tar -C /"
+_PATH_PATTERN = re.compile(r"(?<![\w.~$}/-])/(?:(?:" + "|".join(_INSTANCE_DIRECTORIES) + r")(?=[/\s'\";|&)<>]|$)"
+                           r"|(?=[\s'\";&)<>]|$))")
+_DOCKER_VERSION = "24.0.9-fake"
+_ALPINE_IMAGE_NAME = "alpine-minirootfs-3.20.3-x86_64.tar.gz"
+_PASSWD = "root:x:0:0:root:/root:/bin/sh\nweo:x:1000:1000:weo:/home/weo:/bin/sh\n"
+_SHADOW = "root:*:19000:0:99999:7:::\nweo:!:19000:0:99999:7:::\n"
+
+
+class SandboxStatistics:
+    def __init__(self, records: list[dict]):
+        self.wsl_spawns = sum(1 for record in records if record["tool"] == "wsl")
+        self.docker_calls = sum(1 for record in records if record["tool"] == "docker")
+        self.bytes_to_instance = sum(record.get("in", 0) for record in records if record["tool"] == "wsl")
+        self.bytes_from_instance = sum(record.get("out", 0) + record.get("err", 0)
+                                       for record in records if record["tool"] == "wsl")
+
+
+class FakeWslSandbox:
+    def __init__(self, root: str, wsl_latency_ms: float = 0, docker_latency_ms: float = 0,
+                 dockerd_startup_ms: float = 0, build_step_ms: float = 0):
+        self._root = os.path.abspath(root)
+        self._settings = {
+            "wsl_latency_ms": wsl_latency_ms,
+            "docker_latency_ms": docker_latency_ms,
+            "dockerd_startup_ms": dockerd_startup_ms,
+            "build_step_ms": build_step_ms,
+            "shell": shutil.which("bash") or "/bin/sh",
+            "python": sys.executable,
+        }
+        self._saved_environment: dict[str, str | None] = {}
+        self._saved_tempdir = None
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    @property
+    def home(self) -> str:
+        return os.path.join(self._root, "home")
+
+    @property
+    def host_tmp(self) -> str:
+        return os.path.join(self._root, "host-tmp")
+
+    @property
+    def download_cache(self) -> str:
+        return os.path.join(self._root, "downloads")
+
+    @property
+    def spawn_log(self) -> str:
+        return os.path.join(self._root, "spawns.log")
+
+    def __enter__(self):
+        if os.name != "posix":
+            raise RuntimeError("The fake wsl.exe only runs on posix hosts")
+        for directory in ["bin", "instance-bin", "home", "host-tmp", "downloads", "registry"]:
+            os.makedirs(os.path.join(self._root, directory), exist_ok=True)
+        with open(os.path.join(self._root, "settings.json"), "w", encoding="utf-8") as file:
+            json.dump(self._settings, file)
+        self._write_tool(os.path.join(self._root, "bin", "wsl.exe"), "wsl")
+        for tool in ["mkpasswd", "apk"]:
+            self._write_tool(os.path.join(self._root, "instance-bin", tool), tool)
+        self._seed_alpine_image()
+
+        import tempfile
+        environment = {
+            SANDBOX_ENV: self._root,
+            "PATH": os.path.join(self._root, "bin") + os.pathsep + os.environ.get("PATH", ""),
+            "HOME": self.home,
+            "TMPDIR": self.host_tmp,
+            "WEO_OFFLINE": "1",
+            "WEO_DOWNLOAD_CACHE": self.download_cache,
+        }
+        for name, value in environment.items():
+            self._saved_environment[name] = os.environ.get(name)
+            os.environ[name] = value
+        # Host side temporary files must be below the sandbox, paths within it are never redirected
+        self._saved_tempdir = tempfile.tempdir
+        tempfile.tempdir = self.host_tmp
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        import tempfile
+        tempfile.tempdir = self._saved_tempdir
+        for name, value in self._saved_environment.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        # Docker daemons which were left running are stopped, otherwise they outlive the sandbox
+        for pid_file in _find_files(self._root, "docker.pid"):
+            try:
+                with open(pid_file, "r", encoding="utf-8") as file:
+                    os.kill(int(file.read().strip()), signal.SIGTERM)
+            except (OSError, ValueError):
+                pass
+
+    def set_base_image(self, source_dir: str) -> int:
+        # Every image pulled by the fake docker has this root filesystem
+        for name, content in [("etc/passwd", _PASSWD), ("etc/shadow", _SHADOW)]:
+            path = os.path.join(source_dir, name)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as file:
+                    file.write(content)
+        os.makedirs(os.path.join(source_dir, "home", "weo"), exist_ok=True)
+        image_path = os.path.join(self._root, "registry", "base.tar")
+        with tarfile.open(image_path, "w", format=tarfile.PAX_FORMAT) as tar:
+            tar.add(source_dir, arcname=".")
+        return os.path.getsize(image_path)
+
+    def records(self) -> list[dict]:
+        if not os.path.exists(self.spawn_log):
+            return []
+        with open(self.spawn_log, "r", encoding="utf-8") as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    @contextmanager
+    def measure(self):
+        start_index = len(self.records())
+        result = {}
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            result["duration"] = time.perf_counter() - start
+            result["statistics"] = SandboxStatistics(self.records()[start_index:])
+
+    def _write_tool(self, path: str, tool: str) -> None:
+        _write_tool(path, self._settings["python"], tool)
+
+    def _seed_alpine_image(self) -> None:
+        image_path = os.path.join(self.download_cache, _ALPINE_IMAGE_NAME)
+        with tarfile.open(image_path, "w:gz", format=tarfile.PAX_FORMAT) as tar:
+            for directory in ["bin", "etc", "home", "root", "tmp", "usr/bin", "var/lib", "var/log", "var/run"]:
+                member = tarfile.TarInfo(directory)
+                member.type = tarfile.DIRTYPE
+                member.mode = 0o755
+                tar.addfile(member)
+            for name, content in [("etc/passwd", _PASSWD), ("etc/shadow", _SHADOW),
+                                  ("etc/alpine-release", "3.20.3\n")]:
+                data = content.encode("utf-8")
+                member = tarfile.TarInfo(name)
+                member.size = len(data)
+                member.mode = 0o644
+                tar.addfile(member, _BytesReader(data))
+        with open(image_path + ".sha256", "w", encoding="utf-8") as file:
+            file.write(f"{_file_hash(image_path)}  {_ALPINE_IMAGE_NAME}\n")
+
+
+class _BytesReader:
+    def __init__(self, data: bytes):
+        self._data = data
+        self._offset = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = len(self._data) - self._offset
+        chunk = self._data[self._offset:self._offset + size]
+        self._offset += len(chunk)
+        return chunk
+
+
+class _CountingReader:
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._stream.read(size)
+        self.bytes += len(chunk)
+        return chunk
+
+
+class _PrefixedReader:
+    def __init__(self, prefix: bytes, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._prefix:
+            return self._stream.read(size)
+        if size < 0:
+            chunk, self._prefix = self._prefix + self._stream.read(), b""
+            return chunk
+        chunk, self._prefix = self._prefix[:size], self._prefix[size:]
+        return chunk
+
+
+class _CountingWriter:
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self._stream.write(data)
+        self.bytes += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        self._stream.flush()
+
+
+class _Pump(threading.Thread):
+    def __init__(self, source, target, transform=None, close_target: bool = False):
+        super().__init__(daemon=True)
+        self._source = source
+        self._target = target
+        self._transform = transform
+        self._close_target = close_target
+        self.bytes = 0
+
+    def run(self) -> None:
+        try:
+            if self._transform:
+                # Session scripts are rewritten line by line, every line is forwarded immediately
+                for line in iter(self._source.readline, b""):
+                    self.bytes += len(line)
+                    self._target.write(self._transform(line))
+                    self._target.flush()
+            else:
+                while chunk := self._source.read1(_BUFFER_SIZE):
+                    self.bytes += len(chunk)
+                    self._target.write(chunk)
+                    self._target.flush()
+        except (BrokenPipeError, ValueError):
+            pass
+        finally:
+            if self._close_target:
+                try:
+                    self._target.close()
+                except BrokenPipeError:
+                    pass
+
+
+def rewrite_paths(command: str, root: str, sandbox: str) -> str:
+    def replace(match: re.Match) -> str:
+        if command.startswith(sandbox, match.start()):
+            return match.group(0)
+        return root + match.group(0)
+
+    return _PATH_PATTERN.sub(replace, command)
+
+
+def _decompressed(stream):
+    # Like wsl.exe, concatenated streams of parallel compressors are accepted, which tarfile does not support
+    magic = stream.read(3)
+    source = _PrefixedReader(magic, stream)
+    if magic[:2] == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj=source, mode="rb")
+    if magic == b"BZh":
+        return bz2.BZ2File(source, "rb")
+    return source
+
+
+def _write_tool(path: str, python: str, tool: str) -> None:
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(f"#!/bin/sh\nexec '{python}' '{os.path.abspath(__file__)}' {tool} \"$@\"\n")
+    os.chmod(path, 0o755)
+
+
+def _find_files(root: str, name: str) -> list[str]:
+    return [os.path.join(directory, name) for directory, _, file_names in os.walk(root) if name in file_names]
+
+
+def _file_hash(path: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(_BUFFER_SIZE):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _sandbox() -> str:
+    return os.environ[SANDBOX_ENV]
+
+
+def _settings() -> dict:
+    with open(os.path.join(_sandbox(), "settings.json"), "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _sleep(milliseconds: float) -> None:
+    if milliseconds > 0:
+        time.sleep(milliseconds / 1000)
+
+
+def _log(record: dict) -> None:
+    # Lines are appended with a single write, so concurrent tools do not interleave
+    line = (json.dumps(record) + "\n").encode("utf-8")
+    file_descriptor = os.open(os.path.join(_sandbox(), "spawns.log"), os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try:
+        os.write(file_descriptor, line)
+    finally:
+        os.close(file_descriptor)
+
+
+@contextmanager
+def _locked(path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _registry_path() -> str:
+    return os.path.join(_sandbox(), "registry.json")
+
+
+def _read_registry() -> dict[str, str]:
+    try:
+        with open(_registry_path(), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_registry(registry: dict[str, str]) -> None:
+    with open(_registry_path(), "w", encoding="utf-8") as file:
+        json.dump(registry, file)
+
+
+def _instance_root(name: str) -> str | None:
+    for instance_name, storage_dir in _read_registry().items():
+        if instance_name.lower() == name.lower():
+            return os.path.join(storage_dir, "rootfs")
+    return None
+
+
+def _exit(returncode: int, record: dict) -> None:
+    sys.stdout.flush()
+    sys.stderr.flush()
+    _log(record)
+    # Pumps may still be blocked on reading the inherited stdin, they must not delay the exit
+    os._exit(returncode)
+
+
+def _wsl(arguments: list[str]) -> None:
+    settings = _settings()
+    _sleep(settings["wsl_latency_ms"])
+    record = {"tool": "wsl", "arguments": arguments[:2]}
+    match arguments:
+        case ["--list", "--verbose"]:
+            lines = ["  NAME                   STATE           VERSION"]
+            lines += [f"  {name:<22} Stopped         2" for name in sorted(_read_registry())]
+            output = ("\n".join(lines) + "\n").encode("utf-8")
+            if os.environ.get("WSL_UTF8") != "1":
+                output = "\n".join(lines).encode("utf-16-le")
+            sys.stdout.buffer.write(output)
+            record["out"] = len(output)
+            _exit(0, record)
+        case ["--import", name, storage_dir, source]:
+            with _locked(_registry_path() + ".lock"):
+                if _instance_root(name):
+                    sys.stderr.write("A distribution with the supplied name already exists.\n")
+                    _exit(1, record)
+            root = os.path.join(storage_dir, "rootfs")
+            os.makedirs(root, exist_ok=True)
+            reader = _CountingReader(sys.stdin.buffer if source == "-" else open(source, "rb"))
+            try:
+                with tarfile.open(fileobj=_decompressed(reader), mode="r|") as tar:
+                    # Root filesystems contain absolute links, which the default filter of newer versions rejects
+                    if hasattr(tarfile, "fully_trusted_filter"):
+                        tar.extraction_filter = tarfile.fully_trusted_filter
+                    tar.extractall(root, numeric_owner=True)
+            except (tarfile.TarError, OSError, EOFError) as e:
+                shutil.rmtree(storage_dir, ignore_errors=True)
+                sys.stderr.write(f"The import failed: {e}\n")
+                _exit(1, {**record, "in": reader.bytes})
+            with _locked(_registry_path() + ".lock"):
+                registry = _read_registry()
+                registry[name] = storage_dir
+                _write_registry(registry)
+            _exit(0, {**record, "in": reader.bytes})
+        case ["--export", name, target]:
+            root = _instance_root(name)
+            if not root:
+                sys.stderr.write("There is no distribution with the supplied name.\n")
+                _exit(1, record)
+            writer = _CountingWriter(sys.stdout.buffer if target == "-" else open(target, "wb"))
+            with tarfile.open(fileobj=writer, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                tar.add(root, arcname=".")
+            writer.flush()
+            _exit(0, {**record, "out": writer.bytes})
+        case ["--terminate", name]:
+            # Instances of the stand-in have no processes which outlive a call
+            if not _instance_root(name):
+                sys.stderr.write("There is no distribution with the supplied name.\n")
+                _exit(1, record)
+            _exit(0, record)
+        case ["--unregister", name]:
+            with _locked(_registry_path() + ".lock"):
+                registry = _read_registry()
+                instance_name = next((key for key in registry if key.lower() == name.lower()), None)
+                if instance_name is None:
+                    sys.stderr.write("There is no distribution with the supplied name.\n")
+                    _exit(1, record)
+                shutil.rmtree(registry.pop(instance_name), ignore_errors=True)
+                _write_registry(registry)
+            _exit(0, record)
+        case ["-u", _, "-d", name, "sh", "-c", command]:
+            _run_in_instance(name, ["-c", command], record, settings)
+        case ["-u", _, "-d", name, "sh"]:
+            _run_in_instance(name, [], record, settings)
+    sys.stderr.write(f"Unsupported wsl.exe arguments: {arguments}\n")
+    _exit(2, record)
+
+
+def _run_in_instance(name: str, shell_arguments: list[str], record: dict, settings: dict) -> None:
+    root = _instance_root(name)
+    if not root:
+        sys.stderr.write("There is no distribution with the supplied name.\n")
+        _exit(1, record)
+    sandbox = _sandbox()
+    environment = {
+        **os.environ,
+        ROOT_ENV: root,
+        "HOME": os.path.join(root, "root"),
+        "PATH": os.pathsep.join([os.path.join(root, "usr", "bin"), os.path.join(root, "bin"),
+                                 os.path.join(sandbox, "instance-bin"), os.environ.get("PATH", "")]),
+    }
+    transform = None
+    # The command line is transferred to the instance as well
+    command_bytes = len(shell_arguments[1].encode("utf-8")) if shell_arguments else 0
+    if shell_arguments:
+        shell_arguments = ["-c", rewrite_paths(shell_arguments[1], root, sandbox)]
+    else:
+        transform = lambda line: rewrite_paths(line.decode("utf-8"), root, sandbox).encode("utf-8")
+    process = subprocess.Popen([settings["shell"], *shell_arguments], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, env=environment, cwd=root)
+    stdin_pump = _Pump(sys.stdin.buffer, process.stdin, transform, close_target=True)
+    stdout_pump = _Pump(process.stdout, sys.stdout.buffer)
+    stderr_pump = _Pump(process.stderr, sys.stderr.buffer)
+    for pump in [stdin_pump, stdout_pump, stderr_pump]:
+        pump.start()
+    process.wait()
+    stdout_pump.join()
+    stderr_pump.join()
+    _exit(process.returncode, {**record, "in": command_bytes + stdin_pump.bytes, "out": stdout_pump.bytes,
+                               "err": stderr_pump.bytes})
+
+
+def _mkpasswd(arguments: list[str]) -> None:
+    salt = arguments[arguments.index("-S") + 1] if "-S" in arguments else secrets.token_hex(8)
+    if "-P" in arguments:
+        with os.fdopen(int(arguments[arguments.index("-P") + 1]), encoding="utf-8") as password_file:
+            password = password_file.readline().rstrip("\n")
+    else:
+        password = arguments[-1]
+    print(f"$6${salt[:16]}${hashlib.sha512((salt + password).encode('utf-8')).hexdigest()[:86]}")
+    _exit(0, {"tool": "mkpasswd"})
+
+
+def _apk(arguments: list[str]) -> None:
+    root = os.environ[ROOT_ENV]
+    settings = _settings()
+    packages = [argument for argument in arguments[1:] if not argument.startswith("-")]
+    if not arguments or arguments[0] != "add":
+        _exit(0, {"tool": "apk"})
+    for package in packages:
+        if package == "docker":
+            for tool in ["docker", "dockerd"]:
+                _write_tool(os.path.join(root, "usr", "bin", tool), settings["python"], tool)
+            continue
+        host_tool = shutil.which(package)
+        if not host_tool:
+            sys.stderr.write(f"ERROR: unable to select packages:\n  {package} (no such package)\n")
+            _exit(1, {"tool": "apk"})
+        os.symlink(host_tool, os.path.join(root, "usr", "bin", package))
+    _exit(0, {"tool": "apk"})
+
+
+def _dockerd(arguments: list[str]) -> None:
+    root = os.environ[ROOT_ENV]
+    _sleep(_settings()["dockerd_startup_ms"])
+    run_dir = os.path.join(root, "var", "run")
+    os.makedirs(run_dir, exist_ok=True)
+    pid_file = os.path.join(run_dir, "docker.pid")
+    socket_file = os.path.join(run_dir, "docker.sock")
+    # The socket is bound by its relative name as long sandbox paths exceed the limit of unix sockets
+    os.chdir(run_dir)
+    if os.path.exists(socket_file):
+        os.remove(socket_file)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind("docker.sock")
+    with open(pid_file, "w", encoding="utf-8") as file:
+        file.write(str(os.getpid()))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("API listen on /var/run/docker.sock", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    finally:
+        server.close()
+        for path in [socket_file, pid_file]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class _DockerState:
+    def __init__(self, root: str):
+        self._directory = os.path.join(root, "var", "lib", "docker-fake")
+        self._path = os.path.join(self._directory, "state.json")
+        self.images: dict[str, dict] = {}
+        self.containers: dict[str, str] = {}
+
+    @property
+    def lock_path(self) -> str:
+        return os.path.join(self._directory, "lock")
+
+    def load(self) -> None:
+        if os.path.exists(self._path):
+            with open(self._path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+            self.images = state["images"]
+            self.containers = state["containers"]
+
+    def save(self) -> None:
+        with open(self._path, "w", encoding="utf-8") as file:
+            json.dump({"images": self.images, "containers": self.containers}, file)
+
+    def resolve(self, reference: str) -> str | None:
+        for image_id, image in self.images.items():
+            if reference in [image_id, image_id[len("sha256:"):][:12]] or \
+                    reference in image["tags"] or reference + ":latest" in image["tags"]:
+                return image_id
+        return None
+
+    def tag(self, image_id: str, tag: str) -> None:
+        for image in self.images.values():
+            if tag in image["tags"]:
+                image["tags"].remove(tag)
+        self.images[image_id]["tags"].append(tag)
+
+    def pull(self, name: str) -> str:
+        name = name if ":" in name else name + ":latest"
+        image_id = self.resolve(name)
+        if image_id:
+            return image_id
+        base_image = os.path.join(_sandbox(), "registry", "base.tar")
+        digest = hashlib.sha256(name.encode("utf-8")).hexdigest()
+        image_id = "sha256:" + hashlib.sha256(f"image\0{name}".encode("utf-8")).hexdigest()
+        self.images[image_id] = {
+            "tags": [name],
+            "repo_digests": [f"{name.rsplit(':', 1)[0]}@sha256:{digest}"],
+            "layers": ["sha256:" + hashlib.sha256(f"layer\0{name}".encode("utf-8")).hexdigest()],
+            "size": os.path.getsize(base_image),
+            "user": "",
+            "rootfs": base_image,
+        }
+        return image_id
+
+
+def _docker_render(template: str, image_id: str, image: dict) -> str:
+    values = {
+        ".Id": image_id,
+        ".Size": str(image["size"]),
+        ".Config.User": image["user"],
+        "join .RepoTags \",\"": ",".join(image["tags"]),
+        "join .RootFS.Layers \",\"": ",".join(image["layers"]),
+        "index .RepoDigests 0": image["repo_digests"][0] if image["repo_digests"] else "",
+    }
+    return re.sub(r"\{\{\s*(.*?)\s*}}", lambda match: values.get(match.group(1), ""), template)
+
+
+def _docker_daemon_running(root: str) -> bool:
+    pid_file = os.path.join(root, "var", "run", "docker.pid")
+    try:
+        with open(pid_file, "r", encoding="utf-8") as file:
+            os.kill(int(file.read().strip()), 0)
+    except (OSError, ValueError):
+        return False
+    return os.path.exists(os.path.join(root, "var", "run", "docker.sock"))
+
+
+def _docker(arguments: list[str]) -> None:
+    root = os.environ[ROOT_ENV]
+    settings = _settings()
+    _sleep(settings["docker_latency_ms"])
+    record = {"tool": "docker", "arguments": arguments[:2]}
+    if not _docker_daemon_running(root):
+        sys.stderr.write("Cannot connect to the Docker daemon at unix:///var/run/docker.sock. "
+                         "Is the docker daemon running?\n")
+        _exit(1, record)
+    state = _DockerState(root)
+    with _locked(state.lock_path):
+        state.load()
+        returncode = _docker_command(state, arguments, settings)
+        state.save()
+    _exit(returncode, record)
+
+
+def _docker_command(state: _DockerState, arguments: list[str], settings: dict) -> int:
+    flags = [argument for argument in arguments if argument.startswith("-")]
+    positional = [argument for argument in arguments if not argument.startswith("-")]
+    match positional[:2]:
+        case ["version", *_]:
+            print(_DOCKER_VERSION)
+        case ["pull", name]:
+            print(state.pull(name))
+        case ["build", *_]:
+            tag = arguments[arguments.index("-t") + 1]
+            with open("Dockerfile", "r", encoding="utf-8") as file:
+                instructions = [line.strip() for line in file
+                                if line.strip() and not line.strip().startswith("#")]
+            base_id = None
+            user = None
+            for step, instruction in enumerate(instructions, start=1):
+                print(f"Step {step}/{len(instructions)} : {instruction}", flush=True)
+                keyword, _, value = instruction.partition(" ")
+                match keyword.upper():
+                    case "FROM":
+                        base_id = state.pull(value.split()[0])
+                    case "USER":
+                        user = value.strip()
+                _sleep(settings["build_step_ms"])
+                print(f" ---> {secrets.token_hex(6)}", flush=True)
+            if not base_id:
+                sys.stderr.write("No build stage in current context\n")
+                return 1
+            base = state.images[base_id]
+            layer = "sha256:" + hashlib.sha256("\n".join(instructions).encode("utf-8")).hexdigest()
+            image_id = "sha256:" + hashlib.sha256("\0".join(base["layers"] + [layer]).encode("utf-8")).hexdigest()
+            state.images.setdefault(image_id, {
+                **base, "tags": [], "repo_digests": [], "layers": base["layers"] + [layer],
+                "user": base["user"] if user is None else user})
+            state.tag(image_id, tag)
+            print(f"Successfully built {image_id[len('sha256:'):][:12]}\nSuccessfully tagged {tag}")
+        case ["image", "inspect"]:
+            template = arguments[arguments.index("--format") + 1] if "--format" in arguments else "{{.Id}}"
+            references = [argument for argument in arguments[2:] if argument != "--format" and argument != template]
+            for reference in references:
+                image_id = state.resolve(reference)
+                if not image_id:
+                    sys.stderr.write(f"Error: No such image: {reference}\n")
+                    return 1
+                print(_docker_render(template, image_id, state.images[image_id]))
+        case ["image", "ls"]:
+            for image_id in state.images:
+                print(image_id)
+        case ["image", "rm"] | ["rmi", *_]:
+            for reference in positional[2 if positional[0] == "image" else 1:]:
+                image_id = state.resolve(reference)
+                if not image_id:
+                    sys.stderr.write(f"Error: No such image: {reference}\n")
+                    return 1
+                image = state.images[image_id]
+                if reference in image["tags"] and len(image["tags"]) > 1 and "-f" not in flags:
+                    image["tags"].remove(reference)
+                else:
+                    del state.images[image_id]
+        case ["image", "prune"]:
+            for image_id in [image_id for image_id, image in state.images.items() if not image["tags"]]:
+                del state.images[image_id]
+        case ["container", "prune"]:
+            state.containers.clear()
+        case ["builder", "prune"]:
+            pass
+        case ["system", "df"]:
+            print(f"Images|{sum(image['size'] for image in state.images.values())}B")
+            print("Containers|0B\nLocal Volumes|0B\nBuild Cache|0B")
+        case ["system", "prune"]:
+            state.images.clear()
+            state.containers.clear()
+        case ["create", reference]:
+            image_id = state.resolve(reference)
+            if not image_id:
+                sys.stderr.write(f"Unable to find image '{reference}' locally\n")
+                return 1
+            container_id = secrets.token_hex(32)
+            state.containers[container_id] = image_id
+            print(container_id)
+        case ["export", container_id]:
+            image_id = state.containers.get(container_id)
+            if not image_id:
+                sys.stderr.write(f"Error: No such container: {container_id}\n")
+                return 1
+            with open(state.images[image_id]["rootfs"], "rb") as source:
+                if "-o" in arguments:
+                    with open(arguments[arguments.index("-o") + 1], "wb") as target:
+                        shutil.copyfileobj(source, target, _BUFFER_SIZE)
+                else:
+                    shutil.copyfileobj(source, sys.stdout.buffer, _BUFFER_SIZE)
+        case ["remove", container_id] | ["rm", container_id]:
+            if state.containers.pop(container_id, None) is None:
+                sys.stderr.write(f"Error: No such container: {container_id}\n")
+                return 1
+            print(container_id)
+        case _:
+            sys.stderr.write(f"Unsupported docker arguments: {arguments}\n")
+            return 2
+    return 0
+
+
+def main(tool: str, arguments: list[str]) -> None:
+    match tool:
+        case "wsl":
+            _wsl(arguments)
+        case "docker":
+            _docker(arguments)
+        case "dockerd":
+            _dockerd(arguments)
+        case "mkpasswd":
+            _mkpasswd(arguments)
+        case "apk":
+            _apk(arguments)
+    sys.stderr.write(f"Unknown tool {tool}\n")
+    sys.exit(2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,178 @@
+import json
+import os
+import shutil
+import statistics
+import sys
+from tempfile import TemporaryDirectory, mkdtemp
+from typing import Callable
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.compression_benchmark import _create_synthetic_rootfs
+from benchmarks.fake_wsl import FakeWslSandbox
+from config.config_manager import ConfigManager
+from config.weo_config import WeoConfig
+from config.wsl_config import WslConfig
+from orchestrator.artifact_cache import ArtifactCache
+from orchestrator.orchestrator_factory import OrchestratorFactory
+
+DOCKER_IMAGE = "alpine:3.20"
+ENVIRONMENT_NAME = "weo-benchmark"
+TEMPLATE_NAME = "weo-benchmark-template"
+CONFIG_ROOT = "/tmp/weo-benchmark"
+METRICS = ["wall_ms", "wsl_spawns", "docker_calls", "bytes_to_instance", "bytes_from_instance"]
+
+
+class ScenarioRun:
+    def __init__(self, measurement: dict):
+        sandbox_statistics = measurement["statistics"]
+        self.wall_ms = measurement["duration"] * 1000
+        self.wsl_spawns = sandbox_statistics.wsl_spawns
+        self.docker_calls = sandbox_statistics.docker_calls
+        self.bytes_to_instance = sandbox_statistics.bytes_to_instance
+        self.bytes_from_instance = sandbox_statistics.bytes_from_instance
+
+
+def _run_scenarios(sandbox: FakeWslSandbox, record: Callable[[str, ScenarioRun], None]) -> None:
+    def measure(name: str, action: Callable[[], object]):
+        with sandbox.measure() as measurement:
+            result = action()
+        record(name, ScenarioRun(measurement))
+        return result
+
+    def initialize():
+        factory = OrchestratorFactory(False)
+        factory.initialize()
+        return factory.create_orchestrator()
+
+    orchestrator = measure("factory init", initialize)
+    measure("factory init (stamped)", lambda: OrchestratorFactory(False))
+    factory = measure("factory init (recheck)", lambda: OrchestratorFactory(False, recheck=True))
+
+    wsl_api = factory.wsl_api
+    instance_name = OrchestratorFactory.orchestrator_instance_name()
+    configs = [WeoConfig(wsl_api, instance_name, CONFIG_ROOT + WeoConfig.CONFIG_PATH),
+               WslConfig(wsl_api, instance_name, CONFIG_ROOT + WslConfig.CONFIG_PATH)]
+    measure("config write", lambda: ConfigManager.write_configs(wsl_api, instance_name, configs))
+    measure("config read", lambda: ConfigManager.read_configs(wsl_api, instance_name, configs))
+
+    def create(streaming: bool = False, artifact_cache: ArtifactCache | None = None, fill_artifact_cache: bool = False):
+        orchestrator.create(lambda description: None, DOCKER_IMAGE, ENVIRONMENT_NAME, None, "WEO", None,
+                            streaming, artifact_cache=artifact_cache, fill_artifact_cache=fill_artifact_cache)
+
+    measure("create", create)
+    measure("remove", lambda: orchestrator.remove(ENVIRONMENT_NAME))
+    measure("create --streaming", lambda: create(streaming=True))
+    orchestrator.remove(ENVIRONMENT_NAME)
+
+    # The import through a file on the host is only used by WSL versions which cannot import from stdin
+    orchestrator_config = WeoConfig(wsl_api, instance_name)
+    orchestrator_config.read_config()
+    orchestrator_config.rootfs_import = "staging"
+    ConfigManager.write_configs(wsl_api, instance_name, [orchestrator_config])
+    measure("create (staged rootfs)", create)
+    orchestrator.remove(ENVIRONMENT_NAME)
+    orchestrator_config.rootfs_import = "pipe"
+    ConfigManager.write_configs(wsl_api, instance_name, [orchestrator_config])
+
+    artifact_cache = ArtifactCache(os.path.join(sandbox.root, "artifacts"))
+    create(artifact_cache=artifact_cache, fill_artifact_cache=True)
+    orchestrator.remove(ENVIRONMENT_NAME)
+    measure("create (cached rootfs)", lambda: create(artifact_cache=artifact_cache))
+
+    measure("template add", lambda: orchestrator.add_template(ENVIRONMENT_NAME, TEMPLATE_NAME))
+    orchestrator.remove(ENVIRONMENT_NAME)
+    measure("create --from-template", lambda: orchestrator.create_from_template(
+        lambda description: None, TEMPLATE_NAME, ENVIRONMENT_NAME, "WEO"))
+    orchestrator.remove(ENVIRONMENT_NAME)
+    orchestrator.templates.remove(TEMPLATE_NAME)
+
+
+def _summarize(runs: dict[str, list[ScenarioRun]]) -> dict[str, dict[str, float]]:
+    return {name: {metric: statistics.median(getattr(run, metric) for run in scenario_runs) for metric in METRICS}
+            for name, scenario_runs in runs.items()}
+
+
+def _compare(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]],
+             tolerance: float) -> list[str]:
+    failures = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in METRICS:
+            # Spawns and docker calls are deterministic, every additional one is a regression
+            allowed = baseline[name][metric] * (1 + tolerance / 100) \
+                if metric not in ["wsl_spawns", "docker_calls"] else baseline[name][metric]
+            if result[metric] > allowed:
+                failures.append(f"{name}: {metric} is {result[metric]:.0f}, baseline is {baseline[name][metric]:.0f}")
+    return failures
+
+
+@click.command(help="Runs the orchestration path against a fake wsl.exe and docker and reports wall time, "
+                    "subprocess spawns and transferred bytes per scenario")
+@click.option("--runs", default=3, show_default=True, help="Number of runs, each in a fresh sandbox")
+@click.option("--image-size-mb", default=16, show_default=True, help="Size of the synthetic docker image")
+@click.option("--wsl-latency-ms", default=0.0, show_default=True, help="Latency added to every wsl.exe call")
+@click.option("--docker-latency-ms", default=0.0, show_default=True, help="Latency added to every docker call")
+@click.option("--dockerd-startup-ms", default=0.0, show_default=True,
+              help="Time until the fake docker daemon accepts requests")
+@click.option("--build-step-ms", default=0.0, show_default=True, help="Duration of every docker build step")
+@click.option("--output", type=click.Path(dir_okay=False, writable=True),
+              help="Write the median results as json, e.g. to use them as baseline later")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False),
+              help="Fail if a scenario needs more spawns or docker calls than this result file, "
+                   "or exceeds its time and bytes by more than the tolerance")
+@click.option("--tolerance", default=25.0, show_default=True,
+              help="Allowed increase of wall time and bytes over the baseline in percent")
+@click.option("--keep-sandbox", is_flag=True, help="Keep the sandbox directories for inspection")
+def main(runs, image_size_mb, wsl_latency_ms, docker_latency_ms, dockerd_startup_ms, build_step_ms, output,
+         baseline, tolerance, keep_sandbox):
+    if os.name != "posix":
+        raise click.ClickException("The orchestration benchmark needs a posix host")
+    console = Console()
+    scenario_runs: dict[str, list[ScenarioRun]] = {}
+    with TemporaryDirectory(prefix="weo-image-") as image_dir:
+        with console.status("Creating synthetic docker image..."):
+            image_size = _create_synthetic_rootfs(image_dir, image_size_mb)
+        for run in range(1, runs + 1):
+            sandbox_dir = mkdtemp(prefix="weo-bench-")
+            with console.status(f"Run {run}/{runs} in {sandbox_dir}..."):
+                with FakeWslSandbox(sandbox_dir, wsl_latency_ms, docker_latency_ms, dockerd_startup_ms,
+                                    build_step_ms) as sandbox:
+                    sandbox.set_base_image(image_dir)
+                    _run_scenarios(sandbox, lambda name, result: scenario_runs.setdefault(name, []).append(result))
+            if keep_sandbox:
+                console.print(f"Kept sandbox {sandbox_dir}")
+            else:
+                shutil.rmtree(sandbox_dir, ignore_errors=True)
+
+    results = _summarize(scenario_runs)
+    table = Table(title=f"Orchestration (median of {runs} runs, {image_size / 1024 / 1024:.1f} MiB image, "
+                        f"{wsl_latency_ms:.0f} ms wsl.exe latency)")
+    for column in ["Scenario", "Wall [ms]", "wsl.exe spawns", "docker calls", "To instance [KiB]",
+                   "From instance [KiB]"]:
+        table.add_column(column)
+    for name, result in results.items():
+        table.add_row(name, f"{result['wall_ms']:.0f}", f"{result['wsl_spawns']:.0f}",
+                      f"{result['docker_calls']:.0f}", f"{result['bytes_to_instance'] / 1024:.1f}",
+                      f"{result['bytes_from_instance'] / 1024:.1f}")
+    console.print(table)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump({"image_size_mb": image_size_mb, "wsl_latency_ms": wsl_latency_ms, "scenarios": results},
+                      file, indent=2)
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as file:
+            failures = _compare(results, json.load(file)["scenarios"], tolerance)
+        for failure in failures:
+            console.print(f"[red]{failure}")
+        if failures:
+            sys.exit(1)
+        console.print("[green]No regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
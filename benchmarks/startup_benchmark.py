@@ -0,0 +1,120 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules which are only needed for the orchestrator download or for progress displays
+DEFERRED_MODULES = ["requests", "urllib3", "rich"]
+_LOADED_MODULES_SCRIPT = "import sys; {statement}; print('\\n'.join(sorted(sys.modules)))"
+
+
+def _run_python(arguments: list[str]) -> subprocess.CompletedProcess:
+    # Every run needs a fresh interpreter, otherwise the modules are already cached
+    return subprocess.run([sys.executable, *arguments], cwd=REPOSITORY_ROOT, capture_output=True, text=True)
+
+
+def _parse_import_times(output: str, module: str) -> tuple[int, list[tuple[str, int]]]:
+    # Lines look like "import time: self [us] | cumulative | <indent>module" and children are listed before
+    # their parent, so the direct imports of a module are the top level children right before it
+    children = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children.append((name.strip(), int(fields[1])))
+        elif depth == 0:
+            if name.strip() == module:
+                return int(fields[1]), children
+            children = []
+    raise click.ClickException(f"No import time of {module} found")
+
+
+def _measure_import(module: str) -> tuple[int, list[tuple[str, int]]]:
+    result = _run_python(["-X", "importtime", "-c", f"import {module}"])
+    if result.returncode != 0:
+        raise click.ClickException(f"Importing {module} failed: {result.stderr.strip().splitlines()[-1]}")
+    return _parse_import_times(result.stderr, module)
+
+
+def _measure_wall_time(statement: str) -> float:
+    start = time.perf_counter()
+    result = _run_python(["-c", statement])
+    duration = time.perf_counter() - start
+    if result.returncode != 0:
+        raise click.ClickException(f"Running '{statement}' failed: {result.stderr.strip()}")
+    return duration
+
+
+def _loaded_modules(statement: str) -> set[str]:
+    return set(_run_python(["-c", _LOADED_MODULES_SCRIPT.format(statement=statement)]).stdout.split())
+
+
+@click.command(help="Measures the cold start of the WEO entry point and fails if it regresses")
+@click.option("--runs", default=5, show_default=True, help="Number of fresh interpreters per measurement")
+@click.option("--threshold-ms", default=150.0, show_default=True,
+              help="Maximum median import time of the WEO module")
+@click.option("--top", default=10, show_default=True, help="Number of slowest direct imports to show")
+def main(runs, threshold_ms, top):
+    console = Console()
+    import_durations = []
+    help_durations = []
+    baseline_durations = []
+    direct_imports = []
+    with console.status("Measuring startup..."):
+        for _ in range(runs):
+            duration, direct_imports = _measure_import("WEO")
+            import_durations.append(duration / 1000)
+            baseline_durations.append(_measure_wall_time("pass"))
+            help_durations.append(_measure_wall_time(
+                "import sys, WEO; sys.argv = ['WEO', '--help']; WEO.cli(standalone_mode=False)"))
+        # Modules loaded by the interpreter itself (site hooks) are not attributed to WEO
+        deferred_loaded = sorted({
+            module.split(".")[0] for module in _loaded_modules("import WEO") - _loaded_modules("pass")
+            if module.split(".")[0] in DEFERRED_MODULES})
+
+    baseline = statistics.median(baseline_durations) * 1000
+    table = Table(title=f"WEO startup (median of {runs} runs)")
+    for column in ["Measurement", "Median [ms]", "Min [ms]"]:
+        table.add_column(column)
+    table.add_row("import WEO", f"{statistics.median(import_durations):.1f}", f"{min(import_durations):.1f}")
+    table.add_row("WEO --help (above interpreter start)",
+                  f"{statistics.median(help_durations) * 1000 - baseline:.1f}",
+                  f"{min(help_durations) * 1000 - baseline:.1f}")
+    table.add_row("Interpreter start", f"{baseline:.1f}", f"{min(baseline_durations) * 1000:.1f}")
+    console.print(table)
+
+    direct_imports = sorted(direct_imports, key=lambda item: item[1], reverse=True)
+    imports_table = Table(title="Slowest direct imports of WEO (last run)")
+    for column in ["Module", "Cumulative [ms]"]:
+        imports_table.add_column(column)
+    for name, cumulative in direct_imports[:top]:
+        imports_table.add_row(name, f"{cumulative / 1000:.1f}")
+    console.print(imports_table)
+
+    failures = []
+    if statistics.median(import_durations) > threshold_ms:
+        failures.append(f"import WEO takes {statistics.median(import_durations):.1f} ms, "
+                        f"threshold is {threshold_ms:.1f} ms")
+    if deferred_loaded:
+        failures.append(f"Deferred modules are loaded on startup: {', '.join(deferred_loaded)}")
+    for failure in failures:
+        console.print(f"[red]{failure}")
+    if failures:
+        sys.exit(1)
+    console.print("[green]Startup within budget")
+
+
+if __name__ == '__main__':
+    main()
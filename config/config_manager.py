@@ -1,40 +1,70 @@
-import os
+import secrets
+import shlex
 from configparser import ConfigParser
-from tempfile import TemporaryDirectory
+from io import StringIO
 
 from exceptions.ConfigNotFoundError import ConfigNotFoundError
+from wsl.command_batch import CommandBatch
 from wsl.wsl_api import WslApi
 
 
 class ConfigManager:
+    _NOT_FOUND_CODE: int = 66
+
     def __init__(self, wsl_api: WslApi, instance_name: str, config_path: str):
         self._wsl_api = wsl_api
         self._instance_name = instance_name
         self._config_path = config_path
         self._config = ConfigParser()
 
+    @property
+    def config_path(self) -> str:
+        return self._config_path
+
+    def render(self) -> str:
+        buffer = StringIO()
+        self._config.write(buffer, space_around_delimiters=False)
+        return buffer.getvalue()
+
+    def to_dict(self) -> dict[str, dict[str, str]]:
+        return {section: dict(self._config.items(section, raw=True)) for section in self._config.sections()}
+
     def read_config(self) -> None:
-        self._config = ConfigParser()
-        with TemporaryDirectory() as temp_dir:
-            temp_config_file_path = os.path.join(temp_dir, "config.conf")
-            if not self._wsl_api.file_exists_in_instance(self._instance_name, self._config_path):
-                raise ConfigNotFoundError()
-            self._wsl_api.run_command_in_instance(
-                self._instance_name,
-                f"cp {self._config_path} {WslApi.linuxify(temp_config_file_path)}"
-            )
-            self._config.read(temp_config_file_path)
+        ConfigManager.read_configs(self._wsl_api, self._instance_name, [self])
 
     def write_config(self) -> None:
-        with TemporaryDirectory() as temp_dir:
-            temp_config_file_path = os.path.join(temp_dir, "config.conf")
-            with open(temp_config_file_path, "x", encoding="utf-8") as file:
-                self._config.write(file, space_around_delimiters=False)
-            self._wsl_api.run_command_in_instance(
-                self._instance_name,
-                f"cp {WslApi.linuxify(temp_config_file_path)} {self._config_path}"
-            )
-            self._wsl_api.run_command_in_instance(
-                self._instance_name,
-                f"chmod 644 {self._config_path} && dos2unix {self._config_path}"
-            )
+        ConfigManager.write_configs(self._wsl_api, self._instance_name, [self])
+
+    def add_write_steps(self, batch: CommandBatch) -> CommandBatch:
+        content = self.render()
+        if not content.endswith("\n"):
+            content += "\n"
+        # The config is passed as quoted here-document, so it is written with LF endings and without expansions
+        delimiter = "__WEO_CONFIG_" + secrets.token_hex(8) + "__"
+        temp_path = shlex.quote(self._config_path + ".weo-tmp")
+        config_path = shlex.quote(self._config_path)
+        return batch.add(
+            f"mkdir -p $(dirname {config_path}) && cat > {temp_path} << '{delimiter}' && "
+            f"chmod 644 {temp_path} && mv -f {temp_path} {config_path}\n{content}{delimiter}")
+
+    @staticmethod
+    def read_configs(wsl_api: WslApi, instance_name: str, configs: list["ConfigManager"]) -> None:
+        batch = CommandBatch(wsl_api, instance_name)
+        for index, config in enumerate(configs):
+            config_path = shlex.quote(config._config_path)
+            batch.add(f"if [ -f {config_path} ]; then cat {config_path}; else exit {ConfigManager._NOT_FOUND_CODE}; fi",
+                      name=f"config_{index}")
+        result = batch.run()
+        if result.failed_step and result.failed_step.returncode == ConfigManager._NOT_FOUND_CODE:
+            raise ConfigNotFoundError()
+        result.check()
+        for index, config in enumerate(configs):
+            config._config = ConfigParser()
+            config._config.read_string(result[f"config_{index}"].stdout, source=config._config_path)
+
+    @staticmethod
+    def write_configs(wsl_api: WslApi, instance_name: str, configs: list["ConfigManager"]) -> None:
+        batch = CommandBatch(wsl_api, instance_name)
+        for config in configs:
+            config.add_write_steps(batch)
+        batch.run().check()
@@ -43,3 +43,87 @@ class WeoConfig(ConfigManager):
         if not value in ["true", "false"]:
             raise ValueError("Invalid value for base_image_local")
         self._config.set("general", "base_image_local", value)
+
+    @property
+    def base_image_digest(self) -> str:
+        return self._config.get("general", "base_image_digest", fallback="none")
+
+    @base_image_digest.setter
+    def base_image_digest(self, value: str):
+        self._config.set("general", "base_image_digest", value)
+
+    @property
+    def template(self) -> str:
+        return self._config.get("general", "template", fallback="none")
+
+    @template.setter
+    def template(self, value: str):
+        self._config.set("general", "template", value)
+
+    @property
+    def compression(self) -> str:
+        return self._config.get("rootfs", "compression", fallback="bzip2")
+
+    @compression.setter
+    def compression(self, value: str):
+        if not value in ["none", "gzip", "bzip2", "zstd"]:
+            raise ValueError("Invalid value for compression")
+        self._set_rootfs_option("compression", value)
+
+    @property
+    def compression_level(self) -> str:
+        return self._config.get("rootfs", "compression_level", fallback="default")
+
+    @compression_level.setter
+    def compression_level(self, value: str):
+        if value != "default" and not value.isdigit():
+            raise ValueError("Invalid value for compression_level")
+        self._set_rootfs_option("compression_level", value)
+
+    @property
+    def compression_threads(self) -> str:
+        return self._config.get("rootfs", "compression_threads", fallback="1")
+
+    @compression_threads.setter
+    def compression_threads(self, value: str):
+        if not value.isdigit():
+            raise ValueError("Invalid value for compression_threads")
+        self._set_rootfs_option("compression_threads", value)
+
+    @property
+    def rootfs_import(self) -> str:
+        return self._config.get("rootfs", "import", fallback="pipe")
+
+    @rootfs_import.setter
+    def rootfs_import(self, value: str):
+        if not value in ["pipe", "staging"]:
+            raise ValueError("Invalid value for rootfs_import")
+        self._set_rootfs_option("import", value)
+
+    @property
+    def docker_cache_budget_mb(self) -> str:
+        return self._config.get("cache", "docker_budget_mb", fallback="20480")
+
+    @docker_cache_budget_mb.setter
+    def docker_cache_budget_mb(self, value: str):
+        if not value.isdigit():
+            raise ValueError("Invalid value for docker_cache_budget_mb")
+        self._set_option("cache", "docker_budget_mb", value)
+
+    @property
+    def artifact_cache_budget_mb(self) -> str:
+        return self._config.get("cache", "artifact_budget_mb", fallback="20480")
+
+    @artifact_cache_budget_mb.setter
+    def artifact_cache_budget_mb(self, value: str):
+        if not value.isdigit():
+            raise ValueError("Invalid value for artifact_cache_budget_mb")
+        self._set_option("cache", "artifact_budget_mb", value)
+
+    def _set_rootfs_option(self, option: str, value: str):
+        self._set_option("rootfs", option, value)
+
+    def _set_option(self, section: str, option: str, value: str):
+        if not self._config.has_section(section):
+            self._config.add_section(section)
+        self._config.set(section, option, value)
@@ -0,0 +1,6 @@
+from exceptions.WeoError import WeoError
+
+
+class ArtifactCorruptedError(WeoError):
+    def __init__(self, message="The cached rootfs artifact failed the integrity verification"):
+        super().__init__(message)
@@ -0,0 +1,6 @@
+from exceptions.WeoError import WeoError
+
+
+class CompressionNotSupportedError(WeoError):
+    def __init__(self, message="The requested compression is not supported"):
+        super().__init__(message)
@@ -0,0 +1,6 @@
+from exceptions.OrchestratorError import OrchestratorError
+
+
+class DockerDaemonError(OrchestratorError):
+    def __init__(self, message="The docker daemon of the orchestrator could not be started"):
+        super().__init__(message)
@@ -0,0 +1,6 @@
+from exceptions.OrchestratorError import OrchestratorError
+
+
+class DownloadError(OrchestratorError):
+    def __init__(self, message="The orchestrator base image could not be downloaded"):
+        super().__init__(message)
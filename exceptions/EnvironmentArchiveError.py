@@ -0,0 +1,6 @@
+from exceptions.WeoError import WeoError
+
+
+class EnvironmentArchiveError(WeoError):
+    def __init__(self, message="The environment archive is invalid or corrupted"):
+        super().__init__(message)
@@ -0,0 +1,6 @@
+from exceptions.WeoError import WeoError
+
+
+class EnvironmentNotUpdatableError(WeoError):
+    def __init__(self, message="The environment cannot be updated"):
+        super().__init__(message)
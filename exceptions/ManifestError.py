@@ -0,0 +1,6 @@
+from exceptions.WeoError import WeoError
+
+
+class ManifestError(WeoError):
+    def __init__(self, message="The environment manifest is invalid"):
+        super().__init__(message)
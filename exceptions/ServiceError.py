@@ -0,0 +1,6 @@
+from exceptions.WeoError import WeoError
+
+
+class ServiceError(WeoError):
+    def __init__(self, message="The WEO service could not handle the request"):
+        super().__init__(message)
@@ -0,0 +1,6 @@
+from exceptions.WeoError import WeoError
+
+
+class SlimmingProfileError(WeoError):
+    def __init__(self, message="The slimming profile is invalid"):
+        super().__init__(message)
@@ -0,0 +1,6 @@
+from exceptions.WeoError import WeoError
+
+
+class TemplateExistsError(WeoError):
+    def __init__(self, message="A template with that name already exists"):
+        super().__init__(message)
@@ -0,0 +1,6 @@
+from exceptions.WeoError import WeoError
+
+
+class TemplateNotFoundError(WeoError):
+    def __init__(self, message="A template with that name could not be found"):
+        super().__init__(message)
@@ -0,0 +1,182 @@
+import gzip
+import hashlib
+import json
+import os
+import secrets
+import time
+import zlib
+from contextlib import contextmanager
+from typing import BinaryIO
+
+from exceptions.ArtifactCorruptedError import ArtifactCorruptedError
+from orchestrator.hashing_file import HashingFile
+from orchestrator.rootfs_compression import Compression, CompressionSettings
+
+
+class ArtifactCacheEntry:
+    def __init__(self, key: str, path: str, size: int, sha256: str, image: str, user: str,
+                 created: float, last_used: float):
+        self.key = key
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.image = image
+        self.user = user
+        self.created = created
+        self.last_used = last_used
+
+    def to_dict(self) -> dict:
+        return {
+            "key": self.key,
+            "size": self.size,
+            "sha256": self.sha256,
+            "image": self.image,
+            "user": self.user,
+            "created": self.created,
+            "last_used": self.last_used,
+        }
+
+    @staticmethod
+    def from_dict(path: str, values: dict) -> "ArtifactCacheEntry":
+        return ArtifactCacheEntry(
+            values["key"], path, int(values["size"]), values["sha256"], values["image"], values["user"],
+            float(values["created"]), float(values["last_used"]))
+
+
+class _CheckedStream:
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        try:
+            return self._stream.read(size)
+        except (OSError, EOFError, zlib.error) as e:
+            raise ArtifactCorruptedError() from e
+
+    def close(self) -> None:
+        self._stream.close()
+
+
+class ArtifactReader:
+    def __init__(self, entry: ArtifactCacheEntry):
+        self._entry = entry
+        self._file = open(entry.path, "rb")
+        self._hashing_file = HashingFile(self._file)
+        self.stream = _CheckedStream(gzip.GzipFile(fileobj=self._hashing_file, mode="rb"))
+
+    def verify(self) -> None:
+        while self._hashing_file.read(ArtifactCache.BUFFER_SIZE):
+            pass
+        if self._hashing_file.size != self._entry.size or self._hashing_file.hash.hexdigest() != self._entry.sha256:
+            raise ArtifactCorruptedError()
+
+    def close(self) -> None:
+        self.stream.close()
+        self._file.close()
+
+
+class ArtifactCache:
+    BUFFER_SIZE: int = 1024 * 1024
+    _ARTIFACT_COMPRESSION = CompressionSettings(Compression.GZIP, 1, 0)
+
+    def __init__(self, cache_dir: str):
+        self._cache_dir = cache_dir
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    @staticmethod
+    def key(image_digest: str) -> str:
+        # The user only changes the configuration and password applied after the cache, so it is not part of the key
+        return hashlib.sha256(image_digest.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> ArtifactCacheEntry | None:
+        try:
+            with open(self._metadata_path(key), "r", encoding="utf-8") as file:
+                entry = ArtifactCacheEntry.from_dict(self._artifact_path(key), json.load(file))
+        except (OSError, ValueError, KeyError):
+            return None
+        if not os.path.isfile(entry.path):
+            return None
+        return entry
+
+    def entries(self) -> list[ArtifactCacheEntry]:
+        entries = []
+        for root, _, file_names in os.walk(self._cache_dir):
+            for file_name in file_names:
+                if file_name.endswith(".json"):
+                    entry = self.lookup(file_name[:-len(".json")])
+                    if entry:
+                        entries.append(entry)
+        return entries
+
+    @contextmanager
+    def open(self, entry: ArtifactCacheEntry):
+        reader = ArtifactReader(entry)
+        try:
+            yield reader
+        finally:
+            reader.close()
+        self.touch(entry)
+
+    def touch(self, entry: ArtifactCacheEntry) -> None:
+        entry.last_used = time.time()
+        self._write_metadata(entry)
+
+    def verify(self, entry: ArtifactCacheEntry) -> bool:
+        with open(entry.path, "rb") as file:
+            hashing_file = HashingFile(file)
+            while hashing_file.read(self.BUFFER_SIZE):
+                pass
+        return hashing_file.size == entry.size and hashing_file.hash.hexdigest() == entry.sha256
+
+    @contextmanager
+    def store(self, key: str, image: str, user: str):
+        artifact_path = self._artifact_path(key)
+        os.makedirs(os.path.dirname(artifact_path), exist_ok=True)
+        temp_path = f"{artifact_path}.tmp-{secrets.token_hex(4)}"
+        try:
+            with open(temp_path, "wb") as file:
+                hashing_file = HashingFile(file)
+                with self._ARTIFACT_COMPRESSION.open_writer(hashing_file) as writer:
+                    yield writer
+            # Artifacts and metadata are replaced atomically as the cache directory can be shared
+            os.replace(temp_path, artifact_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        now = time.time()
+        self._write_metadata(ArtifactCacheEntry(
+            key, artifact_path, hashing_file.size, hashing_file.hash.hexdigest(), image, user, now, now))
+
+    def remove(self, entry: ArtifactCacheEntry) -> None:
+        for path in [self._metadata_path(entry.key), entry.path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def evict(self, budget_bytes: int) -> list[ArtifactCacheEntry]:
+        evicted = []
+        entries = sorted(self.entries(), key=lambda entry: entry.last_used)
+        total_size = sum(entry.size for entry in entries)
+        while entries and total_size > budget_bytes:
+            entry = entries.pop(0)
+            self.remove(entry)
+            total_size -= entry.size
+            evicted.append(entry)
+        return evicted
+
+    def _write_metadata(self, entry: ArtifactCacheEntry) -> None:
+        metadata_path = self._metadata_path(entry.key)
+        temp_path = f"{metadata_path}.tmp-{secrets.token_hex(4)}"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(entry.to_dict(), file, indent=2)
+        os.replace(temp_path, metadata_path)
+
+    def _artifact_path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key[:2], key + ".tar.gz")
+
+    def _metadata_path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key[:2], key + ".json")
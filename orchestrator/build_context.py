@@ -0,0 +1,107 @@
+import hashlib
+import os
+import stat
+import tarfile
+import threading
+from typing import BinaryIO
+
+from orchestrator.path_rules import PathRules
+
+
+class BuildContext:
+    _READ_SIZE: int = 1024 * 1024
+    IGNORE_FILE: str = ".dockerignore"
+    # Docker always sends these files, even if they are excluded by the ignore rules
+    _ALWAYS_INCLUDED: list[str] = ["Dockerfile", ".dockerignore"]
+    # File hashes are reused as long as size and modification time of a file are unchanged
+    _file_hashes: dict[str, tuple[int, int, str]] = {}
+    _file_hashes_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self._path = os.path.abspath(path)
+        self._ignore_rules = self._read_ignore_rules()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def is_ignored(self, relative_path: str) -> bool:
+        if relative_path in self._ALWAYS_INCLUDED:
+            return False
+        return self._ignore_rules.matches(relative_path)
+
+    def entries(self) -> list[tuple[str, bool]]:
+        entries = []
+        has_negations = self._ignore_rules.has_negations
+        for root, dir_names, file_names in os.walk(self._path):
+            dir_names.sort()
+            kept_dir_names = []
+            for dir_name in dir_names:
+                relative_path = self._relative_path(os.path.join(root, dir_name))
+                if not self.is_ignored(relative_path):
+                    entries.append((relative_path, True))
+                    kept_dir_names.append(dir_name)
+                elif has_negations:
+                    # A later negation can re-include files below an ignored directory
+                    kept_dir_names.append(dir_name)
+            dir_names[:] = kept_dir_names
+            for file_name in sorted(file_names):
+                relative_path = self._relative_path(os.path.join(root, file_name))
+                if not self.is_ignored(relative_path):
+                    entries.append((relative_path, False))
+        return entries
+
+    def files(self) -> list[str]:
+        return [relative_path for relative_path, is_dir in self.entries() if not is_dir]
+
+    def hash(self) -> str:
+        context_hash = hashlib.sha256()
+        for relative_path, _ in self.entries():
+            path = os.path.join(self._path, relative_path)
+            # Links are packed as links and modes are kept, so both are part of the context as well
+            entry_stat = os.lstat(path)
+            context_hash.update(f"{relative_path}\0{entry_stat.st_mode:o}\0".encode("utf-8"))
+            if stat.S_ISLNK(entry_stat.st_mode):
+                context_hash.update(os.readlink(path).encode("utf-8") + b"\0")
+            elif stat.S_ISREG(entry_stat.st_mode):
+                context_hash.update(self.hash_file(path).encode("ascii"))
+        return context_hash.hexdigest()
+
+    def pack(self, target: BinaryIO) -> None:
+        with tarfile.open(fileobj=target, mode="w|", bufsize=self._READ_SIZE, format=tarfile.PAX_FORMAT) as tar:
+            for relative_path, is_dir in self.entries():
+                path = os.path.join(self._path, relative_path)
+                member = tar.gettarinfo(path, arcname=relative_path)
+                member.uid = member.gid = 0
+                member.uname = member.gname = "root"
+                if is_dir or not member.isfile():
+                    tar.addfile(member)
+                    continue
+                with open(path, "rb") as file:
+                    tar.addfile(member, file)
+
+    @classmethod
+    def hash_file(cls, path: str) -> str:
+        path = os.path.abspath(path)
+        file_stat = os.stat(path)
+        with cls._file_hashes_lock:
+            cached = cls._file_hashes.get(path)
+        if cached and cached[0] == file_stat.st_size and cached[1] == file_stat.st_mtime_ns:
+            return cached[2]
+        file_hash = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(cls._READ_SIZE):
+                file_hash.update(chunk)
+        with cls._file_hashes_lock:
+            cls._file_hashes[path] = (file_stat.st_size, file_stat.st_mtime_ns, file_hash.hexdigest())
+        return file_hash.hexdigest()
+
+    def _relative_path(self, path: str) -> str:
+        return os.path.relpath(path, self._path).replace(os.sep, "/")
+
+    def _read_ignore_rules(self) -> PathRules:
+        ignore_file_path = os.path.join(self._path, self.IGNORE_FILE)
+        if not os.path.isfile(ignore_file_path):
+            return PathRules([])
+        with open(ignore_file_path, "r", encoding="utf-8-sig") as file:
+            return PathRules.parse(file)
@@ -0,0 +1,122 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from enum import Enum
+from tempfile import TemporaryDirectory
+from typing import Callable
+
+from orchestrator.artifact_cache import ArtifactCache
+from orchestrator.environment_manifest import EnvironmentSpec
+from orchestrator.orchestrator import Orchestrator
+from orchestrator.rootfs_compression import CompressionSettings
+from orchestrator.rootfs_slimming import RootfsReport, SlimmingFilter
+
+
+class BuildJobStatus(Enum):
+    PENDING = "pending"
+    WAITING = "waiting"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class BuildJobResult:
+    def __init__(self, spec: EnvironmentSpec):
+        self.spec = spec
+        self.status = BuildJobStatus.PENDING
+        self.started: float | None = None
+        self.finished: float | None = None
+        self.error: str | None = None
+        self.report: RootfsReport | None = None
+
+    @property
+    def duration(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+
+class BuildScheduler:
+    def __init__(self, orchestrator: Orchestrator, max_workers: int = 2, streaming: bool = False,
+                 compression: CompressionSettings | None = None, artifact_cache: ArtifactCache | None = None,
+                 build_timeout: float | None = None, slimming: SlimmingFilter | None = None):
+        if max_workers < 1:
+            raise ValueError("Invalid worker count, expected 1 or more")
+        self._orchestrator = orchestrator
+        self._max_workers = max_workers
+        self._streaming = streaming
+        self._compression = compression
+        self._artifact_cache = artifact_cache
+        self._build_timeout = build_timeout
+        self._slimming = slimming
+
+    def run(self, specs: list[EnvironmentSpec],
+            on_step: Callable[[BuildJobResult, str], None] = lambda result, description: None,
+            on_finished: Callable[[BuildJobResult], None] = lambda result: None) -> list[BuildJobResult]:
+        results = [BuildJobResult(spec) for spec in specs]
+        # Environments are grouped by image only, as the artifact cache is, so followers with another user
+        # are still created from the rootfs of the leader
+        groups: dict[tuple[str, str | None], list[BuildJobResult]] = {}
+        for result in results:
+            groups.setdefault(result.spec.image_key, []).append(result)
+
+        # Without a configured artifact cache a batch local one is used, so every image is
+        # still built once and fanned out to all environments using it
+        cache_dir = TemporaryDirectory(prefix="weo-batch-") if not self._artifact_cache else nullcontext()
+        # The docker daemon is held for the whole batch instead of being restarted between jobs
+        with cache_dir as temp_cache_dir, self._orchestrator.docker_daemon, \
+                ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            artifact_cache = self._artifact_cache or ArtifactCache(temp_cache_dir)
+            finished = threading.Condition()
+            remaining = len(results)
+
+            def job_finished(result: BuildJobResult) -> None:
+                nonlocal remaining
+                try:
+                    on_finished(result)
+                finally:
+                    with finished:
+                        remaining -= 1
+                        finished.notify_all()
+
+            def submit(result: BuildJobResult, followers: list[BuildJobResult]) -> None:
+                future = executor.submit(self._run_job, result, artifact_cache, bool(followers), on_step,
+                                         job_finished)
+                # Followers are only scheduled after the leader stored the rootfs in the artifact cache
+                future.add_done_callback(lambda _: [submit(follower, []) for follower in followers])
+
+            for group in groups.values():
+                leader, followers = group[0], group[1:]
+                for follower in followers:
+                    follower.status = BuildJobStatus.WAITING
+                    on_step(follower, f"Waiting for image of {leader.spec.environment_name}")
+                submit(leader, followers)
+
+            with finished:
+                finished.wait_for(lambda: remaining == 0)
+
+            # Docker budget enforcement prunes stopped containers, so it only runs once no build is in flight
+            self._orchestrator.prune_docker_cache()
+        return results
+
+    def _run_job(self, result: BuildJobResult, artifact_cache: ArtifactCache, fill_artifact_cache: bool,
+                 on_step: Callable[[BuildJobResult, str], None],
+                 on_finished: Callable[[BuildJobResult], None]) -> None:
+        spec = result.spec
+        result.status = BuildJobStatus.RUNNING
+        result.started = time.monotonic()
+        try:
+            result.report = self._orchestrator.create(
+                lambda description: on_step(result, description), spec.docker_image, spec.environment_name,
+                spec.local, spec.environment_password, spec.user, self._streaming, self._compression,
+                artifact_cache, enforce_docker_budget=False, build_timeout=self._build_timeout,
+                slimming=self._slimming, fill_artifact_cache=fill_artifact_cache)
+            result.status = BuildJobStatus.SUCCEEDED
+        # A single failing environment must not abort the remaining batch
+        except Exception as e:
+            result.status = BuildJobStatus.FAILED
+            result.error = str(e) or type(e).__name__
+        finally:
+            result.finished = time.monotonic()
+            on_finished(result)
@@ -0,0 +1,172 @@
+import re
+import threading
+import time
+
+from wsl.command_batch import CommandBatch
+from wsl.docker_daemon import DockerDaemon
+from wsl.wsl_api import WslApi
+
+
+class DockerImageUsage:
+    def __init__(self, image_id: str, size: int, tags: list[str], layers: list[str], last_used: float):
+        self.image_id = image_id
+        self.size = size
+        self.tags = tags
+        self.layers = layers
+        self.last_used = last_used
+
+
+class DockerCacheUsage:
+    def __init__(self, images: list[DockerImageUsage], image_bytes: int, build_cache_bytes: int, budget_bytes: int):
+        self.images = images
+        self.image_bytes = image_bytes
+        self.build_cache_bytes = build_cache_bytes
+        self.budget_bytes = budget_bytes
+
+    @property
+    def total_bytes(self) -> int:
+        return self.image_bytes + self.build_cache_bytes
+
+
+class DockerCache:
+    USAGE_FILE: str = "/var/lib/weo/docker-image-usage"
+    _SIZE_UNITS = {"b": 1, "kb": 1000, "mb": 1000 ** 2, "gb": 1000 ** 3, "tb": 1000 ** 4,
+                   "kib": 1024, "mib": 1024 ** 2, "gib": 1024 ** 3, "tib": 1024 ** 4}
+    # Concurrent creates share the usage file of the orchestrator
+    _usage_lock = threading.Lock()
+
+    def __init__(self, wsl_api: WslApi, instance_name: str, docker_daemon: DockerDaemon, budget_mb: int):
+        self._wsl_api = wsl_api
+        self._instance_name = instance_name
+        self._docker_daemon = docker_daemon
+        self._budget_bytes = budget_mb * 1024 * 1024
+
+    @property
+    def budget_bytes(self) -> int:
+        return self._budget_bytes
+
+    def record_usage(self, docker_tag: str) -> None:
+        with self._docker_daemon:
+            usage = self.usage()
+            built_layers = None
+            for image in usage.images:
+                if docker_tag in image.tags:
+                    built_layers = image.layers
+            if built_layers is None:
+                return
+            # Every image whose layers are a prefix of the built image was used as (indirect) base image
+            with self._usage_lock:
+                last_used = self._read_last_used()
+                now = time.time()
+                for image in usage.images:
+                    if docker_tag not in image.tags and image.layers == built_layers[:len(image.layers)]:
+                        last_used[image.image_id] = now
+                self._write_last_used(last_used)
+
+    def usage(self) -> DockerCacheUsage:
+        with self._docker_daemon:
+            result = CommandBatch(self._wsl_api, self._instance_name) \
+                .add("docker image ls -q --no-trunc | sort -u | xargs -r docker image inspect --format "
+                     "'{{.Id}}|{{.Size}}|{{join .RepoTags \",\"}}|{{join .RootFS.Layers \",\"}}'",
+                     name="images") \
+                .add("docker system df --format '{{.Type}}|{{.Size}}'", name="disk_usage") \
+                .add(f"cat {self.USAGE_FILE} 2> /dev/null || true", name="last_used") \
+                .run()
+            result.check()
+
+        last_used = self._parse_last_used(result["last_used"].stdout)
+        images = []
+        for line in result["images"].stdout.splitlines():
+            fields = line.strip().split("|")
+            if len(fields) != 4:
+                continue
+            image_id, size, tags, layers = fields
+            images.append(DockerImageUsage(
+                image_id,
+                int(size),
+                [tag for tag in tags.split(",") if tag],
+                [layer for layer in layers.split(",") if layer],
+                last_used.get(image_id, 0.0)))
+
+        image_bytes = 0
+        build_cache_bytes = 0
+        for line in result["disk_usage"].stdout.splitlines():
+            fields = line.strip().split("|")
+            if len(fields) != 2:
+                continue
+            if fields[0] == "Images":
+                image_bytes = self._parse_size(fields[1])
+            elif fields[0] == "Build Cache":
+                build_cache_bytes = self._parse_size(fields[1])
+        return DockerCacheUsage(images, image_bytes, build_cache_bytes, self._budget_bytes)
+
+    def enforce(self, budget_bytes: int | None = None) -> list[DockerImageUsage]:
+        if budget_bytes is None:
+            budget_bytes = self._budget_bytes
+        evicted = []
+        with self._docker_daemon:
+            self._wsl_api.run_command_in_instance(
+                self._instance_name,
+                "docker container prune -f > /dev/null && docker image prune -f > /dev/null")
+            usage = self.usage()
+            candidates = sorted(usage.images, key=lambda image: image.last_used)
+            while usage.total_bytes > budget_bytes and candidates:
+                # Image sizes include shared layers, so the freed space is over-estimated.
+                # The usage is therefore measured again after every round of evictions.
+                batch = CommandBatch(self._wsl_api, self._instance_name)
+                excess = usage.total_bytes - usage.build_cache_bytes - budget_bytes
+                while excess > 0 and candidates:
+                    image = candidates.pop(0)
+                    batch.add(f"docker image rm -f {image.image_id} > /dev/null 2>&1 || true")
+                    evicted.append(image)
+                    excess -= image.size
+                if len(batch) > 0:
+                    batch.run().check()
+                usage = self.usage()
+                if usage.image_bytes <= budget_bytes:
+                    break
+
+            if usage.total_bytes > budget_bytes:
+                keep_bytes = max(0, budget_bytes - usage.image_bytes)
+                self._wsl_api.run_command_in_instance(
+                    self._instance_name,
+                    f"docker builder prune -f --keep-storage {keep_bytes} > /dev/null")
+
+            remaining = {image.image_id for image in usage.images}
+            with self._usage_lock:
+                last_used = self._read_last_used()
+                self._write_last_used(
+                    {image_id: value for image_id, value in last_used.items() if image_id in remaining})
+        return evicted
+
+    def prune(self) -> None:
+        with self._docker_daemon:
+            self._wsl_api.run_command_in_instance(self._instance_name, "docker system prune -a -f > /dev/null")
+            self._wsl_api.run_command_in_instance(self._instance_name, f"rm -f {self.USAGE_FILE}")
+
+    def _read_last_used(self) -> dict[str, float]:
+        return self._parse_last_used(
+            self._wsl_api.run_command_in_instance(self._instance_name, f"cat {self.USAGE_FILE} 2> /dev/null || true"))
+
+    def _write_last_used(self, last_used: dict[str, float]) -> None:
+        content = "".join(f"{image_id} {value:.0f}\n" for image_id, value in last_used.items())
+        self._wsl_api.run_command_in_instance(
+            self._instance_name,
+            f"mkdir -p $(dirname {self.USAGE_FILE}) && printf '%s' '{content}' > {self.USAGE_FILE}")
+
+    @staticmethod
+    def _parse_last_used(content: str) -> dict[str, float]:
+        last_used = {}
+        for line in content.splitlines():
+            fields = line.split()
+            if len(fields) == 2:
+                last_used[fields[0]] = float(fields[1])
+        return last_used
+
+    @classmethod
+    def _parse_size(cls, value: str) -> int:
+        match = re.match(r"^\s*([0-9.]+)\s*([a-zA-Z]*)", value)
+        if not match:
+            return 0
+        unit = match.group(2).lower() or "b"
+        return int(float(match.group(1)) * cls._SIZE_UNITS.get(unit, 1))
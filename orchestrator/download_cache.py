@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import re
+import secrets
+import time
+from typing import Callable
+
+from exceptions.DownloadError import DownloadError
+
+
+class DownloadCache:
+    BUFFER_SIZE: int = 1024 * 1024
+    CONNECT_TIMEOUT: float = 10
+    READ_TIMEOUT: float = 60
+    RETRIES: int = 3
+    _CHECKSUMS_FILE: str = "checksums.json"
+    _SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+    def __init__(self, cache_dir: str, offline: bool = False):
+        self._cache_dir = cache_dir
+        self._offline = offline
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    @property
+    def offline(self) -> bool:
+        return self._offline
+
+    def fetch(self, url: str, sha256: str | None = None, checksum_url: str | None = None,
+              on_progress: Callable[[int, int | None], None] = lambda downloaded, total: None) -> str:
+        file_name = self._file_name(url)
+        if sha256 is None:
+            sha256 = self._resolve_checksum(url, file_name, checksum_url or url + ".sha256")
+        sha256 = sha256.lower()
+        target_path = os.path.join(self._cache_dir, sha256, file_name)
+        if os.path.isfile(target_path) and self._file_hash(target_path) == sha256:
+            return target_path
+
+        if self._offline:
+            # Pre-seeded files can simply be dropped into the cache directory
+            seeded_path = os.path.join(self._cache_dir, file_name)
+            if os.path.isfile(seeded_path) and self._file_hash(seeded_path) == sha256:
+                return seeded_path
+            raise DownloadError(f"{file_name} ({sha256}) is not available in the download cache {self._cache_dir} "
+                                f"and downloads are disabled")
+
+        import requests
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        partial_path = target_path + ".part"
+        for attempt in range(1, self.RETRIES + 1):
+            try:
+                self._download(url, partial_path, on_progress)
+                break
+            except (requests.exceptions.RequestException, OSError) as e:
+                # The partial file is kept, so the next attempt resumes where this one stopped
+                if attempt == self.RETRIES:
+                    raise DownloadError(f"{file_name} could not be downloaded: {e}") from e
+                time.sleep(attempt)
+
+        actual_sha256 = self._file_hash(partial_path)
+        if actual_sha256 != sha256:
+            os.remove(partial_path)
+            raise DownloadError(f"Checksum mismatch for {file_name}: expected {sha256}, got {actual_sha256}")
+        os.replace(partial_path, target_path)
+        return target_path
+
+    def _download(self, url: str, partial_path: str, on_progress: Callable[[int, int | None], None]) -> None:
+        import requests
+
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with requests.get(url, headers=headers, stream=True,
+                          timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT)) as response:
+            if response.status_code == 416:
+                # The partial file is already complete
+                return
+            if 400 <= response.status_code < 500:
+                raise DownloadError(f"{url} could not be downloaded: HTTP {response.status_code}")
+            response.raise_for_status()
+            if response.status_code != 206:
+                # The server ignored the range request and sends the whole file
+                offset = 0
+            content_length = response.headers.get("content-length")
+            total = offset + int(content_length) if content_length else None
+            downloaded = offset
+            on_progress(downloaded, total)
+            with open(partial_path, "ab" if offset else "wb") as file:
+                for chunk in response.iter_content(chunk_size=self.BUFFER_SIZE):
+                    file.write(chunk)
+                    downloaded += len(chunk)
+                    on_progress(downloaded, total)
+        if total is not None and downloaded != total:
+            raise requests.exceptions.ConnectionError(f"Download ended after {downloaded} of {total} bytes")
+
+    def _resolve_checksum(self, url: str, file_name: str, checksum_url: str) -> str:
+        checksums = self._read_checksums()
+        if url in checksums:
+            return checksums[url]
+        if self._offline:
+            seeded_checksum_path = os.path.join(self._cache_dir, file_name + ".sha256")
+            if os.path.isfile(seeded_checksum_path):
+                with open(seeded_checksum_path, "r", encoding="utf-8") as file:
+                    return self._parse_checksum(file.read(), seeded_checksum_path)
+            raise DownloadError(f"No checksum of {file_name} is available in the download cache {self._cache_dir} "
+                                f"and downloads are disabled")
+
+        import requests
+        try:
+            response = requests.get(checksum_url, timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT))
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise DownloadError(f"Checksum of {file_name} could not be downloaded: {e}") from e
+        sha256 = self._parse_checksum(response.text, checksum_url)
+        checksums[url] = sha256
+        self._write_checksums(checksums)
+        return sha256
+
+    def _parse_checksum(self, content: str, source: str) -> str:
+        # Checksum files have the sha256sum format "<hash>  <file name>"
+        fields = content.split()
+        if not fields or not self._SHA256_PATTERN.match(fields[0].lower()):
+            raise DownloadError(f"{source} does not contain a sha256 checksum")
+        return fields[0].lower()
+
+    def _read_checksums(self) -> dict[str, str]:
+        try:
+            with open(os.path.join(self._cache_dir, self._CHECKSUMS_FILE), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_checksums(self, checksums: dict[str, str]) -> None:
+        checksums_path = os.path.join(self._cache_dir, self._CHECKSUMS_FILE)
+        temp_path = f"{checksums_path}.tmp-{secrets.token_hex(4)}"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(checksums, file, indent=2)
+        os.replace(temp_path, checksums_path)
+
+    @staticmethod
+    def _file_name(url: str) -> str:
+        file_name = os.path.basename(url.split("?")[0].rstrip("/"))
+        return file_name or hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def _file_hash(cls, path: str) -> str:
+        file_hash = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(cls.BUFFER_SIZE):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
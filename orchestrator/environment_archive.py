@@ -0,0 +1,87 @@
+import json
+import os
+import secrets
+
+from exceptions.EnvironmentArchiveError import EnvironmentArchiveError
+from orchestrator.rootfs_compression import Compression, CompressionSettings
+
+
+class EnvironmentArchiveManifest:
+    FORMAT_VERSION: int = 1
+    SUFFIX: str = ".json"
+
+    def __init__(self, environment_name: str, weo_version: str, compression: Compression, size: int, sha256: str,
+                 rootfs_size: int, created: float, weo_config: dict[str, dict[str, str]], user: str | None):
+        self.environment_name = environment_name
+        self.weo_version = weo_version
+        self.compression = compression
+        self.size = size
+        self.sha256 = sha256
+        self.rootfs_size = rootfs_size
+        self.created = created
+        self.weo_config = weo_config
+        self.user = user
+
+    @staticmethod
+    def path(archive_path: str) -> str:
+        return archive_path + EnvironmentArchiveManifest.SUFFIX
+
+    def to_dict(self) -> dict:
+        return {
+            "format_version": self.FORMAT_VERSION,
+            "environment_name": self.environment_name,
+            "weo_version": self.weo_version,
+            "compression": self.compression.value,
+            "size": self.size,
+            "sha256": self.sha256,
+            "rootfs_size": self.rootfs_size,
+            "created": self.created,
+            "weo_config": self.weo_config,
+            "user": self.user,
+        }
+
+    @staticmethod
+    def from_dict(values: dict) -> "EnvironmentArchiveManifest":
+        if values.get("format_version") != EnvironmentArchiveManifest.FORMAT_VERSION:
+            raise EnvironmentArchiveError(f"Unsupported archive format version {values.get('format_version')}")
+        try:
+            return EnvironmentArchiveManifest(
+                values["environment_name"], values["weo_version"], Compression(values["compression"]),
+                int(values["size"]), values["sha256"], int(values["rootfs_size"]), float(values["created"]),
+                values["weo_config"], values.get("user"))
+        except (KeyError, ValueError, TypeError) as e:
+            raise EnvironmentArchiveError(f"The archive manifest is invalid: {e}")
+
+    @staticmethod
+    def load(archive_path: str) -> "EnvironmentArchiveManifest":
+        manifest_path = EnvironmentArchiveManifest.path(archive_path)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as file:
+                return EnvironmentArchiveManifest.from_dict(json.load(file))
+        except (OSError, ValueError) as e:
+            raise EnvironmentArchiveError(f"The archive manifest {manifest_path} could not be read: {e}")
+
+    def save(self, archive_path: str) -> None:
+        manifest_path = self.path(archive_path)
+        temp_path = f"{manifest_path}.tmp-{secrets.token_hex(4)}"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
+        os.replace(temp_path, manifest_path)
+
+    @property
+    def compression_settings(self) -> CompressionSettings:
+        return CompressionSettings(self.compression)
+
+
+class EnvironmentTransfer:
+    def __init__(self, environment_name: str, path: str, rootfs_size: int, archive_size: int, duration: float):
+        self.environment_name = environment_name
+        self.path = path
+        self.rootfs_size = rootfs_size
+        self.archive_size = archive_size
+        self.duration = duration
+
+    @property
+    def throughput(self) -> float:
+        # Throughput of the uncompressed rootfs in bytes per second
+        return self.rootfs_size / self.duration if self.duration > 0 else 0.0
@@ -0,0 +1,100 @@
+import json
+import os
+import tomllib
+
+from exceptions.ManifestError import ManifestError
+
+
+class EnvironmentSpec:
+    def __init__(self, docker_image: str, environment_name: str, local: str | None = None,
+                 user: str | None = None, environment_password: str = "WEO"):
+        self.docker_image = docker_image
+        self.environment_name = environment_name
+        self.local = local
+        self.user = user
+        self.environment_password = environment_password
+
+    @property
+    def image_key(self) -> tuple[str, str | None]:
+        if self.local:
+            return os.path.abspath(self.docker_image), self.local
+        return self.docker_image, None
+
+
+class EnvironmentManifest:
+    _KEYS = {"image", "docker_image", "name", "environment_name", "local", "user", "password",
+             "environment_password"}
+
+    def __init__(self, environments: list[EnvironmentSpec]):
+        self._environments = environments
+
+    @property
+    def environments(self) -> list[EnvironmentSpec]:
+        return self._environments
+
+    @staticmethod
+    def load(path: str) -> "EnvironmentManifest":
+        extension = os.path.splitext(path)[1].lower()
+        try:
+            with open(path, "rb") as file:
+                match extension:
+                    case ".json":
+                        content = json.load(file)
+                    case ".toml":
+                        content = tomllib.load(file)
+                    case ".yaml" | ".yml":
+                        content = EnvironmentManifest._load_yaml(file)
+                    case _:
+                        raise ManifestError(f"Unsupported manifest format '{extension}', use json, toml or yaml")
+        except (OSError, ValueError) as e:
+            raise ManifestError(f"The manifest {path} could not be read: {e}")
+        return EnvironmentManifest.parse(content)
+
+    @staticmethod
+    def parse(content) -> "EnvironmentManifest":
+        defaults = {}
+        if isinstance(content, dict):
+            defaults = content.get("defaults", {})
+            content = content.get("environments")
+        if not isinstance(content, list) or not isinstance(defaults, dict):
+            raise ManifestError("The manifest needs to contain a list of environments")
+
+        environments = []
+        names = set()
+        for index, values in enumerate(content):
+            if not isinstance(values, dict):
+                raise ManifestError(f"Environment {index} of the manifest is not a mapping")
+            values = {**defaults, **values}
+            unknown_keys = set(values) - EnvironmentManifest._KEYS
+            if unknown_keys:
+                raise ManifestError(f"Environment {index} contains unknown keys: {', '.join(sorted(unknown_keys))}")
+            image = values.get("image", values.get("docker_image"))
+            name = values.get("name", values.get("environment_name"))
+            if not image or not name:
+                raise ManifestError(f"Environment {index} needs an image and a name")
+            if name in names:
+                raise ManifestError(f"Environment {name} is listed more than once")
+            names.add(name)
+            local = values.get("local")
+            if local is not None:
+                local = str(local).upper()
+                if local not in ["FILE", "DIR"]:
+                    raise ManifestError(f"Environment {name} has an invalid local value, expected FILE or DIR")
+            environments.append(EnvironmentSpec(
+                str(image),
+                str(name),
+                local,
+                values.get("user"),
+                str(values.get("password", values.get("environment_password", "WEO")))))
+        return EnvironmentManifest(environments)
+
+    @staticmethod
+    def _load_yaml(file):
+        try:
+            import yaml
+        except ImportError:
+            raise ManifestError("YAML manifests require PyYAML to be installed, use json or toml instead")
+        try:
+            return yaml.safe_load(file)
+        except yaml.YAMLError as e:
+            raise ManifestError(f"The manifest could not be parsed: {e}")
@@ -0,0 +1,237 @@
+import os
+import shlex
+import shutil
+import time
+from enum import Enum
+
+from orchestrator.docker_cache import DockerCache
+from wsl.docker_daemon import DockerDaemon
+from wsl.wsl_api import WslApi, WslApiError
+
+
+class GarbageKind(Enum):
+    WORK_DIR = "work dir"
+    BUILD_CONTEXT = "build context"
+    DOCKER_IMAGE = "docker image"
+    DOCKER_DAEMON = "docker daemon"
+    STORAGE_DIR = "storage dir"
+    TEMP_FILE = "temp file"
+
+
+class Garbage:
+    def __init__(self, kind: GarbageKind, location: str, size: int):
+        self.kind = kind
+        self.location = location
+        self.size = size
+        self.error: str | None = None
+
+
+class GarbageReport:
+    def __init__(self, dry_run: bool):
+        self.dry_run = dry_run
+        self.garbage: list[Garbage] = []
+        self.in_use = 0
+
+    @property
+    def reclaimed(self) -> int:
+        return sum(garbage.size for garbage in self.garbage if garbage.error is None)
+
+    @property
+    def failed(self) -> list[Garbage]:
+        return [garbage for garbage in self.garbage if garbage.error is not None]
+
+
+class WorkDirOwner:
+    FILE_NAME: str = ".weo-owner"
+
+    def __init__(self, pid: int, docker_tag: str, environment_name: str):
+        self.pid = pid
+        self.docker_tag = docker_tag
+        self.environment_name = environment_name
+
+    @classmethod
+    def write_command(cls, work_dir: str, docker_tag: str, environment_name: str) -> str:
+        # $$ is the pid of the session shell, which lives exactly as long as the create or prefetch using the dir
+        return f"echo $$ {shlex.quote(docker_tag)} {shlex.quote(environment_name)} > {work_dir}/{cls.FILE_NAME}"
+
+    @staticmethod
+    def parse(content: str) -> "WorkDirOwner | None":
+        fields = content.split()
+        if len(fields) != 3 or not fields[0].isdigit():
+            return None
+        return WorkDirOwner(int(fields[0]), fields[1], fields[2])
+
+
+class GarbageCollector:
+    WORK_DIR_PREFIX: str = "/tmp/weo-"
+    # Temp files and storage dirs of running operations are written to continuously or were just created
+    MIN_AGE: float = 10 * 60
+    _LEGACY_WORK_DIR_PATTERN: str = "/tmp/" + "[A-Z0-9]" * 8
+    _FIELD_SEPARATOR: str = "|"
+    _INSTANCE_DISK: str = "ext4.vhdx"
+
+    def __init__(self, wsl_api: WslApi, instance_name: str, docker_daemon: DockerDaemon, docker_cache: DockerCache,
+                 contexts_dir: str, host_temp_dirs: list[str], keep_docker_daemon: bool = False):
+        self._wsl_api = wsl_api
+        self._instance_name = instance_name
+        self._docker_daemon = docker_daemon
+        self._docker_cache = docker_cache
+        self._contexts_dir = contexts_dir
+        self._host_temp_dirs = host_temp_dirs
+        self._keep_docker_daemon = keep_docker_daemon
+
+    def collect(self, dry_run: bool = False) -> GarbageReport:
+        report = GarbageReport(dry_run)
+        with self._wsl_api.session(self._instance_name):
+            owners = self._collect_work_dirs(report)
+            self._collect_build_contexts(report)
+            daemon_pid = self._running_docker_daemon()
+            self._collect_docker_images(report, {owner.docker_tag for owner in owners})
+            # A daemon which no WEO process holds a lease on was left behind by one which was killed
+            if daemon_pid and not self._docker_daemon_leased() and not self._keep_docker_daemon:
+                self._reclaim(report, Garbage(GarbageKind.DOCKER_DAEMON, f"dockerd (pid {daemon_pid})", 0),
+                              lambda: self._run(f"kill {daemon_pid}; for i in $(seq 1 100); do "
+                                                f"kill -0 {daemon_pid} 2> /dev/null || break; sleep 0.1; done"))
+        self._collect_storage_dirs(report, {owner.environment_name.lower() for owner in owners})
+        self._collect_host_temp_files(report)
+        return report
+
+    def _collect_work_dirs(self, report: GarbageReport) -> list[WorkDirOwner]:
+        separator = self._FIELD_SEPARATOR
+        listing = self._run(
+            f"for dir in {self.WORK_DIR_PREFIX}* {self._LEGACY_WORK_DIR_PATTERN}; do "
+            f"[ -d \"$dir\" ] || continue; "
+            f"case \"$dir\" in {self.WORK_DIR_PREFIX}*) ;; "
+            f"*) [ -e \"$dir/Dockerfile\" ] || [ -e \"$dir/rootfs\" ] || continue ;; esac; "
+            f"owner=$(cat \"$dir/{WorkDirOwner.FILE_NAME}\" 2> /dev/null); "
+            f"pid=${{owner%% *}}; state=orphan; "
+            f"[ -n \"$pid\" ] && kill -0 \"$pid\" 2> /dev/null && state=live; "
+            f"echo \"$state{separator}$(du -sk \"$dir\" | cut -f1){separator}$dir{separator}$owner\"; done")
+        owners = []
+        for state, size, work_dir, owner in self._parse(listing, 4):
+            if state == "live":
+                report.in_use += 1
+                owner = WorkDirOwner.parse(owner)
+                if owner:
+                    owners.append(owner)
+                continue
+            self._reclaim(report, Garbage(GarbageKind.WORK_DIR, work_dir, self._kib(size)),
+                          lambda work_dir=work_dir: self._run(f"rm -rf {shlex.quote(work_dir)}"))
+        return owners
+
+    def _collect_build_contexts(self, report: GarbageReport) -> None:
+        # Uploads which were interrupted before they were moved into place
+        listing = self._run(
+            f"[ ! -d {self._contexts_dir} ] || find {self._contexts_dir} -mindepth 1 -maxdepth 1 -type d "
+            f"-name '*.tmp-*' -mmin +{int(self.MIN_AGE / 60)} -exec du -sk {{}} +")
+        for line in listing.splitlines():
+            size, _, context_dir = line.partition("\t")
+            if not context_dir:
+                continue
+            self._reclaim(report, Garbage(GarbageKind.BUILD_CONTEXT, context_dir, self._kib(size)),
+                          lambda context_dir=context_dir: self._run(f"rm -rf {shlex.quote(context_dir)}"))
+
+    def _running_docker_daemon(self) -> int | None:
+        pid = self._run(f"pid=$(cat {DockerDaemon.PID_FILE} 2> /dev/null) && kill -0 \"$pid\" 2> /dev/null "
+                        f"&& echo \"$pid\" || true").strip()
+        return int(pid) if pid.isdigit() else None
+
+    def _docker_daemon_leased(self) -> bool:
+        # The lease of this collector is already released, every remaining one belongs to another process
+        return "live" in self._run(DockerDaemon.live_leases_command()).split()
+
+    def _collect_docker_images(self, report: GarbageReport, live_tags: set[str]) -> None:
+        with self._docker_daemon:
+            for image in self._docker_cache.usage().images:
+                tags = [tag for tag in image.tags if tag.startswith("weo:") and tag not in live_tags]
+                if not tags:
+                    continue
+                # Images still tagged otherwise are kept by docker, only the temporary tag goes away
+                size = image.size if len(tags) == len(image.tags) else 0
+                self._reclaim(report, Garbage(GarbageKind.DOCKER_IMAGE, ", ".join(tags), size),
+                              lambda tags=tags: self._run(f"docker image rm {' '.join(tags)} > /dev/null"))
+
+    def _collect_storage_dirs(self, report: GarbageReport, live_environments: set[str]) -> None:
+        storage_path = self._wsl_api.storage_path
+        instances = {instance.name.lower() for instance in self._wsl_api.registry.instances(refresh=True)}
+        for name in sorted(os.listdir(storage_path)):
+            path = os.path.join(storage_path, name)
+            # Names starting with a dot hold WEO data, e.g. templates, and are never instances
+            if name.startswith(".") or not os.path.isdir(path) or name.lower() in instances \
+                    or name.lower() in live_environments:
+                continue
+            # Only dirs which WEO created for an import and which hold nothing but the disk of WSL are left
+            # behind instances, everything else in the storage path belongs to the user
+            if not self._wsl_api.instance_dir_recorded(name) or not self._is_instance_store(path):
+                continue
+            # An import in progress keeps writing into the dir before the instance is registered
+            size, modified = self._tree_stats(path)
+            if time.time() - modified < self.MIN_AGE:
+                continue
+            self._reclaim(report, Garbage(GarbageKind.STORAGE_DIR, path, size),
+                          lambda name=name, path=path: self._remove_storage_dir(name, path))
+
+    def _remove_storage_dir(self, name: str, path: str) -> None:
+        shutil.rmtree(path)
+        self._wsl_api.forget_instance_dir(name)
+
+    @classmethod
+    def _is_instance_store(cls, path: str) -> bool:
+        try:
+            entries = os.listdir(path)
+        except OSError:
+            return False
+        return all(entry == cls._INSTANCE_DISK and os.path.isfile(os.path.join(path, entry)) for entry in entries)
+
+    def _collect_host_temp_files(self, report: GarbageReport) -> None:
+        for temp_dir in self._host_temp_dirs:
+            for root, _, files in os.walk(temp_dir):
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    # Files are written to a temp name first and renamed once they are complete
+                    if ".tmp-" not in name or not self._old_enough(path):
+                        continue
+                    self._reclaim(report, Garbage(GarbageKind.TEMP_FILE, path, os.path.getsize(path)),
+                                  lambda path=path: os.remove(path))
+
+    @staticmethod
+    def _reclaim(report: GarbageReport, garbage: Garbage, remove) -> None:
+        report.garbage.append(garbage)
+        if report.dry_run:
+            return
+        # Every item is reclaimed on its own, a failing one must not keep the others
+        try:
+            remove()
+        except (WslApiError, OSError) as e:
+            garbage.error = str(e) or type(e).__name__
+
+    def _run(self, command: str) -> str:
+        return self._wsl_api.run_command_in_instance(self._instance_name, command)
+
+    def _parse(self, listing: str, fields: int) -> list[list[str]]:
+        return [line.split(self._FIELD_SEPARATOR, fields - 1) for line in listing.splitlines()
+                if line.count(self._FIELD_SEPARATOR) >= fields - 1]
+
+    @staticmethod
+    def _kib(value: str) -> int:
+        return int(value) * 1024 if value.strip().isdigit() else 0
+
+    def _old_enough(self, path: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) >= self.MIN_AGE
+        except OSError:
+            return False
+
+    @staticmethod
+    def _tree_stats(path: str) -> tuple[int, float]:
+        size = 0
+        modified = os.path.getmtime(path)
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                size += stat.st_size
+                modified = max(modified, stat.st_mtime)
+        return size, modified
@@ -0,0 +1,23 @@
+import hashlib
+from typing import BinaryIO
+
+
+class HashingFile:
+    def __init__(self, file: BinaryIO):
+        self._file = file
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self.hash.update(data)
+        self.size += len(data)
+        return data
+
+    def flush(self) -> None:
+        self._file.flush()
@@ -0,0 +1,220 @@
+import gzip
+import hashlib
+import io
+import os
+import tarfile
+import threading
+from typing import BinaryIO, Callable
+
+from exceptions.OrchestratorError import OrchestratorError
+from orchestrator.rootfs_transformer import RootfsTransformer
+
+
+class ImageIndex:
+    # Recorded in every environment, so an update knows which files came from the image and how they looked
+    PATH: str = "/var/lib/weo/image.index"
+    BUFFER_SIZE: int = 1024 * 1024
+    # Streamed tars copy their remaining buffer on every read, so a large buffer slows down images with many files
+    STREAM_BUFFER_SIZE: int = 64 * 1024
+    ACCOUNT_FILES: list[str] = ["etc/passwd", "etc/group", "etc/shadow", "etc/gshadow"]
+    DIRECTORY: str = "d"
+    _ACCOUNTS: str = "a"
+    _SEPARATOR: str = "\0"
+    # Kinds of the file types stat reports, sockets can not be part of a tar
+    _STAT_KINDS: dict[int, str] = {0o100000: "f", 0o040000: DIRECTORY, 0o120000: "s", 0o020000: "o3",
+                                   0o060000: "o4", 0o010000: "o6"}
+
+    def __init__(self):
+        # Only kind, size and a digest of every entry are kept, so images with many files need little memory
+        self.entries: dict[str, tuple[str, int, bytes]] = {}
+        # Names of the accounts in every account file, their lines are merged by an update
+        self.accounts: dict[str, set[str]] = {}
+
+    def read(self, source: BinaryIO, skip: Callable[[str], bool] | None = None) -> None:
+        with tarfile.open(fileobj=source, mode="r|", bufsize=self.STREAM_BUFFER_SIZE) as tar:
+            for member in tar:
+                path = RootfsTransformer.normalize(member.name)
+                if skip and path not in self.ACCOUNT_FILES and skip(path):
+                    continue
+                self.add(member, tar.extractfile(member) if member.isfile() else None)
+
+    def add(self, member: tarfile.TarInfo, data: BinaryIO | None,
+            copy: BinaryIO | None = None) -> tuple[str, int, bytes] | None:
+        path = RootfsTransformer.normalize(member.name)
+        if not path:
+            return None
+        if member.islnk():
+            # The first name of a file is stored as the file and further names as links to it, which one comes first
+            # differs between docker and WSL exports, so a link is recorded like the file it refers to
+            target = self.entries.get(self.link_target(member))
+            if target is not None:
+                self.entries[path] = target
+                return target
+        if path in self.ACCOUNT_FILES and data is not None:
+            content = data.read()
+            self.accounts[path] = set(self.account_lines(content))
+            data = io.BytesIO(content)
+        entry = (self.kind(member), member.size, self._digest(member, data, copy))
+        self.entries[path] = entry
+        return entry
+
+    def dumps(self) -> bytes:
+        records = [f"{kind}\t{size}\t{digest.hex()}\t{path}" for path, (kind, size, digest) in self.entries.items()]
+        # Account names never contain a colon, it separates the fields of the account files
+        records += [f"{self._ACCOUNTS}\t0\t{':'.join(sorted(names))}\t{path}" for path, names in self.accounts.items()]
+        return gzip.compress(self._SEPARATOR.join(records).encode("utf-8", errors="surrogateescape"))
+
+    @classmethod
+    def loads(cls, data: bytes) -> "ImageIndex":
+        index = ImageIndex()
+        try:
+            records = gzip.decompress(data).decode("utf-8", errors="surrogateescape").split(cls._SEPARATOR)
+            for record in filter(None, records):
+                kind, size, value, path = record.split("\t", 3)
+                if kind == cls._ACCOUNTS:
+                    index.accounts[path] = set(filter(None, value.split(":")))
+                else:
+                    index.entries[path] = (kind, int(size), bytes.fromhex(value))
+        except (OSError, EOFError, ValueError) as e:
+            raise ValueError(f"Invalid image index: {e}") from e
+        return index
+
+    @classmethod
+    def listing_command(cls, directory: str) -> str:
+        # Lists an extracted rootfs within the orchestrator, so only the listing has to be copied to the host. Paths
+        # with a line break can not be listed line by line, nothing is listed for them
+        accounts = " ".join(cls.ACCOUNT_FILES)
+        return (f"cd {directory} || exit 1; nl=$(printf '\\n_') && nl=${{nl%_}} && "
+                f"[ -z \"$(find . -name \"*$nl*\" | head -c 1)\" ] || exit 0; set -o pipefail && {{ "
+                f"echo @stat && find . -mindepth 1 -exec stat -c '%f %u %g %s %t %T %n' {{}} + && "
+                f"echo @sha256 && find . -type f -exec sha256sum {{}} + && "
+                f"echo @links && find . -type l -exec sh -c "
+                f"'for l; do printf \"%s\\n%s\\n\" \"$l\" \"$(readlink \"$l\")\"; done' sh {{}} + && "
+                f"for f in {accounts}; do [ ! -f $f ] || [ -L $f ] || {{ echo \"@account $f\" && cat $f && echo; }}; "
+                f"done; }} | gzip -1")
+
+    @classmethod
+    def from_listing(cls, data: bytes) -> "ImageIndex":
+        index = ImageIndex()
+        stats, hashes, links, accounts = [], {}, {}, {}
+        try:
+            lines = iter(gzip.decompress(data).decode("utf-8", errors="surrogateescape").split("\n"))
+            section = None
+            for line in lines:
+                if line in ("@stat", "@sha256", "@links") or line.startswith("@account etc/"):
+                    section, _, path = line.partition(" ")
+                elif section == "@stat" and line:
+                    stats.append(line)
+                elif section == "@sha256" and line:
+                    # GNU sha256sum escapes backslashes in names and marks those lines with one
+                    if line.startswith("\\"):
+                        line = line[1:].replace("\\\\", "\\")
+                    digest, _, name = line.partition("  ")
+                    hashes[RootfsTransformer.normalize(name)] = digest
+                elif section == "@links" and line:
+                    links[RootfsTransformer.normalize(line)] = next(lines)
+                elif section == "@account":
+                    accounts.setdefault(path, []).append(line)
+            for line in stats:
+                mode, uid, gid, size, devmajor, devminor, name = line.split(" ", 6)
+                mode = int(mode, 16)
+                kind = cls._STAT_KINDS.get(mode & 0o170000)
+                path = RootfsTransformer.normalize(name)
+                if kind is None or not path:
+                    continue
+                content = hashes[path] if kind == "f" else ""
+                digest = cls._entry_digest(kind, mode & 0o7777, int(uid), int(gid), links.get(path, ""),
+                                           int(devmajor, 16), int(devminor, 16), content)
+                index.entries[path] = (kind, int(size) if kind == "f" else 0, digest)
+        except (OSError, EOFError, ValueError, KeyError, StopIteration) as e:
+            raise ValueError(f"Invalid rootfs listing: {e}") from e
+        for path, content in accounts.items():
+            index.accounts[path] = set(cls.account_lines("\n".join(content).encode("utf-8", errors="surrogateescape")))
+        return index
+
+    @staticmethod
+    def account_lines(content: bytes) -> dict[str, str]:
+        lines = {}
+        for line in content.decode("utf-8", errors="surrogateescape").splitlines():
+            name, separator, _ = line.partition(":")
+            if separator and name and not name.startswith("#"):
+                lines.setdefault(name, line)
+        return lines
+
+    @classmethod
+    def kind(cls, member: tarfile.TarInfo) -> str:
+        if member.isfile():
+            return "f"
+        if member.isdir():
+            return cls.DIRECTORY
+        if member.issym():
+            return "s"
+        if member.islnk():
+            return "h"
+        return "o" + member.type.decode("ascii", errors="replace")
+
+    @staticmethod
+    def link_target(member: tarfile.TarInfo) -> str:
+        return RootfsTransformer.normalize(member.linkname)
+
+    def _digest(self, member: tarfile.TarInfo, data: BinaryIO | None, copy: BinaryIO | None = None) -> bytes:
+        content = hashlib.sha256()
+        while data is not None and (chunk := data.read(self.BUFFER_SIZE)):
+            content.update(chunk)
+            if copy is not None:
+                copy.write(chunk)
+        link = self.link_target(member) if member.islnk() else member.linkname
+        return self._entry_digest(self.kind(member), member.mode & 0o7777, member.uid, member.gid, link,
+                                  member.devmajor, member.devminor, content.hexdigest() if data is not None else "")
+
+    @staticmethod
+    def _entry_digest(kind: str, mode: int, uid: int, gid: int, link: str, devmajor: int, devminor: int,
+                      content: str) -> bytes:
+        # Modification times are left out, a rebuilt layer touches files without changing them. The content is
+        # taken as a sha256, so entries listed within the orchestrator by sha256sum get the same digest
+        return hashlib.blake2b(f"{kind}|{mode}|{uid}|{gid}|{link}|{devmajor}|{devminor}|{content}"
+                               .encode("utf-8", errors="surrogateescape"), digest_size=16).digest()
+
+
+class ImageIndexWriter:
+    # Indexes a rootfs which is written on its way elsewhere, so an image passing the host is not read twice
+    def __init__(self, target: BinaryIO | None = None):
+        self.index = ImageIndex()
+        self._target = target
+        self._pipe = None
+        self._thread = None
+        self._error: Exception | None = None
+
+    def __enter__(self):
+        read_fd, write_fd = os.pipe()
+        self._pipe = os.fdopen(write_fd, "wb")
+        self._thread = threading.Thread(target=self._read, args=(os.fdopen(read_fd, "rb"),), daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._pipe.close()
+        self._thread.join()
+        if exc_type is None and self._error is not None:
+            raise OrchestratorError(f"The rootfs could not be indexed: {self._error}") from self._error
+
+    def write(self, data: bytes) -> int:
+        self._pipe.write(data)
+        if self._target is not None:
+            self._target.write(data)
+        return len(data)
+
+    def flush(self) -> None:
+        self._pipe.flush()
+        if self._target is not None:
+            self._target.flush()
+
+    def _read(self, pipe: BinaryIO) -> None:
+        with pipe:
+            try:
+                self.index.read(pipe)
+            except Exception as e:
+                self._error = e
+            # The rest is read even after an error, a writer blocked on the full pipe would never finish
+            while pipe.read(ImageIndex.BUFFER_SIZE):
+                pass
@@ -1,63 +1,141 @@
+import io
 import os
 import re
 import secrets
+import shlex
 import string
 import random
-from tempfile import TemporaryDirectory
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from tempfile import TemporaryDirectory, TemporaryFile
 import time
-from typing import Callable
+import zlib
+from typing import BinaryIO, Callable
 
 from semver import Version
 
+from config.config_manager import ConfigManager
 from config.version import WEO_VERSION
 from config.weo_config import WeoConfig
 from config.wsl_config import WslConfig
+from exceptions.ArtifactCorruptedError import ArtifactCorruptedError
+from exceptions.CompressionNotSupportedError import CompressionNotSupportedError
+from exceptions.EnvironmentArchiveError import EnvironmentArchiveError
 from exceptions.EnvironmentExistsError import EnvironmentExistsError
 from exceptions.EnvironmentNotFoundError import EnvironmentNotFoundError
+from exceptions.EnvironmentNotUpdatableError import EnvironmentNotUpdatableError
 from exceptions.ImageNotSupportedError import ImageNotSupportedError
+from exceptions.OrchestratorError import OrchestratorError
 from exceptions.OrchestratorIncompatibleError import OrchestratorIncompatibleError
+from exceptions.TemplateExistsError import TemplateExistsError
 from exceptions.UserNotFoundError import UserNotFoundError
-from wsl.docker_daemon import DockerDaemon
-from wsl.wsl_api import WslApi
+from orchestrator.artifact_cache import ArtifactCache, ArtifactCacheEntry
+from orchestrator.build_context import BuildContext
+from orchestrator.docker_cache import DockerCache, DockerCacheUsage, DockerImageUsage
+from orchestrator.environment_archive import EnvironmentArchiveManifest, EnvironmentTransfer
+from orchestrator.garbage_collector import GarbageCollector, GarbageReport, WorkDirOwner
+from orchestrator.hashing_file import HashingFile
+from orchestrator.image_index import ImageIndex, ImageIndexWriter
+from orchestrator.rootfs_compression import Compression, CompressionSettings
+from orchestrator.rootfs_diff import RootfsDiff, RootfsDiffReport
+from orchestrator.rootfs_slimming import RootfsReport, SlimmingFilter, SlimmingReport
+from orchestrator.rootfs_transformer import RootfsTransformer, TeeReader
+from orchestrator.template_store import TemplateStore
+from tracing.tracer import get_tracer
+from wsl.command_batch import CommandBatch
+from wsl.command_stream import CommandStream
+from wsl.docker_daemon import DockerDaemon, DockerDaemonLease
+from wsl.wsl_api import StderrReader, WslApi, WslApiError
 
 
 class Orchestrator:
+    _CONTEXTS_DIR: str = "/var/lib/weo/contexts"
+    _CONTEXT_MAX_AGE_DAYS: int = 30
+    _REQUIRED_TOOLS = ["docker", "dockerd", "tar", "mkpasswd"]
+    # Steps of the classic builder ("Step 2/5 : RUN ...") and of BuildKit with plain progress ("#6 [2/5] RUN ...")
+    _BUILD_STEP_PATTERNS = [re.compile(r"^Step (\d+)/(\d+) : (.*)$"),
+                            re.compile(r"^#\d+ \[(?:[^\]]+ )?(\d+)/(\d+)\] (.*)$")]
+    _BUILD_INSTRUCTION_LENGTH: int = 50
+    _REMOVAL_BATCH_SIZE: int = 256
 
     def __init__(self, orchestrator_instance_name: str, wsl_api: WslApi):
         self._instance_name = orchestrator_instance_name
         self._wsl_api = wsl_api
-        self._rootfs_file_name = "rootfs.tar.bz2"
+        self._rootfs_base_name = "rootfs"
+        self._docker_daemon = DockerDaemon(wsl_api, orchestrator_instance_name)
+        self._templates = TemplateStore(os.path.join(wsl_api.storage_path, TemplateStore.DIR_NAME))
 
-    def _prepare_dockerfile(self, docker_image: str, local: str | None, target_dir: str):
+    @property
+    def docker_daemon(self) -> DockerDaemon:
+        return self._docker_daemon
+
+    @property
+    def wsl_api(self) -> WslApi:
+        return self._wsl_api
+
+    @property
+    def templates(self) -> TemplateStore:
+        return self._templates
+
+    def _prepare_dockerfile(self, batch: CommandBatch, docker_image: str, local: str | None, target_dir: str):
         if not local:
-            self._wsl_api.run_command_in_instance(
-                self._instance_name, f"cd {target_dir} && echo 'FROM {docker_image}' > Dockerfile")
+            batch.add(f"cd {target_dir} && echo 'FROM {docker_image}' > Dockerfile")
             return
         docker_image = os.path.abspath(docker_image)
         match local:
             case "FILE":
-                self._wsl_api.run_command_in_instance(
-                    self._instance_name,
-                    f"cd {target_dir} && cp {WslApi.linuxify(docker_image)} Dockerfile"
-                )
+                batch.add(f"cd {target_dir} && cp {WslApi.linuxify(docker_image)} Dockerfile")
             case "DIR":
-                if docker_image[-1] == "/" or docker_image[-1] == "\\":
-                    docker_image = docker_image[:-1]
-                docker_image = docker_image + "/*"
-                self._wsl_api.run_command_in_instance(
-                    self._instance_name,
-                    f"cd {target_dir} && cp -r {WslApi.linuxify(docker_image)} ./"
-                )
+                context_dir = self._upload_build_context(BuildContext(docker_image))
+                # Hard links avoid copying the context again, the build does not modify it
+                batch.add(f"touch {context_dir} && cp -al {context_dir}/. {target_dir}/")
             case _:
                 raise RuntimeError("Unexpected local value")
 
-    def _create_image(self, tmp_docker_tag: str, target_dir: str) -> None:
-        with DockerDaemon(self._instance_name):
-            self._wsl_api.run_command_in_instance(self._instance_name,
-                                                  f"cd '{target_dir}' && docker build -t {tmp_docker_tag} .")
+    def _upload_build_context(self, build_context: BuildContext) -> str:
+        context_dir = f"{self._CONTEXTS_DIR}/{build_context.hash()}"
+        if self._wsl_api.execute_in_instance(self._instance_name, f"test -d {context_dir}").returncode == 0:
+            return context_dir
+        # The context is streamed as a single tar instead of copying it file by file over /mnt
+        temp_context_dir = f"{context_dir}.tmp-{secrets.token_hex(4)}"
+        self._wsl_api.stream_to_instance(
+            self._instance_name,
+            f"mkdir -p {temp_context_dir} && tar -xf - -C {temp_context_dir} || "
+            f"{{ rm -rf {temp_context_dir}; exit 1; }}; "
+            f"if [ -d {context_dir} ]; then rm -rf {temp_context_dir}; else mv {temp_context_dir} {context_dir}; fi",
+            build_context.pack)
+        return context_dir
+
+    def _create_image(self, tmp_docker_tag: str, target_dir: str, step_desc: Callable[[str], None],
+                      timeout: float | None = None, pull: bool = False) -> None:
+        pull_option = "--pull " if pull else ""
+        # The build log is streamed instead of captured, so the current build step is shown while it runs
+        with self._docker_daemon, CommandStream(
+                self._wsl_api, self._instance_name,
+                f"cd '{target_dir}' && BUILDKIT_PROGRESS=plain docker build {pull_option}-t {tmp_docker_tag} .",
+                timeout=timeout) as build:
+            current_step = None
+            for _, line in build:
+                build_step = self._parse_build_step(line)
+                if build_step and build_step != current_step:
+                    current_step = build_step
+                    step_desc(f"Creating image ({build_step})")
+            build.check()
+
+    @classmethod
+    def _parse_build_step(cls, line: str) -> str | None:
+        for pattern in cls._BUILD_STEP_PATTERNS:
+            match = pattern.match(line.strip())
+            if match:
+                step, steps, instruction = match.groups()
+                if len(instruction) > cls._BUILD_INSTRUCTION_LENGTH:
+                    instruction = instruction[:cls._BUILD_INSTRUCTION_LENGTH - 3] + "..."
+                return f"Step {step}/{steps}: {instruction}"
+        return None
 
     def _get_docker_user(self, tmp_docker_tag: str) -> str:
-        with DockerDaemon(self._instance_name):
+        with self._docker_daemon:
             user = self._wsl_api.run_command_in_instance(self._instance_name,
                                                          "docker image inspect --format '{{.Config.User}}' " + str(
                                                              tmp_docker_tag))
@@ -65,136 +143,883 @@ class Orchestrator:
             user = "root"
         return user
 
-    def _get_rootfs(self, tmp_docker_tag: str, target_dir: str) -> None:
-        with DockerDaemon(self._instance_name):
+    def _resolve_image_digest(self, docker_image: str, local: str | None, docker_lease: DockerDaemonLease) -> str:
+        match local:
+            case "FILE":
+                return "file:" + BuildContext.hash_file(os.path.abspath(docker_image))
+            case "DIR":
+                return "dir:" + BuildContext(docker_image).hash()
+        if "@sha256:" in docker_image:
+            return docker_image[docker_image.index("@") + 1:]
+        docker_lease.acquire()
+        with self._docker_daemon:
+            digest = self._wsl_api.run_command_in_instance(
+                self._instance_name,
+                f"docker pull -q {docker_image} > /dev/null && "
+                f"docker image inspect --format '{{{{index .RepoDigests 0}}}}' {docker_image}")
+        return digest.strip().split("@")[-1]
+
+    @contextmanager
+    def _export_rootfs(self, tmp_docker_tag: str):
+        with self._docker_daemon:
+            container_id = self._wsl_api.run_command_in_instance(self._instance_name,
+                                                                 f"docker create {tmp_docker_tag}")
+            container_id = container_id.strip()
+            try:
+                export = self._wsl_api.open_command_in_instance(self._instance_name,
+                                                                f"docker export {container_id}")
+                stderr_reader = StderrReader(export)
+                try:
+                    yield export.stdout
+                finally:
+                    export.stdout.close()
+                    stderr = stderr_reader.text()
+                    export.wait()
+                if export.returncode != 0:
+                    raise WslApiError("Rootfs could not be exported. Stderr: " + stderr)
+            finally:
+                self._wsl_api.run_command_in_instance(self._instance_name, f"docker remove {container_id}")
+
+    def _get_rootfs(self, tmp_docker_tag: str, target_dir: str, artifact_writer: BinaryIO | None = None) -> ImageIndex:
+        with self._docker_daemon:
             container_id = self._wsl_api.run_command_in_instance(self._instance_name,
                                                                  f"docker create {tmp_docker_tag}")
             container_id = container_id.strip()
             self._wsl_api.run_command_in_instance(self._instance_name,
-                                                  f"docker build -t {tmp_docker_tag} {target_dir} && "
                                                   f"docker export {container_id} -o {target_dir}/rootfs.tar.gz && "
-                                                  f"mkdir {target_dir}/rootfs && "
-                                                  f"tar -xf {target_dir}/rootfs.tar.gz  -C {target_dir}/rootfs/ && "
                                                   f"docker remove {container_id}")
+        extract = (f"mkdir {target_dir}/rootfs && "
+                   f"tar --numeric-owner -xf {target_dir}/rootfs.tar.gz -C {target_dir}/rootfs/")
+        if artifact_writer is not None:
+            # The export is copied to the artifact cache anyway, so it is indexed on the host on its way there while
+            # the orchestrator extracts it
+            with ImageIndexWriter(artifact_writer) as index_writer, ThreadPoolExecutor(max_workers=1) as executor:
+                copying = executor.submit(self._wsl_api.copy_from_instance, self._instance_name,
+                                          f"cat {target_dir}/rootfs.tar.gz", index_writer)
+                self._wsl_api.run_command_in_instance(self._instance_name, extract)
+                copying.result()
+            image_index = index_writer.index
+        else:
+            self._wsl_api.run_command_in_instance(self._instance_name, extract)
+            image_index = self._index_rootfs(target_dir)
+        self._wsl_api.run_command_in_instance(self._instance_name, f"rm {target_dir}/rootfs.tar.gz")
+        return image_index
 
-    def _config_rootfs(self, lnx_tmp_dir: str, user: str, docker_image: str, local: str | None):
+    def _index_rootfs(self, target_dir: str) -> ImageIndex:
+        # Only a listing of the extracted rootfs leaves the orchestrator instead of the whole export
+        listing = io.BytesIO()
+        self._wsl_api.copy_from_instance(self._instance_name, ImageIndex.listing_command(f"{target_dir}/rootfs"),
+                                         listing)
+        if not listing.getvalue():
+            with ImageIndexWriter() as index_writer:
+                self._wsl_api.copy_from_instance(self._instance_name, f"cat {target_dir}/rootfs.tar.gz", index_writer)
+            return index_writer.index
+        try:
+            return ImageIndex.from_listing(listing.getvalue())
+        except ValueError as e:
+            raise OrchestratorError(f"The rootfs could not be indexed: {e}") from e
+
+    def _restore_rootfs(self, source: BinaryIO, target_dir: str) -> None:
+        self._wsl_api.copy_to_instance(self._instance_name,
+                                       f"mkdir {target_dir}/rootfs && tar -xf - -C {target_dir}/rootfs/",
+                                       source)
+
+    def _environment_configs(self, config_root: str, user: str, docker_image: str,
+                             local: str | None, image_digest: str | None = None) -> list[ConfigManager]:
         wsl_config = WslConfig(
             self._wsl_api,
             self._instance_name,
-            f"{lnx_tmp_dir}/rootfs{WslConfig.CONFIG_PATH}")
+            f"{config_root}{WslConfig.CONFIG_PATH}")
         wsl_config.user = user
         weo_config = WeoConfig(
             self._wsl_api,
             self._instance_name,
-            f"{lnx_tmp_dir}/rootfs{WeoConfig.CONFIG_PATH}")
+            f"{config_root}{WeoConfig.CONFIG_PATH}")
         weo_config.version = WEO_VERSION
-        weo_config.base_image = docker_image
+        # Local images are recorded with their absolute path, so update finds them from any directory
+        weo_config.base_image = os.path.abspath(docker_image) if local else docker_image
         if local:
             weo_config.base_image_local = "true"
         else:
             weo_config.base_image_local = "false"
+        if image_digest:
+            weo_config.base_image_digest = image_digest
+        return [wsl_config, weo_config]
 
-        wsl_config.write_config()
-        weo_config.write_config()
+    def _config_rootfs(self, lnx_tmp_dir: str, user: str, docker_image: str, local: str | None,
+                       image_digest: str | None = None):
+        configs = self._environment_configs(f"{lnx_tmp_dir}/rootfs", user, docker_image, local, image_digest)
+        ConfigManager.write_configs(self._wsl_api, self._instance_name, configs)
 
     def _change_password_rootfs(self, lnx_tmp_dir: str, user: str, password: str):
         passwd_file_path = f"{lnx_tmp_dir}/rootfs/etc/passwd"
         shadow_file_path = f"{lnx_tmp_dir}/rootfs/etc/shadow"
-        passwd_file_exists = self._wsl_api.file_exists_in_instance(self._instance_name, passwd_file_path)
-        shadow_file_exists = self._wsl_api.file_exists_in_instance(self._instance_name, shadow_file_path)
-        if not passwd_file_exists or not shadow_file_exists:
-            raise ImageNotSupportedError()
+        salt = secrets.token_urlsafe(nbytes=30)
+        user_pattern = self._escape_sed_pattern(user)
 
-        user_line = self._wsl_api.run_command_in_instance(
-            self._instance_name,
-            f"cat {passwd_file_path} | grep {user}")
-        user_line = user_line.strip()
-        p = re.compile('(?P<username>[^:]*):(?P<shadow_value>[^:]*)(?P<rest>.*$)')
-        result = p.match(user_line)
-        if not result:
+        result = CommandBatch(self._wsl_api, self._instance_name) \
+            .add(f"test -f {passwd_file_path}", name="passwd_exists") \
+            .add(f"test -f {shadow_file_path}", name="shadow_exists") \
+            .add(f"grep -q '^{user_pattern}:' {passwd_file_path}", name="user_exists") \
+            .add(f"mkpasswd -m sha512 -S {salt} -P 0", capture="password_hash", stdin=True) \
+            .add(f"sed -i 's|^\\({user_pattern}:\\)[^:]*|\\1x|' {passwd_file_path}", name="passwd_update") \
+            .add(f"sed -i \"s|^\\({user_pattern}:\\)[^:]*|\\1${{password_hash}}|\" {shadow_file_path}",
+                 name="shadow_update") \
+            .run(input=password + "\n")
+
+        failed_step = result.failed_step
+        if failed_step and failed_step.name in ["passwd_exists", "shadow_exists"]:
+            raise ImageNotSupportedError()
+        if failed_step and failed_step.name == "user_exists":
             raise UserNotFoundError()
-        new_line = result.group("username") + ":x" + result.group("rest")
-        new_line = re.escape(new_line)
-        new_line = new_line.replace("/", "\\/")
-        user_line = re.escape(user_line)
-        user_line = user_line.replace("/", "\\/")
-        self._wsl_api.run_command_in_instance(
-            self._instance_name,
-            f"sed -i 's/^.*{user_line}.*$/{new_line}/' {passwd_file_path}")
+        result.check()
 
+    def _hash_password(self, password: str) -> str:
         salt = secrets.token_urlsafe(nbytes=30)
-        password = password.replace('"', '\\"')
-        passwd_line = self._wsl_api.run_command_in_instance(
-            self._instance_name,
-            f"mkpasswd -m sha512 -S {salt} \"{password}\"")
-        passwd_line = passwd_line.strip()
-        shadow_line = self._wsl_api.run_command_in_instance(
+        # The password is read from stdin, so it is neither logged nor visible in the process list
+        password_hash = self._wsl_api.run_command_in_instance(
             self._instance_name,
-            f"cat {shadow_file_path} | grep {user}")
-        shadow_line = shadow_line.strip()
-        p = re.compile('(?P<username>[^:]*):(?P<shadow_value>[^:]*)(?P<rest>.*$)')
-        result = p.match(shadow_line)
-        new_line = result.group("username") + f":{passwd_line}" + result.group("rest")
-        new_line = re.escape(new_line)
-        new_line = new_line.replace("/", "\\/")
-        shadow_line = re.escape(shadow_line)
-        shadow_line = shadow_line.replace("/", "\\/")
+            f"mkpasswd -m sha512 -S {salt} -P 0",
+            input=password + "\n")
+        return password_hash.strip()
+
+    @staticmethod
+    def _replace_password_field(content: bytes, user: str, value: str) -> bytes:
+        lines = content.decode("utf-8").split("\n")
+        for index, line in enumerate(lines):
+            fields = line.split(":")
+            if len(fields) > 1 and fields[0] == user:
+                fields[1] = value
+                lines[index] = ":".join(fields)
+                return "\n".join(lines).encode("utf-8")
+        raise UserNotFoundError()
+
+    def _stream_rootfs(self, report: RootfsReport, environment_name: str, source: BinaryIO, user: str, password: str,
+                       configs: list[ConfigManager], compression: CompressionSettings, rootfs_image: str,
+                       piped: bool, slimming: SlimmingFilter | None = None,
+                       complete: Callable[[], None] = lambda: None) -> None:
+        password_hash = self._hash_password(password)
+        transformer = RootfsTransformer()
+        if slimming:
+            transformer.exclude(slimming.excludes)
+        for config in configs:
+            transformer.replace(config.config_path, config.render().encode("utf-8"))
+        transformer.patch("/etc/passwd", lambda content: self._replace_password_field(content, user, "x"))
+        transformer.patch("/etc/shadow", lambda content: self._replace_password_field(content, user, password_hash))
+
+        def write(target: BinaryIO) -> None:
+            transformer.transform(source, target)
+            # Raised while the import still waits for the end of the rootfs, so no instance is created
+            if transformer.missing_patches:
+                raise ImageNotSupportedError()
+            complete()
+
+        start = time.perf_counter()
+        if piped:
+            # The rootfs never touches a disk, so compressing it would only cost time
+            report.archive_size = self._wsl_api.import_instance_from(environment_name, write)
+            report.piped = True
+            report.import_duration = time.perf_counter() - start
+        else:
+            with open(rootfs_image, "wb") as rootfs_file, compression.open_writer(rootfs_file) as writer:
+                write(writer)
+            report.pack_duration = time.perf_counter() - start
+        if not slimming:
+            return
+        # Streamed slimming happens while the rootfs is packed, so it has no duration of its own
+        report.slimming = SlimmingReport(slimming.names)
+        report.slimming.size_before = transformer.size_before
+        report.slimming.size_after = transformer.size_after
+        report.slimming.removed_entries = transformer.excluded_members
+        report.slimming.duration = None
+
+    def _slim_rootfs(self, lnx_tmp_dir: str, slimming: SlimmingFilter) -> SlimmingReport:
+        start = time.perf_counter()
+        report = SlimmingReport(slimming.names)
+        # du lists every entry with its disk usage, directories with the usage of everything below them
+        listing = self._wsl_api.run_command_in_instance(self._instance_name, f"cd {lnx_tmp_dir}/rootfs && du -ak .")
+        sizes = {}
+        for line in listing.splitlines():
+            size, _, path = line.partition("\t")
+            if size.isdigit() and path.startswith("."):
+                sizes[path[2:]] = int(size) * 1024
+        report.size_before = sizes.pop("", 0)
+        directories = {path.rpartition("/")[0] for path in sizes}
+        removals, report.removed_entries = slimming.removals(list(sizes), directories)
+        if removals:
+            self._wsl_api.stream_to_instance(
+                self._instance_name, f"cd {lnx_tmp_dir}/rootfs && xargs -0 rm -rf --",
+                lambda stdin: stdin.write(b"\0".join(path.encode("utf-8") for path in removals)))
+        report.size_after = report.size_before - sum(sizes[path] for path in removals)
+        report.duration = time.perf_counter() - start
+        return report
+
+    def _pack_rootfs(self, batch: CommandBatch, tmp_dir: str, compression: CompressionSettings):
+        rootfs_file_name = compression.file_name(self._rootfs_base_name)
+        package = compression.shell_package()
+        if package:
+            batch.add(f"command -v {package} > /dev/null || apk add --no-cache {package}")
+        compressor = compression.shell_command()
+        if not compressor:
+            batch.add(f"cd '{tmp_dir}' && tar -cf {rootfs_file_name} -C rootfs .")
+        else:
+            batch.add(f"set -o pipefail && cd '{tmp_dir}' && "
+                      f"tar -cf - -C rootfs . | {compressor} > {rootfs_file_name}")
+
+    def _move_rootfs(self, batch: CommandBatch, src_dir: str, target_dir: str, compression: CompressionSettings):
+        rootfs_file_name = compression.file_name(self._rootfs_base_name)
+        batch.add(f"cd {src_dir} && mv {rootfs_file_name} {WslApi.linuxify(target_dir)}")
+
+    def _pipe_rootfs(self, report: RootfsReport, environment_name: str, lnx_tmp_dir: str) -> bool:
+        start = time.perf_counter()
+        pack = self._wsl_api.open_command_in_instance(self._instance_name, f"cd {lnx_tmp_dir} && tar -cf - -C rootfs .")
+        stderr_reader = StderrReader(pack)
+        try:
+            transferred = self._wsl_api.import_instance(environment_name, pack.stdout)
+        except WslApiError:
+            transferred = None
+            # Nobody reads the rootfs anymore, the pack would block on the pipe forever
+            pack.kill()
+        except BaseException:
+            pack.kill()
+            raise
+        finally:
+            pack.stdout.close()
+            stderr = stderr_reader.text()
+            pack.wait()
+        if transferred is None:
+            # WSL versions which cannot import from stdin fail right away, the rootfs is still there to be staged
+            return False
+        if pack.returncode != 0:
+            # A truncated rootfs is imported without complaint, but misses files
+            self._wsl_api.remove_instance(environment_name)
+            raise WslApiError("Rootfs could not be packed. Stderr: " + stderr)
+        report.archive_size = transferred
+        report.piped = True
+        report.import_duration = time.perf_counter() - start
+        return True
+
+    @staticmethod
+    def _new_work_dir() -> str:
+        return GarbageCollector.WORK_DIR_PREFIX + ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+
+    @staticmethod
+    def _create_work_dir(lnx_tmp_dir: str, tmp_docker_tag: str, environment_name: str) -> str:
+        return f"mkdir -p {lnx_tmp_dir} && {WorkDirOwner.write_command(lnx_tmp_dir, tmp_docker_tag, environment_name)}"
+
+    def _cleanup_work_dir(self, lnx_tmp_dir: str, tmp_docker_tag: str, docker_lease: DockerDaemonLease,
+                          docker_cache: DockerCache, enforce_budget: bool = True):
+        # Called from finally, a failing cleanup must not mask the error which aborted the operation
+        failed = sys.exc_info()[0] is not None
+        try:
+            self._wsl_api.run_command_in_instance(self._instance_name, f"rm -rf {lnx_tmp_dir}")
+            if docker_lease.held:
+                self._cleanup_docker(tmp_docker_tag, docker_cache, enforce_budget)
+        except (WslApiError, OrchestratorError):
+            # Leftovers are found again by the garbage collection
+            if not failed:
+                raise
+
+    def _cleanup_docker(self, tmp_docker_tag: str, docker_cache: DockerCache, enforce_budget: bool = True):
+        with self._docker_daemon:
+            self._wsl_api.run_command_in_instance(self._instance_name,
+                                                  f"docker image rm {tmp_docker_tag} > /dev/null 2>&1 || true")
+            if enforce_budget:
+                docker_cache.enforce()
+                self._prune_build_contexts(self._CONTEXT_MAX_AGE_DAYS)
+
+    def _prune_build_contexts(self, max_age_days: int | None = None) -> None:
+        if max_age_days is None:
+            self._wsl_api.run_command_in_instance(self._instance_name, f"rm -rf {self._CONTEXTS_DIR}")
+            return
         self._wsl_api.run_command_in_instance(
             self._instance_name,
-            f"sed -i 's/^.*{shadow_line}.*$/{new_line}/' {shadow_file_path}")
+            f"[ ! -d {self._CONTEXTS_DIR} ] || find {self._CONTEXTS_DIR} -mindepth 1 -maxdepth 1 -type d "
+            f"-mtime +{max_age_days} | xargs -r rm -rf")
 
-    def _pack_rootfs(self, tmp_dir: str):
-        self._wsl_api.run_command_in_instance(self._instance_name,
-                                              f"cd '{tmp_dir}' && tar -cjf {self._rootfs_file_name} -C rootfs .")
+    def _read_orchestrator_config(self) -> WeoConfig:
+        weo_config = WeoConfig(self._wsl_api, self._instance_name)
+        weo_config.read_config()
+        return weo_config
 
-    def _move_rootfs(self, src_dir: str, target_dir: str):
-        self._wsl_api.run_command_in_instance(self._instance_name,
-                                              f"cd {src_dir} && mv {self._rootfs_file_name} {WslApi.linuxify(target_dir)}")
+    @staticmethod
+    def _config_number(option: str, value: str) -> int:
+        # The orchestrator config can be edited by hand, so its values are validated where they are used
+        if not value.strip().isdigit():
+            raise OrchestratorError(f"Invalid value \"{value}\" for {option} in the orchestrator config "
+                                    f"{WeoConfig.CONFIG_PATH}, expected a number")
+        return int(value)
 
-    def _cleanup_docker(self):
-        with DockerDaemon(self._instance_name):
-            self._wsl_api.run_command_in_instance(self._instance_name,
-                                                  "echo y | docker system prune -a")
+    @classmethod
+    def _default_compression(cls, orchestrator_config: WeoConfig) -> CompressionSettings:
+        level = orchestrator_config.compression_level
+        level = None if level == "default" else cls._config_number("compression_level", level)
+        threads = cls._config_number("compression_threads", orchestrator_config.compression_threads)
+        try:
+            return CompressionSettings(Compression(orchestrator_config.compression), level, threads)
+        except ValueError as e:
+            raise OrchestratorError(f"Invalid rootfs compression in the orchestrator config "
+                                    f"{WeoConfig.CONFIG_PATH}: {e}") from e
+
+    def _docker_cache(self, orchestrator_config: WeoConfig) -> DockerCache:
+        return DockerCache(self._wsl_api, self._instance_name, self._docker_daemon,
+                           self._config_number("docker_budget_mb", orchestrator_config.docker_cache_budget_mb))
+
+    @classmethod
+    def _artifact_cache_budget(cls, orchestrator_config: WeoConfig) -> int:
+        return cls._config_number("artifact_budget_mb", orchestrator_config.artifact_cache_budget_mb) * 1024 * 1024
+
+    def docker_cache_usage(self) -> DockerCacheUsage:
+        with self._wsl_api.session(self._instance_name), self._docker_daemon:
+            return self._docker_cache(self._read_orchestrator_config()).usage()
+
+    def prune_docker_cache(self, everything: bool = False) -> list[DockerImageUsage]:
+        with self._wsl_api.session(self._instance_name), self._docker_daemon:
+            docker_cache = self._docker_cache(self._read_orchestrator_config())
+            if everything:
+                docker_cache.prune()
+                self._prune_build_contexts()
+                return []
+            self._prune_build_contexts(self._CONTEXT_MAX_AGE_DAYS)
+            return docker_cache.enforce()
 
     def create(self, step_desc: Callable[[str], None] , docker_image: str, environment_name: str, local: str | None, environment_password: str,
-               user: str | None = None) -> None:
+               user: str | None = None, streaming: bool = False,
+               compression: CompressionSettings | None = None,
+               artifact_cache: ArtifactCache | None = None, enforce_docker_budget: bool = True,
+               build_timeout: float | None = None, slimming: SlimmingFilter | None = None,
+               fill_artifact_cache: bool = False) -> RootfsReport:
         if self._wsl_api.instance_exists(environment_name):
             raise EnvironmentExistsError()
+        report = RootfsReport()
         tmp_docker_tag = "weo:" + ''.join(random.choices(string.ascii_uppercase + string.digits, k=15))
-        with TemporaryDirectory() as temp_dir:
+        tracer = get_tracer()
+        # Every reported step is also recorded as a span while a profile is written
+        step_desc = tracer.steps("create", step_desc)
+        with tracer.span(f"create {environment_name}", "create", image=docker_image, streaming=streaming), \
+                TemporaryDirectory() as temp_dir, self._wsl_api.session(self._instance_name), \
+                DockerDaemonLease(self._docker_daemon) as docker_lease:
             step_desc("Preparing directory")
-            lnx_tmp_dir = '/tmp/' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-            self._wsl_api.run_command_in_instance(self._instance_name, f"mkdir -p {lnx_tmp_dir}")
+            lnx_tmp_dir = self._new_work_dir()
+            orchestrator_config = self._read_orchestrator_config()
+            docker_cache = self._docker_cache(orchestrator_config)
+            try:
+                if not compression:
+                    compression = self._default_compression(orchestrator_config)
+                piped = orchestrator_config.rootfs_import == "pipe"
+                if streaming and not piped and not compression.streamable:
+                    raise CompressionNotSupportedError(
+                        f"Compression {compression.compression.value} is not supported for streamed rootfs")
+                rootfs_image = os.path.join(temp_dir, compression.file_name(self._rootfs_base_name))
+
+                image_digest = None
+                artifact_key = None
+                artifact_entry = None
+                if artifact_cache:
+                    step_desc("Looking up cached rootfs")
+                    image_digest = self._resolve_image_digest(docker_image, local, docker_lease)
+                    artifact_key = ArtifactCache.key(image_digest)
+                    artifact_entry = artifact_cache.lookup(artifact_key)
+
+                batch = CommandBatch(self._wsl_api, self._instance_name) \
+                    .add(self._create_work_dir(lnx_tmp_dir, tmp_docker_tag, environment_name))
+                if not artifact_entry:
+                    step_desc("Preparing dockerfile")
+                    self._prepare_dockerfile(batch, docker_image, local, lnx_tmp_dir)
+                batch.run().check()
+
+                image_index = None
+                if artifact_entry:
+                    user = user or artifact_entry.user
+                    try:
+                        with artifact_cache.open(artifact_entry) as artifact, ImageIndexWriter() as index_writer:
+                            source = TeeReader(artifact.stream, index_writer)
+                            if streaming:
+                                step_desc("Streaming cached rootfs")
+                                configs = self._environment_configs("", user, docker_image, local, image_digest)
+                                # A corrupted artifact has to be detected before the import completes
+                                self._stream_rootfs(report, environment_name, source, user,
+                                                    environment_password, configs, compression, rootfs_image, piped,
+                                                    slimming, artifact.verify)
+                            else:
+                                step_desc("Restoring cached rootfs")
+                                self._restore_rootfs(source, lnx_tmp_dir)
+                                artifact.verify()
+                        image_index = index_writer.index
+                    except ArtifactCorruptedError:
+                        step_desc("Cached rootfs is corrupted, rebuilding")
+                        artifact_cache.remove(artifact_entry)
+                        artifact_entry = None
+                        batch = CommandBatch(self._wsl_api, self._instance_name) \
+                            .add(f"rm -rf {lnx_tmp_dir}") \
+                            .add(self._create_work_dir(lnx_tmp_dir, tmp_docker_tag, environment_name))
+                        self._prepare_dockerfile(batch, docker_image, local, lnx_tmp_dir)
+                        batch.run().check()
+
+                if not artifact_entry:
+                    step_desc("Creating image")
+                    docker_lease.acquire()
+                    self._create_image(tmp_docker_tag, lnx_tmp_dir, step_desc, build_timeout)
+                    docker_cache.record_usage(tmp_docker_tag)
+                    # A streamed export passes the host anyway, an extracted one would have to be copied out once more
+                    fill_cache = artifact_cache is not None and (streaming or fill_artifact_cache)
+                    if not user or fill_cache:
+                        step_desc("Identifying user")
+                        image_user = self._get_docker_user(tmp_docker_tag)
+                        user = user or image_user
+                    # The cached rootfs is shared by all users, so it records the default user of the image
+                    artifact_store = artifact_cache.store(artifact_key, docker_image, image_user) \
+                        if fill_cache else nullcontext()
+                    with artifact_store as artifact_writer:
+                        if streaming:
+                            step_desc("Streaming rootfs")
+                            configs = self._environment_configs("", user, docker_image, local, image_digest)
+                            with self._export_rootfs(tmp_docker_tag) as export, \
+                                    ImageIndexWriter(artifact_writer) as index_writer:
+                                source = TeeReader(export, index_writer)
+                                self._stream_rootfs(report, environment_name, source, user, environment_password,
+                                                    configs, compression, rootfs_image, piped, slimming,
+                                                    source.drain if artifact_writer else lambda: None)
+                            image_index = index_writer.index
+                        else:
+                            step_desc("Getting rootfs")
+                            image_index = self._get_rootfs(tmp_docker_tag, lnx_tmp_dir, artifact_writer)
+                    if fill_cache:
+                        artifact_cache.evict(self._artifact_cache_budget(orchestrator_config))
+
+                if not streaming:
+                    if slimming:
+                        step_desc("Slimming rootfs")
+                        report.slimming = self._slim_rootfs(lnx_tmp_dir, slimming)
+                    step_desc("Configuring rootfs")
+                    self._config_rootfs(lnx_tmp_dir, user, docker_image, local, image_digest)
+                    step_desc("Adjusting password")
+                    self._change_password_rootfs(lnx_tmp_dir, user, environment_password)
+                    if piped:
+                        step_desc("Piping rootfs into WSL instance")
+                        if not self._pipe_rootfs(report, environment_name, lnx_tmp_dir):
+                            step_desc("Piped import failed, staging rootfs")
+                    if not report.piped:
+                        step_desc("Packing and moving rootfs")
+                        pack_start = time.perf_counter()
+                        batch = CommandBatch(self._wsl_api, self._instance_name)
+                        self._pack_rootfs(batch, lnx_tmp_dir, compression)
+                        self._move_rootfs(batch, lnx_tmp_dir, temp_dir, compression)
+                        batch.run().check()
+                        report.pack_duration = time.perf_counter() - pack_start
+                if not report.piped:
+                    report.archive_size = os.path.getsize(rootfs_image)
+                    step_desc("Creating WSL instance")
+                    import_start = time.perf_counter()
+                    self._wsl_api.create_instance(environment_name, rootfs_image)
+                    report.import_duration = time.perf_counter() - import_start
+                step_desc("Recording image files")
+                self._write_image_index(environment_name, image_index)
+            finally:
+                step_desc.close()
+                with tracer.span("Cleaning up", "create"):
+                    self._cleanup_work_dir(lnx_tmp_dir, tmp_docker_tag, docker_lease, docker_cache,
+                                           enforce_docker_budget)
+        return report
+
+    def prefetch(self, step_desc: Callable[[str], None], docker_image: str, local: str | None,
+                 artifact_cache: ArtifactCache, refresh: bool = False,
+                 build_timeout: float | None = None) -> tuple[ArtifactCacheEntry, bool]:
+        tmp_docker_tag = "weo:" + ''.join(random.choices(string.ascii_uppercase + string.digits, k=15))
+        tracer = get_tracer()
+        step_desc = tracer.steps("prefetch", step_desc)
+        with tracer.span(f"prefetch {docker_image}", "prefetch", image=docker_image, refresh=refresh), \
+                self._wsl_api.session(self._instance_name), \
+                DockerDaemonLease(self._docker_daemon) as docker_lease:
+            lnx_tmp_dir = None
+            docker_cache = None
             try:
+                step_desc("Resolving image")
+                # The rootfs is stored under the same key a later create of the image looks up
+                image_digest = self._resolve_image_digest(docker_image, local, docker_lease)
+                artifact_key = ArtifactCache.key(image_digest)
+                artifact_entry = artifact_cache.lookup(artifact_key)
+                if artifact_entry and not refresh:
+                    artifact_cache.touch(artifact_entry)
+                    return artifact_entry, False
+
                 step_desc("Preparing dockerfile")
-                self._prepare_dockerfile(docker_image, local, lnx_tmp_dir)
+                lnx_tmp_dir = self._new_work_dir()
+                orchestrator_config = self._read_orchestrator_config()
+                docker_cache = self._docker_cache(orchestrator_config)
+                batch = CommandBatch(self._wsl_api, self._instance_name) \
+                    .add(self._create_work_dir(lnx_tmp_dir, tmp_docker_tag, "-"))
+                self._prepare_dockerfile(batch, docker_image, local, lnx_tmp_dir)
+                batch.run().check()
+
                 step_desc("Creating image")
-                self._create_image(tmp_docker_tag, lnx_tmp_dir)
-                if not user:
-                    step_desc("Identifying user")
-                    user = self._get_docker_user(tmp_docker_tag)
-                step_desc("Getting rootfs")
-                self._get_rootfs(tmp_docker_tag, lnx_tmp_dir)
-                step_desc("Configuring rootfs")
-                self._config_rootfs(lnx_tmp_dir, user, docker_image, local)
-                step_desc("Adjusting password")
-                self._change_password_rootfs(lnx_tmp_dir, user, environment_password)
-                step_desc("Packing rootfs")
-                self._pack_rootfs(lnx_tmp_dir)
-                step_desc("Moving rootfs")
-                self._move_rootfs(lnx_tmp_dir, temp_dir)
-                rootfs_image = os.path.join(temp_dir, self._rootfs_file_name)
-                step_desc("Creating WSL instance")
-                self._wsl_api.create_instance(environment_name, rootfs_image)
+                docker_lease.acquire()
+                self._create_image(tmp_docker_tag, lnx_tmp_dir, step_desc, build_timeout)
+                docker_cache.record_usage(tmp_docker_tag)
+                step_desc("Identifying user")
+                image_user = self._get_docker_user(tmp_docker_tag)
+                step_desc("Storing rootfs")
+                # The exported tar goes straight into the cache, it is never extracted on the orchestrator
+                with artifact_cache.store(artifact_key, docker_image, image_user) as artifact_writer, \
+                        self._export_rootfs(tmp_docker_tag) as export:
+                    while chunk := export.read(WslApi.BUFFER_SIZE):
+                        artifact_writer.write(chunk)
+                artifact_cache.evict(self._artifact_cache_budget(orchestrator_config))
+                return artifact_cache.lookup(artifact_key), True
             finally:
-                self._wsl_api.run_command_in_instance(self._instance_name, f"rm -r {lnx_tmp_dir}")
-                self._cleanup_docker()
+                step_desc.close()
+                if lnx_tmp_dir:
+                    with tracer.span("Cleaning up", "prefetch"):
+                        self._cleanup_work_dir(lnx_tmp_dir, tmp_docker_tag, docker_lease, docker_cache)
 
-    def remove(self, environment_name: str) -> None:
+    @staticmethod
+    def _escape_sed_pattern(value: str) -> str:
+        return re.sub(r"([.\[\]*^$\\])", r"\\\1", value)
+
+    def collect_garbage(self, dry_run: bool = False, host_temp_dirs: list[str] | None = None,
+                        keep_docker_daemon: bool = False) -> GarbageReport:
+        docker_cache = self._docker_cache(self._read_orchestrator_config())
+        garbage_collector = GarbageCollector(
+            self._wsl_api, self._instance_name, self._docker_daemon, docker_cache, self._CONTEXTS_DIR,
+            [self._templates.templates_dir] + (host_temp_dirs or []), keep_docker_daemon)
+        return garbage_collector.collect(dry_run)
+
+    def missing_tools(self) -> list[str]:
+        batch = CommandBatch(self._wsl_api, self._instance_name)
+        for tool in self._REQUIRED_TOOLS:
+            batch.add(f"command -v {tool} > /dev/null && echo OK || echo MISSING", name=tool)
+        result = batch.run()
+        result.check()
+        return [tool for tool in self._REQUIRED_TOOLS if result[tool].stdout.strip() != "OK"]
+
+    def export_environment(self, environment_name: str, target_path: str,
+                           compression: CompressionSettings) -> EnvironmentTransfer:
         if not self._wsl_api.instance_exists(environment_name):
             raise EnvironmentNotFoundError()
+        if not compression.streamable:
+            raise CompressionNotSupportedError(
+                f"Compression {compression.compression.value} is not supported for exports")
         weo_config = WeoConfig(self._wsl_api, environment_name)
-        weo_config.read_config()
-        if not Version.is_compatible(Version.parse(WEO_VERSION), Version.parse(weo_config.version)):
+        wsl_config = WslConfig(self._wsl_api, environment_name)
+        ConfigManager.read_configs(self._wsl_api, environment_name, [weo_config, wsl_config])
+
+        start = time.perf_counter()
+        temp_path = f"{target_path}.tmp-{secrets.token_hex(4)}"
+        try:
+            # The exported tar is compressed while it is streamed, it never exists uncompressed on disk
+            with open(temp_path, "wb") as file:
+                hashing_file = HashingFile(file)
+                with compression.open_writer(hashing_file) as writer:
+                    rootfs_size = self._wsl_api.export_instance(environment_name, writer)
+            os.replace(temp_path, target_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        duration = time.perf_counter() - start
+
+        EnvironmentArchiveManifest(
+            environment_name, weo_config.version, compression.compression, hashing_file.size,
+            hashing_file.hash.hexdigest(), rootfs_size, time.time(), weo_config.to_dict(),
+            wsl_config.user).save(target_path)
+        return EnvironmentTransfer(environment_name, target_path, rootfs_size, hashing_file.size, duration)
+
+    @staticmethod
+    def _check_environment_version(weo_config: WeoConfig) -> None:
+        # The config of an environment can be edited by hand, an invalid version makes it as foreign as an old one
+        try:
+            version = Version.parse(weo_config.version)
+        except (ValueError, TypeError) as e:
+            raise OrchestratorIncompatibleError(
+                f"The environment records the invalid WEO version {weo_config.version}") from e
+        if not Version.is_compatible(Version.parse(WEO_VERSION), version):
             raise OrchestratorIncompatibleError()
+
+    @staticmethod
+    def _check_archive_version(manifest: EnvironmentArchiveManifest, kind: str) -> None:
+        # Manifests can be edited by hand or come from another tool, so the version is not trusted to be valid
+        if not isinstance(manifest.weo_version, str) or not Version.is_valid(manifest.weo_version):
+            raise EnvironmentArchiveError(f"The {kind} manifest contains the invalid WEO version "
+                                          f"{manifest.weo_version}")
+        if not Version.is_compatible(Version.parse(WEO_VERSION), Version.parse(manifest.weo_version)):
+            raise EnvironmentArchiveError(
+                f"The {kind} was created by the incompatible WEO version {manifest.weo_version}")
+
+    def import_environment(self, archive_path: str, environment_name: str | None = None) -> EnvironmentTransfer:
+        manifest = EnvironmentArchiveManifest.load(archive_path)
+        environment_name = environment_name or manifest.environment_name
+        if self._wsl_api.instance_exists(environment_name):
+            raise EnvironmentExistsError()
+        self._check_archive_version(manifest, "archive")
+
+        start = time.perf_counter()
+        try:
+            with open(archive_path, "rb") as file:
+                hashing_file = HashingFile(file)
+                reader = manifest.compression_settings.open_reader(hashing_file)
+                rootfs_size = self._wsl_api.import_instance(environment_name, reader)
+                # The checksum covers the whole file, including anything behind the compressed stream
+                while hashing_file.read(WslApi.BUFFER_SIZE):
+                    pass
+            if hashing_file.size != manifest.size or hashing_file.hash.hexdigest() != manifest.sha256:
+                raise EnvironmentArchiveError(f"The checksum of {archive_path} does not match its manifest")
+        except (EnvironmentArchiveError, OSError, EOFError, zlib.error) as e:
+            # The archive is verified while it is imported, so a corrupted archive removes the new instance again
+            if self._wsl_api.instance_exists(environment_name):
+                self._wsl_api.remove_instance(environment_name)
+            if isinstance(e, EnvironmentArchiveError):
+                raise
+            raise EnvironmentArchiveError(f"{archive_path} could not be imported: {e}") from e
+        return EnvironmentTransfer(environment_name, archive_path, rootfs_size, hashing_file.size,
+                                   time.perf_counter() - start)
+
+    def add_template(self, environment_name: str, template_name: str, overwrite: bool = False) -> EnvironmentTransfer:
+        template_path = self._templates.path(template_name)
+        if self._templates.exists(template_name) and not overwrite:
+            raise TemplateExistsError()
+        os.makedirs(self._templates.templates_dir, exist_ok=True)
+        # Templates are stored uncompressed, so every clone is imported straight from the file
+        return self.export_environment(environment_name, template_path, TemplateStore.COMPRESSION)
+
+    def create_from_template(self, step_desc: Callable[[str], None], template_name: str, environment_name: str,
+                             environment_password: str, user: str | None = None) -> RootfsReport:
+        template = self._templates.get(template_name)
+        if self._wsl_api.instance_exists(environment_name):
+            raise EnvironmentExistsError()
+        manifest = template.manifest
+        self._check_archive_version(manifest, "template")
+        user = user or manifest.user
+        report = RootfsReport()
+        report.archive_size = manifest.size
+
+        step_desc("Hashing password")
+        password_hash = self._hash_password(environment_password)
+        step_desc("Importing template")
+        import_start = time.perf_counter()
+        self._wsl_api.create_instance(environment_name, template.path)
+        report.import_duration = time.perf_counter() - import_start
+        try:
+            step_desc("Configuring environment")
+            self._config_clone(environment_name, template_name, user, password_hash)
+            # The clone was started for its configuration, the next start has to read the new wsl.conf
+            self._wsl_api.terminate_instance(environment_name)
+        except BaseException:
+            self._wsl_api.remove_instance(environment_name)
+            raise
+        return report
+
+    def _config_clone(self, environment_name: str, template_name: str, user: str, password_hash: str) -> None:
+        weo_config = WeoConfig(self._wsl_api, environment_name)
+        wsl_config = WslConfig(self._wsl_api, environment_name)
+        user_pattern = self._escape_sed_pattern(user)
+        with self._wsl_api.session(environment_name):
+            ConfigManager.read_configs(self._wsl_api, environment_name, [weo_config, wsl_config])
+            weo_config.version = WEO_VERSION
+            weo_config.template = template_name
+            wsl_config.user = user
+            batch = CommandBatch(self._wsl_api, environment_name) \
+                .add("test -f /etc/passwd -a -f /etc/shadow", name="files_exist") \
+                .add(f"grep -q '^{user_pattern}:' /etc/passwd", name="user_exists") \
+                .add(f"sed -i 's|^\\({user_pattern}:\\)[^:]*|\\1x|' /etc/passwd") \
+                .add("cat", capture="password_hash", stdin=True) \
+                .add(f"sed -i \"s|^\\({user_pattern}:\\)[^:]*|\\1${{password_hash}}|\" /etc/shadow")
+            for config in [weo_config, wsl_config]:
+                config.add_write_steps(batch)
+            # The hash is passed as input, so it is not part of the logged command
+            result = batch.run(input=password_hash + "\n")
+        failed_step = result.failed_step
+        if failed_step and failed_step.name == "files_exist":
+            raise ImageNotSupportedError()
+        if failed_step and failed_step.name == "user_exists":
+            raise UserNotFoundError()
+        result.check()
+
+    def update(self, step_desc: Callable[[str], None], environment_name: str, docker_image: str | None = None,
+               local: str | None = None, keep: list[str] | None = None, dry_run: bool = False, force: bool = False,
+               build_timeout: float | None = None, enforce_docker_budget: bool = True) -> RootfsDiffReport:
+        if not self._wsl_api.instance_exists(environment_name):
+            raise EnvironmentNotFoundError()
+        report = RootfsDiffReport(dry_run)
+        tmp_docker_tag = "weo:" + ''.join(random.choices(string.ascii_uppercase + string.digits, k=15))
+        tracer = get_tracer()
+        step_desc = tracer.steps("update", step_desc)
+        with tracer.span(f"update {environment_name}", "update", image=docker_image, dry_run=dry_run), \
+                self._wsl_api.session(self._instance_name), \
+                DockerDaemonLease(self._docker_daemon) as docker_lease:
+            lnx_tmp_dir = self._new_work_dir()
+            docker_cache = self._docker_cache(self._read_orchestrator_config())
+            try:
+                step_desc("Reading environment configuration")
+                weo_config = self._read_updatable_config(environment_name)
+                if not docker_image:
+                    docker_image = weo_config.base_image
+                    local = self._local_image_kind(docker_image) if weo_config.base_image_local == "true" else None
+                step_desc("Resolving image")
+                image_digest = self._resolve_image_digest(docker_image, local, docker_lease)
+                if image_digest == weo_config.base_image_digest and not force:
+                    report.up_to_date = True
+                    return report
+
+                diff = RootfsDiff(self._read_image_index(environment_name), keep)
+                with self._index_environment(diff, environment_name, report) as wait_for_index:
+                    step_desc("Preparing dockerfile")
+                    batch = CommandBatch(self._wsl_api, self._instance_name) \
+                        .add(self._create_work_dir(lnx_tmp_dir, tmp_docker_tag, environment_name))
+                    self._prepare_dockerfile(batch, docker_image, local, lnx_tmp_dir)
+                    batch.run().check()
+                    step_desc("Creating image")
+                    docker_lease.acquire()
+                    # Images from a registry were just pulled to resolve their digest, local ones pull their bases
+                    self._create_image(tmp_docker_tag, lnx_tmp_dir, step_desc, build_timeout, pull=bool(local))
+                    docker_cache.record_usage(tmp_docker_tag)
+                    step_desc("Indexing environment")
+                    wait_for_index()
+
+                step_desc("Comparing rootfs")
+                with TemporaryFile() as changes:
+                    diff_start = time.perf_counter()
+                    with self._export_rootfs(tmp_docker_tag) as export:
+                        diff.compare(export, changes, report)
+                    # Without added or changed entries the archive only consists of its end marker
+                    report.transfer_size = changes.tell() if report.added or report.changed else 0
+                    report.diff_duration = time.perf_counter() - diff_start
+                    if dry_run:
+                        return report
+                    if not report.empty:
+                        step_desc("Applying changes")
+                        apply_start = time.perf_counter()
+                        changes.seek(0)
+                        self._apply_rootfs_diff(environment_name, diff, changes if report.transfer_size else None)
+                        report.apply_duration = time.perf_counter() - apply_start
+
+                step_desc("Updating configuration")
+                # The new image is the base of the next update
+                self._write_image_index(environment_name, diff.new_image_index)
+                weo_config.version = WEO_VERSION
+                weo_config.base_image = os.path.abspath(docker_image) if local else docker_image
+                weo_config.base_image_local = "true" if local else "false"
+                weo_config.base_image_digest = image_digest
+                ConfigManager.write_configs(self._wsl_api, environment_name, [weo_config])
+            finally:
+                step_desc.close()
+                with tracer.span("Cleaning up", "update"):
+                    self._cleanup_work_dir(lnx_tmp_dir, tmp_docker_tag, docker_lease, docker_cache,
+                                           enforce_docker_budget)
+        return report
+
+    def _read_updatable_config(self, environment_name: str) -> WeoConfig:
+        weo_config = WeoConfig(self._wsl_api, environment_name)
+        with self._wsl_api.session(environment_name):
+            weo_config.read_config()
+            # The changes are applied by the tools of the environment itself
+            has_tar = self._wsl_api.execute_in_instance(environment_name, "command -v tar").returncode == 0
+        self._check_environment_version(weo_config)
+        if weo_config.base_image.lower() == "none":
+            raise EnvironmentNotUpdatableError("The environment does not record the image it was created from")
+        if not has_tar:
+            raise EnvironmentNotUpdatableError("Updating an environment requires tar within the environment")
+        return weo_config
+
+    def _read_image_index(self, environment_name: str) -> ImageIndex:
+        content = io.BytesIO()
+        self._wsl_api.copy_from_instance(environment_name,
+                                         f"[ ! -f {ImageIndex.PATH} ] || cat {ImageIndex.PATH}", content)
+        if not content.getvalue():
+            raise EnvironmentNotUpdatableError(f"The environment does not record the files of its image in "
+                                               f"{ImageIndex.PATH}, it has to be recreated to be updated")
+        try:
+            return ImageIndex.loads(content.getvalue())
+        except ValueError as e:
+            raise EnvironmentNotUpdatableError(f"The recorded files of the image in {ImageIndex.PATH} are "
+                                               f"corrupted: {e}") from e
+
+    def _write_image_index(self, environment_name: str, image_index: ImageIndex) -> None:
+        index_dir = ImageIndex.PATH.rpartition("/")[0]
+        self._wsl_api.copy_to_instance(environment_name,
+                                       f"mkdir -p {index_dir} && cat > {ImageIndex.PATH}.tmp && "
+                                       f"mv {ImageIndex.PATH}.tmp {ImageIndex.PATH}",
+                                       io.BytesIO(image_index.dumps()))
+
+    @staticmethod
+    def _local_image_kind(path: str) -> str:
+        if os.path.isdir(path):
+            return "DIR"
+        if os.path.isfile(path):
+            return "FILE"
+        raise EnvironmentNotUpdatableError(f"The local image {path} of the environment does not exist anymore, "
+                                           f"pass the image to update to explicitly")
+
+    @contextmanager
+    def _index_environment(self, diff: RootfsDiff, environment_name: str, report: RootfsDiffReport):
+        # The environment is exported and indexed while the new image is built
+        export = self._wsl_api.open_export_instance(environment_name)
+        stderr_reader = StderrReader(export)
+
+        def index() -> None:
+            start = time.perf_counter()
+            diff.index(export.stdout)
+            # The end of the archive can be followed by padding, the export only exits once it is read
+            while export.stdout.read(WslApi.BUFFER_SIZE):
+                pass
+            report.index_duration = time.perf_counter() - start
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        indexing = executor.submit(index)
+
+        def wait() -> None:
+            indexing.result()
+            stderr = stderr_reader.text()
+            if export.wait() != 0:
+                raise WslApiError("Environment could not be exported. Stderr: " + stderr)
+
+        try:
+            yield wait
+        finally:
+            if not indexing.done():
+                export.kill()
+            executor.shutdown(wait=True)
+            stderr_reader.text()
+            export.stdout.close()
+            export.stderr.close()
+            export.wait()
+
+    def _apply_rootfs_diff(self, environment_name: str, diff: RootfsDiff, changes: BinaryIO | None) -> None:
+        files, directories = diff.removals()
+        account_lines = diff.account_lines()
+        # Removals come first, a directory replaced by a file or the other way round is not extracted over
+        if files or directories or account_lines:
+            script = self._removal_script(files, directories) + self._account_script(account_lines)
+            self._wsl_api.stream_to_instance(environment_name, "cd / && sh -s", lambda stdin: stdin.write(script))
+        if changes is not None:
+            self._wsl_api.copy_to_instance(environment_name, "tar -xf - -C /", changes)
+
+    @classmethod
+    def _removal_script(cls, files: list[str], directories: list[str]) -> bytes:
+        lines = []
+        for index in range(0, len(files), cls._REMOVAL_BATCH_SIZE):
+            paths = " ".join(shlex.quote(path) for path in files[index:index + cls._REMOVAL_BATCH_SIZE])
+            lines.append(f"rm -f -- {paths} || exit 1")
+        # Directories which still contain kept files stay
+        for index in range(0, len(directories), cls._REMOVAL_BATCH_SIZE):
+            paths = " ".join(shlex.quote(path) for path in directories[index:index + cls._REMOVAL_BATCH_SIZE])
+            lines.append(f"rmdir -- {paths} 2> /dev/null || true")
+        return ("\n".join(lines) + "\n").encode("utf-8", errors="surrogateescape")
+
+    @staticmethod
+    def _account_script(account_lines: dict[str, list[str]]) -> bytes:
+        lines = []
+        for path, accounts in account_lines.items():
+            path = shlex.quote(path)
+            # A file without a final newline would join its last line with the first added account
+            lines.append(f"[ -z \"$(tail -c 1 {path})\" ] || echo >> {path}")
+            lines.append(f"printf '%s\\n' {' '.join(shlex.quote(line) for line in accounts)} >> {path} || exit 1")
+        return ("\n".join(lines) + "\n").encode("utf-8", errors="surrogateescape")
+
+    def remove(self, environment_name: str) -> None:
+        if not self._wsl_api.instance_exists(environment_name):
+            raise EnvironmentNotFoundError()
+        weo_config = WeoConfig(self._wsl_api, environment_name)
+        with self._wsl_api.session(environment_name):
+            weo_config.read_config()
+        self._check_environment_version(weo_config)
         self._wsl_api.remove_instance(environment_name)
@@ -1,19 +1,9 @@
 import os.path
-from tempfile import TemporaryDirectory
+import time
 
 import click
 
-import requests
 from semver import Version
-from rich.progress import (
-    BarColumn,
-    DownloadColumn,
-    Progress,
-    TaskID,
-    TextColumn,
-    TimeRemainingColumn,
-    TransferSpeedColumn,
-)
 from enum import Enum
 
 from config.version import WEO_VERSION
@@ -21,7 +11,10 @@ from config.weo_config import WeoConfig
 from config.wsl_config import WslConfig
 from exceptions.OrchestratorIncompatibleError import OrchestratorIncompatibleError
 from exceptions.OrchestratorNotInitialzedError import OrchestratorNotInitializedError
+from orchestrator.download_cache import DownloadCache
 from orchestrator.orchestrator import Orchestrator
+from orchestrator.orchestrator_stamp import OrchestratorStamp, OrchestratorStampFile
+from wsl.command_batch import CommandBatch
 from wsl.wsl_api import WslApi
 
 
@@ -34,49 +27,83 @@ class OrchestratorFactoryStatus(Enum):
 
 class OrchestratorFactory:
     _orchestrator_instance_name = "weo_orchestrator"
+    _alpine_version = "3.20.3"
+    _alpine_download_url = \
+        "https://dl-cdn.alpinelinux.org/alpine/v3.20/releases/x86_64/alpine-minirootfs-3.20.3-x86_64.tar.gz"
 
-    def __init__(self, verbose: bool):
+    def __init__(self, verbose: bool, recheck: bool = False):
         self._status = OrchestratorFactoryStatus.UNKNOWN
-        wsl_storage_dir = os.path.expanduser('~') + "\\wsl"
+        self._verbose = verbose
+        wsl_storage_dir = os.path.join(os.path.expanduser('~'), "wsl")
         self._wsl_api = WslApi(wsl_storage_dir, verbose)
+        self._stamp_file = OrchestratorStampFile(os.path.join(os.path.expanduser('~'), ".weo", "orchestrator.json"))
+        self._stamp: OrchestratorStamp | None = None
         self._orchestrator_wsl_config = WslConfig(self._wsl_api, self._orchestrator_instance_name)
         self._orchestrator_weo_config = WeoConfig(self._wsl_api, self._orchestrator_instance_name)
         self._orchestrator = Orchestrator(self._orchestrator_instance_name, self._wsl_api)
         if not self._orchestrator_instance_exists():
+            self._stamp_file.remove()
             self._status = OrchestratorFactoryStatus.NO_ORCHESTRATOR
+        elif not recheck and self._orchestrator_instance_stamped():
+            self._status = OrchestratorFactoryStatus.OK
         elif not self._orchestrator_instance_compatible():
+            self._stamp_file.remove()
             self._status = OrchestratorFactoryStatus.INCOMPATIBLE_ORCHESTRATOR
         else:
+            self._save_stamp()
             self._status = OrchestratorFactoryStatus.OK
 
+    @classmethod
+    def orchestrator_instance_name(cls) -> str:
+        return cls._orchestrator_instance_name
+
     def _orchestrator_instance_exists(self) -> bool:
         return self._wsl_api.instance_exists(self._orchestrator_instance_name)
 
+    def _orchestrator_instance_stamped(self) -> bool:
+        # A valid stamp skips reading the config, which would boot the orchestrator instance
+        stamp = self._stamp_file.load_valid(self._wsl_api.registry.instance_guid(self._orchestrator_instance_name))
+        if not stamp:
+            return False
+        try:
+            stamp_version = Version.parse(stamp.version)
+        except (ValueError, TypeError):
+            # A stamp with a broken version is treated as missing, the orchestrator is verified again
+            return False
+        if not Version.is_compatible(Version.parse(WEO_VERSION), stamp_version):
+            return False
+        if self._verbose:
+            click.secho(f"[DEBUG:] Orchestrator verified by stamp {self._stamp_file.path} "
+                        f"({time.strftime('%Y-%m-%d %H:%M', time.localtime(stamp.verified_at))})", fg="cyan")
+        self._stamp = stamp
+        return True
+
+    def _save_stamp(self) -> None:
+        self._stamp = self._stamp_file.save(
+            self._orchestrator_weo_config.version,
+            self._wsl_api.registry.instance_guid(self._orchestrator_instance_name))
+
     def _orchestrator_instance_compatible(self) -> bool:
         self._orchestrator_weo_config.read_config()
         return Version.is_compatible(
             Version.parse(WEO_VERSION), Version.parse(self._orchestrator_weo_config.version))
 
     def _create_orchestrator_instance(self) -> None:
-        alpine_version = "3.20.3"
-        alpine_download_url = \
-            "https://dl-cdn.alpinelinux.org/alpine/v3.20/releases/x86_64/alpine-minirootfs-3.20.3-x86_64.tar.gz"
-        alpine_image_file_name = "alpine-minirootfs.tar.gz"
-        click.secho(f"Downloading alpine {alpine_version} for orchestrator...", fg="blue")
-
-        with TemporaryDirectory() as temp_dir:
-            alpine_image_file_path = os.path.join(temp_dir, alpine_image_file_name)
-            try:
-                with requests.get(alpine_download_url, stream=True, timeout=10) as response:
-                    self._file_download(alpine_image_file_name, alpine_image_file_path, response)
-            except requests.exceptions.Timeout as e:
-                click.secho(f"Alpine could not be downloaded. Timeout", fg="red")
-                raise e
-
-            click.secho(f"Creating orchestrator instance...", fg="blue")
-            self._wsl_api.create_instance(
-                self._orchestrator_instance_name,
-                alpine_image_file_path)
+        alpine_download_url = os.environ.get("WEO_ORCHESTRATOR_IMAGE_URL", self._alpine_download_url)
+        download_cache = DownloadCache(
+            os.environ.get("WEO_DOWNLOAD_CACHE", os.path.join(os.path.expanduser('~'), ".weo", "downloads")),
+            os.environ.get("WEO_OFFLINE", "").lower() in ["1", "true", "yes"])
+        if download_cache.offline:
+            click.secho(f"Looking up alpine {self._alpine_version} for orchestrator in download cache...", fg="blue")
+            alpine_image_file_path = download_cache.fetch(alpine_download_url)
+        else:
+            click.secho(f"Downloading alpine {self._alpine_version} for orchestrator...", fg="blue")
+            alpine_image_file_path = self._file_download(download_cache, alpine_download_url)
+
+        click.secho(f"Creating orchestrator instance...", fg="blue")
+        self._wsl_api.create_instance(
+            self._orchestrator_instance_name,
+            alpine_image_file_path)
 
     def _config_orchestrator_instance(self) -> None:
         self._orchestrator_wsl_config.user = "root"
@@ -84,15 +111,30 @@ class OrchestratorFactory:
         self._orchestrator_weo_config.base_image_local = "false"
         self._orchestrator_weo_config.base_image = "None"
         self._orchestrator_weo_config.version = WEO_VERSION
+        self._orchestrator_weo_config.compression = "bzip2"
+        self._orchestrator_weo_config.compression_level = "default"
+        self._orchestrator_weo_config.compression_threads = "1"
+        self._orchestrator_weo_config.rootfs_import = "pipe"
+        self._orchestrator_weo_config.docker_cache_budget_mb = "20480"
+        self._orchestrator_weo_config.artifact_cache_budget_mb = "20480"
+
+        batch = CommandBatch(self._wsl_api, self._orchestrator_instance_name)
+        self._orchestrator_wsl_config.add_write_steps(batch)
+        self._orchestrator_weo_config.add_write_steps(batch)
+        batch.add("apk add docker")
+        batch.run().check()
+
+    def _file_download(self, download_cache: DownloadCache, url: str) -> str:
+        from rich.progress import (
+            BarColumn,
+            DownloadColumn,
+            Progress,
+            TaskID,
+            TextColumn,
+            TimeRemainingColumn,
+            TransferSpeedColumn,
+        )
 
-        self._orchestrator_wsl_config.write_config()
-        self._orchestrator_weo_config.write_config()
-
-        self._wsl_api.run_command_in_instance(
-            self._orchestrator_instance_name,
-            "apk add docker")
-
-    def _file_download(self, file_name, ms_download_file_path_temp, response):
         progress = Progress(
             TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
             BarColumn(bar_width=None),
@@ -107,23 +149,25 @@ class OrchestratorFactory:
         with progress:
             task_id: TaskID = progress.add_task(
                 "[cyan]Downloading...",
-                filename=file_name,
-                start=False
+                filename=os.path.basename(url),
+                total=None
             )
-            # This will break if the response doesn't contain content length
-            progress.update(task_id, total=int(response.headers.get('content-length', 0)))
-            with open(ms_download_file_path_temp, "wb") as dest_file:
-                progress.start_task(task_id)
-                for data in response.iter_content(chunk_size=4096):
-                    dest_file.write(data)
-                    progress.update(task_id, advance=len(data))
-
-            progress.update(task_id, advance=0)
+            # Servers without content length result in an indeterminate progress bar
+            return download_cache.fetch(
+                url, on_progress=lambda downloaded, total: progress.update(task_id, completed=downloaded, total=total))
 
     @property
     def status(self) -> OrchestratorFactoryStatus:
         return self._status
 
+    @property
+    def stamp(self) -> OrchestratorStamp | None:
+        return self._stamp
+
+    @property
+    def wsl_api(self) -> WslApi:
+        return self._wsl_api
+
     def initialize(self, overwrite: bool = False) -> None:
         if self._status == OrchestratorFactoryStatus.OK:
             return
@@ -136,6 +180,7 @@ class OrchestratorFactory:
         try:
             self._create_orchestrator_instance()
             self._config_orchestrator_instance()
+            self._save_stamp()
             self._status = OrchestratorFactoryStatus.OK
         except Exception as e:
             if self._orchestrator_instance_exists():
@@ -0,0 +1,63 @@
+import json
+import os
+import secrets
+import time
+
+
+class OrchestratorStamp:
+    def __init__(self, version: str, instance_guid: str | None, verified_at: float):
+        self.version = version
+        self.instance_guid = instance_guid
+        self.verified_at = verified_at
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "instance_guid": self.instance_guid,
+            "verified_at": self.verified_at,
+        }
+
+    @staticmethod
+    def from_dict(values: dict) -> "OrchestratorStamp":
+        return OrchestratorStamp(values["version"], values["instance_guid"], float(values["verified_at"]))
+
+
+class OrchestratorStampFile:
+    MAX_AGE: float = 7 * 24 * 60 * 60
+
+    def __init__(self, path: str):
+        self._path = path
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def load(self) -> OrchestratorStamp | None:
+        try:
+            with open(self._path, "r", encoding="utf-8") as file:
+                return OrchestratorStamp.from_dict(json.load(file))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def load_valid(self, instance_guid: str | None) -> OrchestratorStamp | None:
+        stamp = self.load()
+        # A re-imported orchestrator gets a new GUID, even if it has the same name, and an instance without a GUID
+        # was not found at all
+        if not stamp or instance_guid is None or stamp.instance_guid != instance_guid:
+            return None
+        if not 0 <= time.time() - stamp.verified_at <= self.MAX_AGE:
+            return None
+        return stamp
+
+    def save(self, version: str, instance_guid: str | None) -> OrchestratorStamp:
+        stamp = OrchestratorStamp(version, instance_guid, time.time())
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        temp_path = f"{self._path}.tmp-{secrets.token_hex(4)}"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(stamp.to_dict(), file, indent=2)
+        os.replace(temp_path, self._path)
+        return stamp
+
+    def remove(self) -> None:
+        if os.path.exists(self._path):
+            os.remove(self._path)
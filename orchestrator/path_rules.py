@@ -0,0 +1,106 @@
+import os
+import re
+from typing import Callable, Iterable
+
+
+class PathRules:
+    def __init__(self, rules: list[tuple[re.Pattern, bool]]):
+        self._rules = rules
+
+    @property
+    def has_negations(self) -> bool:
+        return any(negated for _, negated in self._rules)
+
+    def __bool__(self) -> bool:
+        return bool(self._rules)
+
+    def __add__(self, other: "PathRules") -> "PathRules":
+        return PathRules(self._rules + other._rules)
+
+    def matches(self, relative_path: str) -> bool:
+        matched = False
+        # Like docker, the last matching rule wins and a rule also matches everything below a matched directory
+        candidates = self._parent_paths(relative_path)
+        for pattern, negated in self._rules:
+            if any(pattern.match(candidate) for candidate in candidates):
+                matched = not negated
+        return matched
+
+    def matcher(self) -> Callable[[str], bool]:
+        # The last matching rule of every directory is cached, so matching a whole tree checks every path once
+        last_rules: dict[str, int] = {}
+
+        def last_rule(path: str) -> int:
+            if path in last_rules:
+                return last_rules[path]
+            parent = path.rpartition("/")[0]
+            index = last_rule(parent) if parent else -1
+            for rule_index in range(len(self._rules) - 1, index, -1):
+                if self._rules[rule_index][0].match(path):
+                    index = rule_index
+                    break
+            last_rules[path] = index
+            return index
+
+        def matches(path: str) -> bool:
+            index = last_rule(path)
+            return index >= 0 and not self._rules[index][1]
+        return matches
+
+    @staticmethod
+    def parse(lines: Iterable[str]) -> "PathRules":
+        rules = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:].strip()
+            pattern = os.path.normpath(line).replace(os.sep, "/").lstrip("/")
+            if pattern in ["", "."]:
+                continue
+            rules.append((PathRules._compile_pattern(pattern), negated))
+        return PathRules(rules)
+
+    @staticmethod
+    def _parent_paths(relative_path: str) -> list[str]:
+        parts = relative_path.split("/")
+        return ["/".join(parts[:index]) for index in range(1, len(parts) + 1)]
+
+    @staticmethod
+    def _compile_pattern(pattern: str) -> re.Pattern:
+        expression = ""
+        index = 0
+        while index < len(pattern):
+            char = pattern[index]
+            if pattern.startswith("**/", index):
+                expression += "(.*/)?"
+                index += 3
+                continue
+            if pattern.startswith("**", index):
+                expression += ".*"
+                index += 2
+                continue
+            match char:
+                case "*":
+                    expression += "[^/]*"
+                case "?":
+                    expression += "[^/]"
+                case "\\" if index + 1 < len(pattern):
+                    index += 1
+                    expression += re.escape(pattern[index])
+                case "[":
+                    end = pattern.find("]", index + 1)
+                    if end == -1:
+                        expression += re.escape(char)
+                    else:
+                        char_class = pattern[index + 1:end]
+                        if char_class.startswith("!") or char_class.startswith("^"):
+                            char_class = "^" + char_class[1:]
+                        expression += f"[{char_class}]"
+                        index = end
+                case _:
+                    expression += re.escape(char)
+            index += 1
+        return re.compile(f"^{expression}$")
@@ -0,0 +1,209 @@
+import bz2
+import gzip
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from enum import Enum
+from typing import BinaryIO
+
+from exceptions.CompressionNotSupportedError import CompressionNotSupportedError
+
+
+class Compression(Enum):
+    NONE = "none"
+    GZIP = "gzip"
+    BZIP2 = "bzip2"
+    ZSTD = "zstd"
+
+
+class CompressionSettings:
+    _DEFAULT_LEVELS = {
+        Compression.NONE: 0,
+        Compression.GZIP: 6,
+        Compression.BZIP2: 9,
+        Compression.ZSTD: 3,
+    }
+    _LEVEL_RANGES = {
+        Compression.NONE: (0, 0),
+        Compression.GZIP: (1, 9),
+        Compression.BZIP2: (1, 9),
+        Compression.ZSTD: (1, 19),
+    }
+    _EXTENSIONS = {
+        Compression.NONE: ".tar",
+        Compression.GZIP: ".tar.gz",
+        Compression.BZIP2: ".tar.bz2",
+        Compression.ZSTD: ".tar.zst",
+    }
+
+    def __init__(self, compression: Compression = Compression.BZIP2, level: int | None = None, threads: int = 1):
+        if level is None or compression == Compression.NONE:
+            level = self._DEFAULT_LEVELS[compression]
+        min_level, max_level = self._LEVEL_RANGES[compression]
+        if not min_level <= level <= max_level:
+            raise ValueError(f"Invalid level {level} for {compression.value}, expected {min_level}-{max_level}")
+        if threads < 0:
+            raise ValueError("Invalid thread count, expected 0 (all cores) or more")
+        self._compression = compression
+        self._level = level
+        self._threads = threads
+
+    def __str__(self) -> str:
+        if self._compression == Compression.NONE:
+            return self._compression.value
+        threads = "all" if self._threads == 0 else str(self._threads)
+        return f"{self._compression.value} (level {self._level}, threads {threads})"
+
+    @property
+    def compression(self) -> Compression:
+        return self._compression
+
+    @property
+    def level(self) -> int:
+        return self._level
+
+    @property
+    def threads(self) -> int:
+        return self._threads
+
+    @property
+    def effective_threads(self) -> int:
+        return self._threads if self._threads > 0 else os.cpu_count() or 1
+
+    @property
+    def extension(self) -> str:
+        return self._EXTENSIONS[self._compression]
+
+    @property
+    def streamable(self) -> bool:
+        return self._compression != Compression.ZSTD
+
+    def file_name(self, base_name: str) -> str:
+        return base_name + self.extension
+
+    def shell_command(self) -> str | None:
+        threads = "" if self._threads == 0 else str(self._threads)
+        match self._compression:
+            case Compression.NONE:
+                return None
+            case Compression.GZIP:
+                if self._threads == 1:
+                    return f"gzip -{self._level} -c"
+                return f"pigz -{self._level} -c" + (f" -p {threads}" if threads else "")
+            case Compression.BZIP2:
+                if self._threads == 1:
+                    return f"bzip2 -{self._level} -c"
+                return f"pbzip2 -{self._level} -c" + (f" -p{threads}" if threads else "")
+            case Compression.ZSTD:
+                return f"zstd -{self._level} -T{self._threads} -q -c"
+
+    def shell_package(self) -> str | None:
+        match self._compression:
+            case Compression.GZIP if self._threads != 1:
+                return "pigz"
+            case Compression.BZIP2 if self._threads != 1:
+                return "pbzip2"
+            case Compression.ZSTD:
+                return "zstd"
+        return None
+
+    def open_writer(self, fileobj: BinaryIO) -> BinaryIO:
+        match self._compression:
+            case Compression.NONE:
+                return _PassThroughWriter(fileobj)
+            case Compression.GZIP | Compression.BZIP2:
+                return ParallelCompressedWriter(fileobj, self._compression, self._level, self.effective_threads)
+        raise CompressionNotSupportedError(
+            f"Compression {self._compression.value} is not supported for streamed rootfs")
+
+    def open_reader(self, fileobj: BinaryIO) -> BinaryIO:
+        match self._compression:
+            case Compression.NONE:
+                return fileobj
+            case Compression.GZIP:
+                return gzip.GzipFile(fileobj=fileobj, mode="rb")
+            case Compression.BZIP2:
+                return bz2.BZ2File(fileobj, mode="rb")
+        raise CompressionNotSupportedError(
+            f"Compression {self._compression.value} is not supported for streamed rootfs")
+
+
+class _PassThroughWriter:
+    def __init__(self, fileobj: BinaryIO):
+        self._fileobj = fileobj
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, data) -> int:
+        return self._fileobj.write(data)
+
+    def flush(self) -> None:
+        self._fileobj.flush()
+
+    def close(self) -> None:
+        self._fileobj.flush()
+
+
+class ParallelCompressedWriter:
+    BLOCK_SIZE: int = 4 * 1024 * 1024
+
+    def __init__(self, fileobj: BinaryIO, compression: Compression, level: int, threads: int):
+        self._fileobj = fileobj
+        self._compression = compression
+        self._level = level
+        self._threads = max(1, threads)
+        self._buffer = bytearray()
+        self._pending: deque[Future] = deque()
+        self._executor = ThreadPoolExecutor(max_workers=self._threads) if self._threads > 1 else None
+        self._blocks = 0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.BLOCK_SIZE:
+            block = bytes(self._buffer[:self.BLOCK_SIZE])
+            del self._buffer[:self.BLOCK_SIZE]
+            self._submit(block)
+        return len(data)
+
+    def flush(self) -> None:
+        self._fileobj.flush()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._buffer or self._blocks == 0:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        while self._pending:
+            self._fileobj.write(self._pending.popleft().result())
+        if self._executor:
+            self._executor.shutdown()
+        self._fileobj.flush()
+
+    def _submit(self, block: bytes) -> None:
+        # Every block becomes an independent gzip member / bzip2 stream. Concatenated members
+        # are valid archives, which allows compressing the blocks on all cores at once.
+        self._blocks += 1
+        if not self._executor:
+            self._fileobj.write(self._compress(block))
+            return
+        self._pending.append(self._executor.submit(self._compress, block))
+        while len(self._pending) > 2 * self._threads:
+            self._fileobj.write(self._pending.popleft().result())
+
+    def _compress(self, block: bytes) -> bytes:
+        if self._compression == Compression.GZIP:
+            return gzip.compress(block, compresslevel=self._level, mtime=0)
+        return bz2.compress(block, compresslevel=self._level)
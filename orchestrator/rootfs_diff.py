@@ -0,0 +1,140 @@
+import tarfile
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO
+
+from orchestrator.image_index import ImageIndex
+from orchestrator.path_rules import PathRules
+from orchestrator.rootfs_transformer import RootfsTransformer
+
+
+class RootfsDiffReport:
+    def __init__(self, dry_run: bool):
+        self.dry_run = dry_run
+        self.up_to_date = False
+        self.added: list[str] = []
+        self.changed: list[str] = []
+        self.removed: list[str] = []
+        # Paths of the image which the user changed or removed, they are left as they are
+        self.modified: list[str] = []
+        # Accounts of the new image as (account file, name), their lines are added to the account files
+        self.added_accounts: list[tuple[str, str]] = []
+        self.kept_entries = 0
+        self.transfer_size = 0
+        self.index_duration = 0.0
+        self.diff_duration = 0.0
+        self.apply_duration = 0.0
+
+    @property
+    def empty(self) -> bool:
+        return not self.added and not self.changed and not self.removed and not self.added_accounts
+
+
+class RootfsDiff:
+    BUFFER_SIZE: int = 1024 * 1024
+    # User data, accounts and files WSL or WEO write into an environment are never touched by an update
+    KEEP_RULES: list[str] = [
+        "home", "root", "tmp", "var/tmp", "var/log", "mnt", "proc", "sys", "dev", "run", "lost+found", "init",
+        "usr/lib/wsl", "etc/ld.so.conf.d/ld.wsl.conf", "etc/hostname", "etc/hosts", "etc/resolv.conf",
+        "etc/passwd", "etc/passwd-", "etc/shadow", "etc/shadow-", "etc/group", "etc/group-", "etc/gshadow",
+        "etc/gshadow-", "etc/wsl.conf", "etc/weo.conf", "var/lib/weo",
+    ]
+
+    def __init__(self, image_index: ImageIndex, keep: list[str] | None = None):
+        self._keeps = (PathRules.parse(self.KEEP_RULES) + PathRules.parse(keep or [])).matcher()
+        # The image the environment was created from, the environment as it is now and the image to update to
+        self._image = image_index
+        self._environment = ImageIndex()
+        self._new_image = ImageIndex()
+        self._removals: dict[str, str] = {}
+        self._account_lines: dict[str, list[str]] = {}
+
+    @property
+    def indexed_entries(self) -> int:
+        return len(self._environment.entries)
+
+    @property
+    def new_image_index(self) -> ImageIndex:
+        return self._new_image
+
+    def index(self, source: BinaryIO) -> None:
+        # Kept paths are never compared, so user data is not read beyond the accounts
+        self._environment.read(source, self._keeps)
+
+    def compare(self, source: BinaryIO, target: BinaryIO, report: RootfsDiffReport) -> None:
+        # Only paths the old image owned and the user left alone are changed, so the old image is compared with the
+        # new one and the environment tells which of its paths are still untouched
+        replaced_files = set()
+        with tarfile.open(fileobj=source, mode="r|", bufsize=ImageIndex.STREAM_BUFFER_SIZE) as source_tar, \
+                tarfile.open(fileobj=target, mode="w|", bufsize=ImageIndex.STREAM_BUFFER_SIZE,
+                             format=tarfile.PAX_FORMAT) as target_tar:
+            for member in source_tar:
+                path = RootfsTransformer.normalize(member.name)
+                if not path:
+                    continue
+                data = source_tar.extractfile(member) if member.isfile() else None
+                with SpooledTemporaryFile(max_size=self.BUFFER_SIZE) as buffer:
+                    entry = self._new_image.add(member, data, buffer)
+                    if self._keeps(path):
+                        report.kept_entries += 1
+                        if path in ImageIndex.ACCOUNT_FILES and member.isfile():
+                            buffer.seek(0)
+                            self._merge_accounts(path, buffer.read(), report)
+                        continue
+                    old = self._image.entries.get(path)
+                    current = self._environment.entries.get(path)
+                    # Hard links of a replaced file would keep its old content, so they are replaced as well
+                    relinked = member.islnk() and ImageIndex.link_target(member) in replaced_files
+                    if old is None:
+                        # A path the old image did not have belongs to the user if it exists
+                        if current is not None:
+                            if current != entry:
+                                report.modified.append(path)
+                            continue
+                        report.added.append(path)
+                    else:
+                        if current != old:
+                            if old != entry:
+                                report.modified.append(path)
+                            continue
+                        if old == entry and not relinked:
+                            continue
+                        report.changed.append(path)
+                        # A directory is not replaced by a file or the other way round when extracted
+                        if (old[0] == ImageIndex.DIRECTORY) != (entry[0] == ImageIndex.DIRECTORY):
+                            self._removals[path] = old[0]
+                    if member.isfile():
+                        replaced_files.add(path)
+                    buffer.seek(0)
+                    target_tar.addfile(member, buffer if member.isfile() else None)
+        for path, old in self._image.entries.items():
+            if path in self._new_image.entries or self._keeps(path):
+                continue
+            current = self._environment.entries.get(path)
+            if current is None:
+                continue
+            if current != old:
+                report.modified.append(path)
+                continue
+            report.removed.append(path)
+            self._removals[path] = old[0]
+        self._environment = ImageIndex()
+
+    def removals(self) -> tuple[list[str], list[str]]:
+        # Deepest paths first, so directories are empty once they are removed
+        paths = sorted(self._removals, key=lambda path: path.split("/"), reverse=True)
+        files = [path for path in paths if self._removals[path] != ImageIndex.DIRECTORY]
+        directories = [path for path in paths if self._removals[path] == ImageIndex.DIRECTORY]
+        return files, directories
+
+    def account_lines(self) -> dict[str, list[str]]:
+        return self._account_lines
+
+    def _merge_accounts(self, path: str, content: bytes, report: RootfsDiffReport) -> None:
+        # Accounts the image added are appended, accounts the user changed or deleted stay as they are
+        if path not in self._environment.accounts:
+            return
+        known = self._environment.accounts[path] | self._image.accounts.get(path, set())
+        for name, line in ImageIndex.account_lines(content).items():
+            if name not in known:
+                self._account_lines.setdefault(path, []).append(line)
+                report.added_accounts.append((path, name))
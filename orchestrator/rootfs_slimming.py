@@ -0,0 +1,107 @@
+import os
+
+from exceptions.SlimmingProfileError import SlimmingProfileError
+from orchestrator.path_rules import PathRules
+
+
+class SlimmingFilter:
+    PROFILES: dict[str, list[str]] = {
+        "caches": ["var/cache/apk/*", "var/cache/apt/*.bin", "var/cache/apt/archives/*.deb", "var/lib/apt/lists/*",
+                   "var/cache/dnf/*", "var/cache/yum/*", "var/cache/debconf/*-old", "root/.cache/*"],
+        "docs": ["usr/share/man/*", "usr/share/doc/*", "usr/share/info/*", "usr/share/gtk-doc/*"],
+        "locales": ["usr/share/locale/*", "!usr/share/locale/locale.alias", "!usr/share/locale/en*"],
+        "python": ["**/__pycache__", "**/*.py[co]"],
+    }
+    PROFILE_SETS: dict[str, list[str]] = {
+        "standard": ["caches", "docs", "python"],
+        "all": ["caches", "docs", "locales", "python"],
+    }
+
+    def __init__(self, names: list[str], rules: PathRules):
+        self._names = names
+        self._rules = rules
+        self._matches = rules.matcher()
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._names)
+
+    @property
+    def has_negations(self) -> bool:
+        return self._rules.has_negations
+
+    @classmethod
+    def profile_names(cls) -> list[str]:
+        return list(cls.PROFILES) + list(cls.PROFILE_SETS)
+
+    @classmethod
+    def load(cls, profiles: list[str]) -> "SlimmingFilter":
+        rules = PathRules([])
+        names = []
+        for profile in profiles:
+            if profile in cls.PROFILE_SETS:
+                for name in cls.PROFILE_SETS[profile]:
+                    rules += PathRules.parse(cls.PROFILES[name])
+            elif profile in cls.PROFILES:
+                rules += PathRules.parse(cls.PROFILES[profile])
+            elif os.path.isfile(profile):
+                # User profiles use the syntax of .dockerignore files, relative to the root of the rootfs
+                try:
+                    with open(profile, "r", encoding="utf-8-sig") as file:
+                        rules += PathRules.parse(file)
+                except OSError as e:
+                    raise SlimmingProfileError(f"The slimming profile {profile} could not be read: {e}")
+                # Absolute paths keep the profile usable from another working directory, e.g. in the service
+                names.append(os.path.abspath(profile))
+                continue
+            else:
+                raise SlimmingProfileError(f"Unknown slimming profile {profile}, expected one of "
+                                           f"{', '.join(cls.profile_names())} or a file")
+            names.append(profile)
+        return SlimmingFilter(names, rules)
+
+    def excludes(self, path: str) -> bool:
+        return self._matches(path)
+
+    def removals(self, paths: list[str], directories: set[str]) -> tuple[list[str], int]:
+        removals = []
+        removed_entries = 0
+        removed_dir = None
+        # Sorted by their parts, everything below a directory directly follows it
+        for path in sorted(paths, key=lambda path: path.split("/")):
+            if removed_dir and path.startswith(removed_dir + "/"):
+                removed_entries += 1
+                continue
+            removed_dir = None
+            if not self.excludes(path):
+                continue
+            if path in directories:
+                # With negations a kept file can be below an excluded directory, so directories stay
+                if self.has_negations:
+                    continue
+                removed_dir = path
+            removals.append(path)
+            removed_entries += 1
+        return removals, removed_entries
+
+
+class SlimmingReport:
+    def __init__(self, profiles: list[str]):
+        self.profiles = profiles
+        self.size_before = 0
+        self.size_after = 0
+        self.removed_entries = 0
+        self.duration: float | None = 0.0
+
+    @property
+    def saved(self) -> int:
+        return self.size_before - self.size_after
+
+
+class RootfsReport:
+    def __init__(self):
+        self.slimming: SlimmingReport | None = None
+        self.archive_size = 0
+        self.piped = False
+        self.pack_duration = 0.0
+        self.import_duration = 0.0
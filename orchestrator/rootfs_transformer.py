@@ -0,0 +1,125 @@
+import copy
+import io
+import os
+import shutil
+import tarfile
+import time
+from tempfile import TemporaryFile
+from typing import BinaryIO, Callable
+
+
+class TeeReader:
+    def __init__(self, source: BinaryIO, sink: BinaryIO):
+        self._source = source
+        self._sink = sink
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._source.read(size)
+        if data:
+            self._sink.write(data)
+        return data
+
+    def drain(self) -> None:
+        while self.read(RootfsTransformer.BUFFER_SIZE):
+            pass
+
+
+class RootfsTransformer:
+    BUFFER_SIZE: int = 1024 * 1024
+
+    def __init__(self):
+        self._replacements: dict[str, tuple[bytes, int]] = {}
+        self._patches: dict[str, Callable[[bytes], bytes]] = {}
+        self._patched: set[str] = set()
+        self._exclude: Callable[[str], bool] | None = None
+        self.size_before = 0
+        self.size_after = 0
+        self.excluded_members = 0
+
+    @staticmethod
+    def normalize(path: str) -> str:
+        while path.startswith("./"):
+            path = path[2:]
+        return path.strip("/")
+
+    def replace(self, path: str, content: bytes, mode: int = 0o644) -> None:
+        self._replacements[self.normalize(path)] = (content, mode)
+
+    def patch(self, path: str, func: Callable[[bytes], bytes]) -> None:
+        self._patches[self.normalize(path)] = func
+
+    def exclude(self, predicate: Callable[[str], bool]) -> None:
+        self._exclude = predicate
+
+    @property
+    def missing_patches(self) -> list[str]:
+        return ["/" + path for path in self._patches if path not in self._patched]
+
+    def transform(self, source: BinaryIO, target: BinaryIO) -> None:
+        self._patched = set()
+        self.size_before = self.size_after = self.excluded_members = 0
+        replaced = set()
+        # A kept hard link can refer to an excluded file, so the content of excluded files is set aside until the
+        # end of the stream. The first kept link becomes a regular file and further links refer to it instead.
+        excluded_files: dict[str, tuple[tarfile.TarInfo, int]] = {}
+        linked_files: dict[str, str] = {}
+        with TemporaryFile() as excluded_data, \
+                tarfile.open(fileobj=source, mode="r|", bufsize=self.BUFFER_SIZE) as source_tar, \
+                tarfile.open(fileobj=target, mode="w|", bufsize=self.BUFFER_SIZE,
+                             format=tarfile.PAX_FORMAT) as target_tar:
+            for member in source_tar:
+                path = self.normalize(member.name)
+                self.size_before += member.size
+                # Directories are always kept, a negated rule can keep a file below an excluded directory
+                if self._exclude and not member.isdir() and path not in self._replacements \
+                        and path not in self._patches and self._exclude(path):
+                    self.excluded_members += 1
+                    if member.isfile():
+                        excluded_files[path] = (member, excluded_data.tell())
+                        shutil.copyfileobj(source_tar.extractfile(member), excluded_data, self.BUFFER_SIZE)
+                    continue
+                self.size_after += member.size
+                link_target = self.normalize(member.linkname) if member.islnk() else None
+                if path in self._replacements:
+                    content, mode = self._replacements[path]
+                    target_tar.addfile(*self._file_member(member.name, content, mode, member))
+                    replaced.add(path)
+                elif path in self._patches and member.isfile():
+                    content = source_tar.extractfile(member).read()
+                    content = self._patches[path](content)
+                    target_tar.addfile(*self._file_member(member.name, content, member.mode, member))
+                    self._patched.add(path)
+                elif member.isfile():
+                    target_tar.addfile(member, source_tar.extractfile(member))
+                elif link_target in linked_files:
+                    member.linkname = linked_files[link_target]
+                    target_tar.addfile(member)
+                elif link_target in excluded_files:
+                    excluded_member, offset = excluded_files[link_target]
+                    file_member = copy.copy(excluded_member)
+                    file_member.name = member.name
+                    excluded_data.seek(offset)
+                    target_tar.addfile(file_member, excluded_data)
+                    excluded_data.seek(0, os.SEEK_END)
+                    linked_files[link_target] = member.name
+                    self.size_after += file_member.size
+                else:
+                    target_tar.addfile(member)
+
+            for path, (content, mode) in self._replacements.items():
+                if path not in replaced:
+                    target_tar.addfile(*self._file_member(path, content, mode))
+
+    @staticmethod
+    def _file_member(name: str, content: bytes, mode: int,
+                     original: tarfile.TarInfo | None = None) -> tuple[tarfile.TarInfo, BinaryIO]:
+        member = tarfile.TarInfo(name)
+        if original:
+            member.uid = original.uid
+            member.gid = original.gid
+            member.uname = original.uname
+            member.gname = original.gname
+        member.mtime = int(time.time())
+        member.mode = mode
+        member.size = len(content)
+        return member, io.BytesIO(content)
@@ -0,0 +1,68 @@
+import os
+import re
+
+from exceptions.EnvironmentArchiveError import EnvironmentArchiveError
+from exceptions.TemplateNotFoundError import TemplateNotFoundError
+from orchestrator.environment_archive import EnvironmentArchiveManifest
+from orchestrator.rootfs_compression import Compression, CompressionSettings
+
+
+class Template:
+    def __init__(self, name: str, path: str, manifest: EnvironmentArchiveManifest):
+        self.name = name
+        self.path = path
+        self.manifest = manifest
+
+
+class TemplateStore:
+    DIR_NAME: str = ".weo-templates"
+    COMPRESSION: CompressionSettings = CompressionSettings(Compression.NONE)
+    _NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+    def __init__(self, templates_dir: str):
+        self._templates_dir = templates_dir
+
+    @property
+    def templates_dir(self) -> str:
+        return self._templates_dir
+
+    def path(self, name: str) -> str:
+        if not self._NAME_PATTERN.match(name):
+            raise ValueError("Invalid template name, expected letters, digits, '.', '_' and '-'")
+        return os.path.join(self._templates_dir, self.COMPRESSION.file_name(name))
+
+    def exists(self, name: str) -> bool:
+        return os.path.isfile(EnvironmentArchiveManifest.path(self.path(name)))
+
+    def get(self, name: str) -> Template:
+        try:
+            path = self.path(name)
+        except ValueError:
+            raise TemplateNotFoundError()
+        if not os.path.isfile(path) or not os.path.isfile(EnvironmentArchiveManifest.path(path)):
+            raise TemplateNotFoundError()
+        return Template(name, path, EnvironmentArchiveManifest.load(path))
+
+    def templates(self) -> list[Template]:
+        if not os.path.isdir(self._templates_dir):
+            return []
+        templates = []
+        suffix = self.COMPRESSION.extension + EnvironmentArchiveManifest.SUFFIX
+        for file_name in sorted(os.listdir(self._templates_dir)):
+            if not file_name.endswith(suffix):
+                continue
+            # Templates which are still written or were damaged are not offered for cloning
+            try:
+                templates.append(self.get(file_name[:-len(suffix)]))
+            except (TemplateNotFoundError, EnvironmentArchiveError):
+                continue
+        return templates
+
+    def remove(self, name: str) -> None:
+        path = self.path(name)
+        if not os.path.exists(EnvironmentArchiveManifest.path(path)):
+            raise TemplateNotFoundError()
+        # The manifest goes first, so a template is never listed without its rootfs
+        os.remove(EnvironmentArchiveManifest.path(path))
+        if os.path.exists(path):
+            os.remove(path)
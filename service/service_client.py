@@ -0,0 +1,106 @@
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection
+from typing import Callable
+
+from config.version import WEO_VERSION
+from exceptions.ServiceError import ServiceError
+from orchestrator.rootfs_compression import CompressionSettings
+from orchestrator.rootfs_diff import RootfsDiffReport
+from orchestrator.rootfs_slimming import RootfsReport
+from service.service_info import ServiceInfo, ServiceInfoFile
+
+
+class ServiceClient:
+    def __init__(self, connection: Connection, info: ServiceInfo):
+        self._connection = connection
+        self._info = info
+
+    @property
+    def pid(self) -> int:
+        return self._info.pid
+
+    @staticmethod
+    def connect(info_file: ServiceInfoFile | None = None) -> "ServiceClient | None":
+        info = (info_file or ServiceInfoFile(ServiceInfoFile.default_path())).load()
+        # Without a running service of the same version, commands fall back to the in-process orchestrator
+        if not info or info.version != WEO_VERSION:
+            return None
+        try:
+            connection = Client(info.address, authkey=bytes.fromhex(info.authkey))
+        except (OSError, EOFError, ValueError, AuthenticationError):
+            return None
+        return ServiceClient(connection, info)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def create(self, step_desc: Callable[[str], None], docker_image: str, environment_name: str, local: str | None,
+               environment_password: str, user: str | None = None, streaming: bool = False,
+               compression: CompressionSettings | None = None, artifact_cache_dir: str | None = None,
+               build_timeout: float | None = None, slimming_profiles: list[str] | None = None,
+               fill_artifact_cache: bool = False) -> RootfsReport:
+        return self.request("create", {
+            "docker_image": docker_image,
+            "environment_name": environment_name,
+            "local": local,
+            "environment_password": environment_password,
+            "user": user,
+            "streaming": streaming,
+            "compression": compression,
+            "artifact_cache_dir": artifact_cache_dir,
+            "build_timeout": build_timeout,
+            "slimming_profiles": slimming_profiles,
+            "fill_artifact_cache": fill_artifact_cache,
+        }, step_desc)
+
+    def create_from_template(self, step_desc: Callable[[str], None], template_name: str, environment_name: str,
+                             environment_password: str, user: str | None = None) -> RootfsReport:
+        return self.request("create_from_template", {
+            "template_name": template_name,
+            "environment_name": environment_name,
+            "environment_password": environment_password,
+            "user": user,
+        }, step_desc)
+
+    def update(self, step_desc: Callable[[str], None], environment_name: str, docker_image: str | None = None,
+               local: str | None = None, keep: list[str] | None = None, dry_run: bool = False, force: bool = False,
+               build_timeout: float | None = None) -> RootfsDiffReport:
+        return self.request("update", {
+            "environment_name": environment_name,
+            "docker_image": docker_image,
+            "local": local,
+            "keep": keep,
+            "dry_run": dry_run,
+            "force": force,
+            "build_timeout": build_timeout,
+        }, step_desc)
+
+    def remove(self, environment_name: str) -> None:
+        self.request("remove", {"environment_name": environment_name})
+
+    def status(self) -> dict:
+        return self.request("status")
+
+    def stop(self) -> None:
+        self.request("stop")
+
+    def request(self, command: str, arguments: dict | None = None,
+                step_desc: Callable[[str], None] = lambda description: None) -> object:
+        # Every connection carries a single request
+        with self._connection as connection:
+            try:
+                connection.send((command, arguments or {}))
+            except OSError as e:
+                raise ServiceError(f"The WEO service (pid {self.pid}) is not reachable") from e
+            while True:
+                try:
+                    kind, value = connection.recv()
+                except (OSError, EOFError) as e:
+                    raise ServiceError(f"The connection to the WEO service (pid {self.pid}) was lost") from e
+                match kind:
+                    case "step":
+                        step_desc(value)
+                    case "result":
+                        return value
+                    case "error":
+                        raise value
@@ -0,0 +1,61 @@
+import json
+import os
+import secrets
+import time
+
+
+class ServiceInfo:
+    def __init__(self, address: str, authkey: str, pid: int, version: str, started: float):
+        self.address = address
+        self.authkey = authkey
+        self.pid = pid
+        self.version = version
+        self.started = started
+
+    def to_dict(self) -> dict:
+        return {
+            "address": self.address,
+            "authkey": self.authkey,
+            "pid": self.pid,
+            "version": self.version,
+            "started": self.started,
+        }
+
+    @staticmethod
+    def from_dict(values: dict) -> "ServiceInfo":
+        return ServiceInfo(values["address"], values["authkey"], int(values["pid"]), values["version"],
+                           float(values["started"]))
+
+
+class ServiceInfoFile:
+    def __init__(self, path: str):
+        self._path = path
+
+    @staticmethod
+    def default_path() -> str:
+        return os.path.join(os.path.expanduser('~'), ".weo", "service.json")
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def load(self) -> ServiceInfo | None:
+        try:
+            with open(self._path, "r", encoding="utf-8") as file:
+                return ServiceInfo.from_dict(json.load(file))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, address: str, authkey: str, version: str) -> ServiceInfo:
+        info = ServiceInfo(address, authkey, os.getpid(), version, time.time())
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        temp_path = f"{self._path}.tmp-{secrets.token_hex(4)}"
+        # The file contains the key of the service, so only the current user may read it
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as file:
+            json.dump(info.to_dict(), file, indent=2)
+        os.replace(temp_path, self._path)
+        return info
+
+    def remove(self) -> None:
+        if os.path.exists(self._path):
+            os.remove(self._path)
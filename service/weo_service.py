@@ -0,0 +1,180 @@
+import os
+import pickle
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Connection, Listener
+from typing import Callable
+
+from config.version import WEO_VERSION
+from exceptions.ServiceError import ServiceError
+from orchestrator.artifact_cache import ArtifactCache
+from orchestrator.orchestrator import Orchestrator
+from orchestrator.rootfs_slimming import SlimmingFilter
+from service.service_info import ServiceInfoFile
+
+
+class WeoService:
+    _POLL_INTERVAL: float = 0.5
+
+    def __init__(self, orchestrator: Orchestrator, workers: int = 2, info_file: ServiceInfoFile | None = None,
+                 log: Callable[[str], None] = lambda message: None):
+        if workers < 1:
+            raise ValueError("Invalid worker count, expected 1 or more")
+        self._orchestrator = orchestrator
+        self._workers = workers
+        self._info_file = info_file or ServiceInfoFile(ServiceInfoFile.default_path())
+        self._log = log
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._active = 0
+        self._handled = 0
+        self._pending_prune = False
+
+    def serve(self) -> None:
+        authkey = secrets.token_bytes(32)
+        address = self._address()
+        self._stopped.clear()
+        self._started = time.time()
+        # The daemon is held for the lifetime of the service, so requests never wait for it to start
+        with Listener(address, authkey=authkey) as listener, self._orchestrator.docker_daemon:
+            executor = ThreadPoolExecutor(max_workers=self._workers)
+            self._info_file.save(address, authkey.hex(), WEO_VERSION)
+            try:
+                threading.Thread(target=self._accept, args=(listener, executor), daemon=True).start()
+                # Waiting with a timeout keeps the main thread responsive to Ctrl+C, also on Windows
+                while not self._stopped.wait(self._POLL_INTERVAL):
+                    pass
+            finally:
+                self._stopped.set()
+                self._info_file.remove()
+                if self._active:
+                    self._log(f"Waiting for {self._active} running request(s)")
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def status(self) -> dict:
+        docker_daemon = self._orchestrator.docker_daemon
+        return {
+            "pid": os.getpid(),
+            "version": WEO_VERSION,
+            "uptime": time.time() - self._started,
+            "workers": self._workers,
+            "active": self._active,
+            "handled": self._handled,
+            "docker_daemon_starts": docker_daemon.start_count,
+        }
+
+    def _address(self) -> str:
+        token = secrets.token_hex(8)
+        if os.name == "nt":
+            return rf"\\.\pipe\weo-service-{token}"
+        os.makedirs(os.path.dirname(self._info_file.path), exist_ok=True)
+        return os.path.join(os.path.dirname(self._info_file.path), f"service-{token}.sock")
+
+    def _accept(self, listener: Listener, executor: ThreadPoolExecutor) -> None:
+        while not self._stopped.is_set():
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                # Clients with a wrong key are rejected, a closed listener ends the service
+                continue
+            if self._stopped.is_set():
+                connection.close()
+                return
+            if self._active >= self._workers:
+                try:
+                    connection.send(("step", f"Queued behind {self._active} running request(s)"))
+                except OSError:
+                    connection.close()
+                    continue
+            executor.submit(self._handle, connection)
+
+    def _handle(self, connection: Connection) -> None:
+        with self._lock:
+            self._active += 1
+        try:
+            with connection:
+                try:
+                    command, arguments = connection.recv()
+                except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+                    return
+                with self._lock:
+                    self._handled += 1
+                # A client which disconnects aborts its request with the next reported step
+                step_desc = lambda description: connection.send(("step", description))
+                target = arguments.get("environment_name", "")
+                start = time.monotonic()
+                self._log(f"{command} {target}".strip())
+                try:
+                    result = self._run(command, arguments, step_desc)
+                except Exception as e:
+                    self._log(f"{command} {target} failed after {time.monotonic() - start:.1f}s: {e}")
+                    connection.send(("error", self._picklable(e)))
+                    return
+                if command in ["create", "create_from_template", "update", "remove"]:
+                    self._log(f"{command} {target} finished after {time.monotonic() - start:.1f}s")
+                connection.send(("result", result))
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._active -= 1
+                # Docker budget enforcement prunes stopped containers, so it only runs once no build is in flight
+                if self._active == 0 and self._pending_prune:
+                    self._pending_prune = False
+                    try:
+                        self._orchestrator.prune_docker_cache()
+                    except Exception as e:
+                        self._log(f"Docker cache could not be pruned: {e}")
+
+    def _run(self, command: str, arguments: dict, step_desc: Callable[[str], None]) -> object:
+        match command:
+            case "status":
+                # The status request itself is not reported as running
+                return {**self.status(), "active": self._active - 1}
+            case "stop":
+                self.stop()
+                return None
+            case "create":
+                self._refresh()
+                artifact_cache_dir = arguments.pop("artifact_cache_dir", None)
+                artifact_cache = ArtifactCache(artifact_cache_dir) if artifact_cache_dir else None
+                slimming_profiles = arguments.pop("slimming_profiles", None)
+                slimming = SlimmingFilter.load(slimming_profiles) if slimming_profiles else None
+                with self._lock:
+                    self._pending_prune = True
+                return self._orchestrator.create(step_desc, artifact_cache=artifact_cache,
+                                                 enforce_docker_budget=False, slimming=slimming, **arguments)
+            case "create_from_template":
+                self._refresh()
+                return self._orchestrator.create_from_template(step_desc, **arguments)
+            case "update":
+                self._refresh()
+                with self._lock:
+                    self._pending_prune = True
+                return self._orchestrator.update(step_desc, enforce_docker_budget=False, **arguments)
+            case "remove":
+                self._refresh()
+                self._orchestrator.remove(arguments["environment_name"])
+                return None
+            case _:
+                raise ServiceError(f"Unknown request {command}")
+
+    def _refresh(self) -> None:
+        # Instances can be created or removed outside of the service, only the instance list is read again
+        self._orchestrator.wsl_api.registry.invalidate()
+        self._orchestrator.docker_daemon.restart_if_exited()
+
+    @staticmethod
+    def _picklable(error: Exception) -> Exception:
+        try:
+            pickle.loads(pickle.dumps(error))
+            return error
+        except (pickle.PickleError, TypeError, AttributeError):
+            return ServiceError(str(error) or type(error).__name__)
@@ -0,0 +1,80 @@
+import gzip
+import hashlib
+import io
+import tarfile
+import unittest
+
+from orchestrator.image_index import ImageIndex
+from orchestrator.rootfs_diff import RootfsDiff, RootfsDiffReport
+
+
+def _tar(files: list[tuple[str, bytes | str]]) -> bytes:
+    # Content is the data of a file, a string names the file a hard link refers to
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.PAX_FORMAT) as tar:
+        for name, content in files:
+            member = tarfile.TarInfo(name)
+            member.mode = 0o755
+            if isinstance(content, str):
+                member.type = tarfile.LNKTYPE
+                member.linkname = content
+                tar.addfile(member)
+            else:
+                member.size = len(content)
+                tar.addfile(member, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def _index(data: bytes) -> ImageIndex:
+    index = ImageIndex()
+    index.read(io.BytesIO(data))
+    return index
+
+
+class ImageIndexTest(unittest.TestCase):
+    def test_hard_links_do_not_depend_on_order(self):
+        docker_export = _tar([("usr/bin/python3", b"python"), ("usr/bin/python3.12", "usr/bin/python3")])
+        wsl_export = _tar([("./usr/bin/python3.12", b"python"), ("./usr/bin/python3", "./usr/bin/python3.12")])
+
+        self.assertEqual(_index(docker_export).entries, _index(wsl_export).entries)
+
+    def test_hard_links_of_an_unchanged_environment_are_not_user_changes(self):
+        old_image = _tar([("usr/bin/python3", b"python"), ("usr/bin/python3.12", "usr/bin/python3")])
+        environment = _tar([("./usr/bin/python3.12", b"python"), ("./usr/bin/python3", "./usr/bin/python3.12")])
+        new_image = _tar([("usr/bin/python3", b"python 2"), ("usr/bin/python3.12", "usr/bin/python3")])
+        diff = RootfsDiff(_index(old_image))
+        diff.index(io.BytesIO(environment))
+        report = RootfsDiffReport(dry_run=False)
+
+        diff.compare(io.BytesIO(new_image), io.BytesIO(), report)
+
+        self.assertEqual([], report.modified)
+        self.assertEqual(["usr/bin/python3", "usr/bin/python3.12"], report.changed)
+
+    def test_listing_of_an_extracted_rootfs_matches_the_export(self):
+        passwd = b"root:x:0:0::/root:/bin/sh\n"
+        export = _tar([("etc/passwd", passwd), ("usr/bin/env", b"env"), ("usr/bin/printenv", "usr/bin/env")])
+        # Extracted hard links are plain files, stat reports the raw mode in hex
+        listing = "\n".join([
+            "@stat", "81ed 0 0 26 0 0 ./etc/passwd", "81ed 0 0 3 0 0 ./usr/bin/env", "81ed 0 0 3 0 0 ./usr/bin/printenv",
+            "@sha256", f"{hashlib.sha256(passwd).hexdigest()}  ./etc/passwd",
+            f"{hashlib.sha256(b'env').hexdigest()}  ./usr/bin/env",
+            f"{hashlib.sha256(b'env').hexdigest()}  ./usr/bin/printenv",
+            "@links", "@account etc/passwd", passwd.decode()])
+
+        index = ImageIndex.from_listing(gzip.compress(listing.encode()))
+
+        self.assertEqual(_index(export).entries, index.entries)
+        self.assertEqual({"etc/passwd": {"root"}}, index.accounts)
+
+    def test_index_survives_a_round_trip(self):
+        index = _index(_tar([("etc/passwd", b"root:x:0:0::/root:/bin/sh\n"), ("usr/bin/env", b"env")]))
+
+        loaded = ImageIndex.loads(index.dumps())
+
+        self.assertEqual(index.entries, loaded.entries)
+        self.assertEqual({"etc/passwd": {"root"}}, loaded.accounts)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from benchmarks.fake_wsl import FakeWslSandbox
+
+WEO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "WEO.py")
+
+
+class ProfileTraceTest(unittest.TestCase):
+    PASSWORD = "s3cret-Pa55word"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="weo-test-")
+        self.sandbox = FakeWslSandbox(self.root).__enter__()
+        image = os.path.join(self.root, "image")
+        os.makedirs(os.path.join(image, "usr", "lib"))
+        self.sandbox.set_base_image(image)
+
+    def tearDown(self):
+        self.sandbox.__exit__(None, None, None)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _create(self, environment_name: str, *options: str) -> tuple[str, str]:
+        trace = os.path.join(self.root, f"{environment_name}.json")
+        result = subprocess.run([sys.executable, WEO, "create", "-d", "alpine:3.20", "-e", environment_name,
+                                 "-u", "weo", "-p", self.PASSWORD, "--profile", trace, *options],
+                                capture_output=True, text=True, cwd=self.root)
+        self.assertEqual(0, result.returncode, result.stdout + result.stderr)
+        with open(os.path.join(self.sandbox.home, "wsl", environment_name, "rootfs", "etc", "shadow"),
+                  encoding="utf-8") as shadow:
+            password_hash = shadow.read().split("weo:", 1)[1].split(":", 1)[0]
+        with open(trace, encoding="utf-8") as file:
+            return file.read(), password_hash
+
+    def test_staged_create_keeps_the_password_out_of_the_trace(self):
+        trace, password_hash = self._create("staged", "--no-artifact-cache")
+
+        self.assertTrue(password_hash.startswith("$6$"))
+        self.assertIn("mkpasswd", trace)
+        self.assertNotIn(self.PASSWORD, trace)
+
+    def test_streamed_create_keeps_the_password_out_of_the_trace(self):
+        trace, password_hash = self._create("streamed", "--streaming", "--no-artifact-cache")
+
+        self.assertTrue(password_hash.startswith("$6$"))
+        self.assertNotIn(self.PASSWORD, trace)
+        self.assertNotIn(password_hash, trace)
+
+
+if __name__ == "__main__":
+    unittest.main()
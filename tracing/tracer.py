@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+
+class Span:
+    def __init__(self, name: str, category: str, args: dict):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.thread_id = threading.get_ident()
+        self.thread_name = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end: float | None = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+
+class StepSpans:
+    def __init__(self, tracer: "Tracer", category: str, step_desc: Callable[[str], None]):
+        self._tracer = tracer
+        self._category = category
+        self._step_desc = step_desc
+        self._current: Span | None = None
+
+    def __call__(self, description: str) -> None:
+        # Every reported step ends the previous one, so the existing progress callbacks define the spans
+        self.close()
+        if self._tracer.enabled:
+            self._current = self._tracer.begin(description, self._category)
+        self._step_desc(description)
+
+    def close(self) -> None:
+        if self._current:
+            self._tracer.end(self._current)
+            self._current = None
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False):
+        self._enabled = enabled
+        self._spans: list[Span] = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @property
+    def spans(self) -> list[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def begin(self, name: str, category: str, **args) -> Span:
+        return Span(name, category, args)
+
+    def end(self, span: Span, **args) -> None:
+        span.end = time.perf_counter()
+        span.args.update(args)
+        if self._enabled:
+            with self._lock:
+                self._spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, category: str, **args):
+        span = self.begin(name, category, **args)
+        try:
+            yield span
+        except BaseException as e:
+            span.args["error"] = type(e).__name__
+            raise
+        finally:
+            self.end(span)
+
+    def steps(self, category: str, step_desc: Callable[[str], None]) -> StepSpans:
+        return StepSpans(self, category, step_desc)
+
+    def chrome_trace(self) -> dict:
+        events = []
+        thread_names = {}
+        pid = os.getpid()
+        for span in self.spans:
+            thread_names[span.thread_id] = span.thread_name
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round((span.start - self._origin) * 1_000_000, 1),
+                "dur": round(span.duration * 1_000_000, 1),
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {key: value if isinstance(value, (int, float, bool, type(None))) else str(value)
+                         for key, value in span.args.items()},
+            })
+        for thread_id, thread_name in thread_names.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id,
+                           "args": {"name": thread_name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.chrome_trace(), file)
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def set_tracer(tracer: Tracer) -> None:
+    global _tracer
+    _tracer = tracer
@@ -0,0 +1,115 @@
+import re
+import secrets
+
+from wsl.wsl_api import WslApi, WslApiError
+
+
+class CommandStepResult:
+    def __init__(self, name: str, command: str, returncode: int | None = None, stdout: str = "", stderr: str = ""):
+        self.name = name
+        self.command = command
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+
+    @property
+    def executed(self) -> bool:
+        return self.returncode is not None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.returncode == 0
+
+
+class CommandBatchResult:
+    def __init__(self, steps: list[CommandStepResult]):
+        self._steps = steps
+
+    def __getitem__(self, name: str) -> CommandStepResult:
+        for step in self._steps:
+            if step.name == name:
+                return step
+        raise KeyError(name)
+
+    @property
+    def steps(self) -> list[CommandStepResult]:
+        return self._steps
+
+    @property
+    def failed_step(self) -> CommandStepResult | None:
+        for step in self._steps:
+            if step.executed and not step.succeeded:
+                return step
+        return None
+
+    @property
+    def succeeded(self) -> bool:
+        return all(step.succeeded for step in self._steps)
+
+    def check(self) -> None:
+        if self.succeeded:
+            return
+        step = self.failed_step
+        if not step:
+            raise WslApiError("Command batch was aborted before all steps were run.")
+        stdout = "" if not step.stdout else " Stdout: " + step.stdout
+        stderr = "" if not step.stderr else " Stderr: " + step.stderr
+        raise WslApiError(
+            f"Command could not be run (step '{step.name}')." + stdout + stderr)
+
+
+class CommandBatch:
+    _VARIABLE_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+    def __init__(self, wsl_api: WslApi, instance_name: str, user: str = 'root'):
+        self._wsl_api = wsl_api
+        self._instance_name = instance_name
+        self._user = user
+        self._steps: list[tuple[str, str, str | None, bool]] = []
+
+    def __len__(self) -> int:
+        return len(self._steps)
+
+    def add(self, command: str, name: str | None = None, capture: str | None = None,
+            stdin: bool = False) -> "CommandBatch":
+        if capture is not None and not self._VARIABLE_PATTERN.match(capture):
+            raise ValueError(f"Invalid capture variable name: {capture}")
+        if name is None:
+            name = capture if capture else f"step_{len(self._steps)}"
+        self._steps.append((name, command, capture, stdin))
+        return self
+
+    def script(self, sentinel: str) -> str:
+        lines = []
+        for _, command, capture, stdin in self._steps:
+            # Only a step reading the input of the batch keeps its stdin
+            redirect = "" if stdin else " </dev/null"
+            if capture:
+                # Captured values are available to all later steps as shell variable
+                lines.append(f"{capture}=$( (\n{command}\n){redirect} )")
+                lines.append("__weo_rc=$?")
+                lines.append(f"printf '%s' \"${capture}\"")
+            else:
+                lines.append(f"(\n{command}\n){redirect}")
+                lines.append("__weo_rc=$?")
+            lines.append(f"printf '\\n{sentinel} %d\\n' $__weo_rc")
+            lines.append(f"printf '\\n{sentinel}\\n' >&2")
+            lines.append("[ $__weo_rc -eq 0 ] || exit $__weo_rc")
+        return "\n".join(lines)
+
+    def run(self, input: str | None = None) -> CommandBatchResult:
+        sentinel = "__WEO_STEP_" + secrets.token_hex(8) + "__"
+        wsl_command = self._wsl_api.execute_in_instance(self._instance_name, self.script(sentinel), self._user, input)
+
+        stdout_parts = re.split(f"\n{sentinel} (\\d+)\n", "\n" + (wsl_command.stdout or ""))
+        stderr_parts = re.split(f"\n{sentinel}\n", "\n" + (wsl_command.stderr or ""))
+        results = []
+        for index, (name, command, _, _) in enumerate(self._steps):
+            result = CommandStepResult(name, command)
+            if 2 * index + 1 < len(stdout_parts):
+                result.returncode = int(stdout_parts[2 * index + 1])
+                result.stdout = stdout_parts[2 * index][1:] if index == 0 else stdout_parts[2 * index]
+                if index < len(stderr_parts) - 1:
+                    result.stderr = stderr_parts[index][1:] if index == 0 else stderr_parts[index]
+            results.append(result)
+        return CommandBatchResult(results)
@@ -0,0 +1,199 @@
+import collections
+import queue
+import secrets
+import shlex
+import subprocess
+import threading
+import time
+from typing import Iterator
+
+from tracing.tracer import get_tracer
+from wsl.wsl_api import WslApi, WslApiError, WslApiTimeoutError
+
+
+class CommandStream:
+    TAIL_LINES: int = 200
+    MAX_LINE_LENGTH: int = 4096
+    _READ_SIZE: int = 64 * 1024
+    _QUEUED_LINES: int = 1000
+    _POLL_INTERVAL: float = 0.25
+    _KILL_GRACE_PERIOD: float = 5.0
+    _MARKER_TIMEOUT: float = 5.0
+    _MARKER_VARIABLE: str = "WEO_COMMAND_STREAM"
+
+    def __init__(self, wsl_api: WslApi, instance_name: str, command: str, user: str = 'root',
+                 timeout: float | None = None, cancel: threading.Event | None = None, tail_lines: int = TAIL_LINES):
+        self._wsl_api = wsl_api
+        self._instance_name = instance_name
+        self._command = command
+        self._user = user
+        self._timeout = timeout
+        self._cancel = cancel or threading.Event()
+        self._marker = "__WEO_PGID_" + secrets.token_hex(8) + "__"
+        # Only the tail of the output is kept for error reports, so long builds need constant memory
+        self._tail: collections.deque[str] = collections.deque(maxlen=tail_lines)
+        self._lines: queue.Queue = queue.Queue(maxsize=self._QUEUED_LINES)
+        self._process: subprocess.Popen | None = None
+        self._process_group: int | None = None
+        self._deadline: float | None = None
+        self._returncode: int | None = None
+        self._open_streams = 2
+        self._closed = False
+        self._span = None
+
+    @property
+    def tail(self) -> list[str]:
+        return list(self._tail)
+
+    @property
+    def returncode(self) -> int | None:
+        return self._returncode
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self) -> None:
+        if self._process is not None:
+            return
+        # The command runs in a session of its own, so it can be killed together with all its children.
+        # Started in the background, setsid is never a process group leader and does not fork.
+        # The marker is also inherited through the environment, so the processes can be found without the group.
+        wrapped_command = (f"{self._MARKER_VARIABLE}={self._marker} "
+                           f"setsid sh -c 'printf \"%s %d\\n\" \"$1\" \"$$\"; exec sh -c \"$2\"' "
+                           f"sh {self._marker} {shlex.quote(self._command)} & wait $!")
+        self._span = get_tracer().begin("stream", "wsl", instance=self._instance_name, command=self._command,
+                                        spawn=True)
+        self._process = self._wsl_api.open_command_in_instance(self._instance_name, wrapped_command, self._user,
+                                                               stdin=subprocess.DEVNULL)
+        self._deadline = time.monotonic() + self._timeout if self._timeout else None
+        for stream, name in [(self._process.stdout, "stdout"), (self._process.stderr, "stderr")]:
+            threading.Thread(target=self._read, args=(stream, name), daemon=True).start()
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        self.start()
+        while self._open_streams:
+            try:
+                name, line = self._lines.get(timeout=self._POLL_INTERVAL)
+            except queue.Empty:
+                self._check_interrupted()
+                continue
+            if line is None:
+                self._open_streams -= 1
+                continue
+            if self._read_process_group(name, line):
+                continue
+            self._tail.append(line)
+            yield name, line
+            self._check_interrupted()
+        self._returncode = self._process.wait()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def wait(self) -> int:
+        for _ in self:
+            pass
+        return self._returncode
+
+    def check(self) -> None:
+        if self.wait() != 0:
+            raise WslApiError(f"Command could not be run (exit code {self._returncode}). "
+                              f"Output tail:\n" + "\n".join(self._tail))
+
+    def close(self) -> None:
+        if self._process is None or self._closed:
+            return
+        self._closed = True
+        if self._process.poll() is None:
+            self._kill()
+        if self._span:
+            get_tracer().end(self._span, exit_code=self._process.returncode, timeout=self._timeout,
+                             cancelled=self._cancel.is_set())
+            self._span = None
+
+    def _check_interrupted(self) -> None:
+        if self._cancel.is_set():
+            self._kill()
+            raise WslApiError("Command was cancelled. Output tail:\n" + "\n".join(self._tail))
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            self._kill()
+            raise WslApiTimeoutError(f"Command did not finish within {self._timeout:.0f} seconds. "
+                                     f"Output tail:\n" + "\n".join(self._tail))
+
+    def _kill(self) -> None:
+        # Killing wsl.exe alone would leave the command running within the instance
+        if self._process_group is None:
+            self._await_process_group()
+        if self._process_group is not None:
+            process_group = f"-- -{self._process_group}"
+            self._wsl_api.execute_in_instance(
+                self._instance_name,
+                f"kill -TERM {process_group} 2> /dev/null; "
+                f"for i in $(seq 1 {int(self._KILL_GRACE_PERIOD * 10)}); do "
+                f"kill -0 {process_group} 2> /dev/null || exit 0; sleep 0.1; done; "
+                f"kill -KILL {process_group} 2> /dev/null; true",
+                self._user)
+        elif self._process.poll() is None:
+            # Without the process group, all processes which inherited the marker are killed
+            self._wsl_api.execute_in_instance(
+                self._instance_name,
+                f"pids=$(grep -ls -- {self._MARKER_VARIABLE}={self._marker} /proc/[0-9]*/environ | cut -d / -f 3); "
+                f"[ -z \"$pids\" ] || kill -KILL $pids 2> /dev/null; true",
+                self._user)
+        self._process.kill()
+        self._process.wait()
+        self._returncode = self._process.returncode
+
+    def _read_process_group(self, name: str, line: str) -> bool:
+        if self._process_group is None and name == "stdout" and line.startswith(self._marker + " "):
+            self._process_group = int(line[len(self._marker) + 1:])
+            return True
+        return False
+
+    def _await_process_group(self) -> None:
+        # A timeout or cancel can fire before the process group was reported, it is printed right after the start
+        deadline = time.monotonic() + self._MARKER_TIMEOUT
+        while self._process_group is None and self._open_streams and self._process.poll() is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                name, line = self._lines.get(timeout=min(remaining, self._POLL_INTERVAL))
+            except queue.Empty:
+                continue
+            if line is None:
+                self._open_streams -= 1
+            elif not self._read_process_group(name, line):
+                self._tail.append(line)
+
+    def _read(self, stream, name: str) -> None:
+        partial = b""
+        try:
+            while chunk := stream.read1(self._READ_SIZE):
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()
+                # Progress output without line breaks is split, so a single line never grows unbounded
+                while len(partial) > self.MAX_LINE_LENGTH:
+                    lines.append(partial[:self.MAX_LINE_LENGTH])
+                    partial = partial[self.MAX_LINE_LENGTH:]
+                for line in lines:
+                    self._put(name, line)
+            if partial:
+                self._put(name, partial)
+        finally:
+            self._put(name, None)
+
+    def _put(self, name: str, line: bytes | None) -> None:
+        text = None if line is None else line.decode("utf-8", errors="replace").rstrip("\r")
+        while True:
+            try:
+                self._lines.put((name, text), timeout=self._POLL_INTERVAL)
+                return
+            except queue.Full:
+                # Nobody consumes the output anymore after the stream was closed
+                if self._closed:
+                    return
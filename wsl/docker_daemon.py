@@ -1,6 +1,14 @@
 import os
+import secrets
 import subprocess
 import tempfile
+import threading
+import time
+
+from exceptions.DockerDaemonError import DockerDaemonError
+from tracing.tracer import get_tracer
+from wsl.wsl_api import WslApi
+
 
 class DockerdScript:
 
@@ -29,23 +37,201 @@ bg %1
 
 
 class DockerDaemon:
-    def __init__(self, instance_name: str):
+    PID_FILE: str = "/var/run/docker.pid"
+    LOG_FILE: str = "/var/log/weo-dockerd.log"
+    # Every WEO process using the daemon holds a file here with the pid of a shell living as long as the process
+    LEASE_DIR: str = "/var/run/weo-docker-leases"
+    # Pid of a daemon whose owner ended while other WEO processes still used it, the last of them stops it
+    HANDOFF_FILE: str = "/var/run/weo-docker-handoff"
+
+    def __init__(self, wsl_api: WslApi, instance_name: str, ready_timeout: float = 60.0,
+                 poll_interval: float = 0.25):
         self.task = None
+        self._wsl_api = wsl_api
         self._instance_name = instance_name
+        self._ready_timeout = ready_timeout
+        self._poll_interval = poll_interval
+        self._lock = threading.RLock()
+        self._users = 0
+        self._owned = False
+        self._lease = None
+        self._start_count = 0
+        self._stop_count = 0
+        self._ready_times: list[float] = []
+
+    @property
+    def running(self) -> bool:
+        return self._users > 0
+
+    @property
+    def start_count(self) -> int:
+        return self._start_count
 
     @property
-    def stdout(self):
-        return self.task.stdout.read()
+    def stop_count(self) -> int:
+        return self._stop_count
 
     @property
-    def stderr(self):
-        return self.task.stderr.read()
+    def ready_times(self) -> list[float]:
+        return list(self._ready_times)
 
     def __enter__(self):
-        self.task = subprocess.Popen(
-            ['wsl.exe', '-u', "root", '-d', self._instance_name, "/usr/bin/dockerd"],
+        with self._lock:
+            if self._users == 0:
+                # The lease is taken first, so gc never sees a started daemon without one
+                self._take_lease()
+                try:
+                    with get_tracer().span("dockerd start", "docker", instance=self._instance_name) as span:
+                        self._start()
+                        span.args["reused"] = not self._owned
+                except BaseException:
+                    self._release_lease()
+                    raise
+            self._users += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self._lock:
+            self._users -= 1
+            if self._users == 0:
+                # The own lease goes first, so every remaining one belongs to another process using the daemon
+                self._release_lease()
+                with get_tracer().span("dockerd stop", "docker", instance=self._instance_name,
+                                       owned=self._owned):
+                    self._stop()
+
+    def restart_if_exited(self) -> bool:
+        with self._lock:
+            # WSL stops the instance and the daemon with it on "wsl --shutdown", a held daemon is started again
+            if self._users == 0 or not self._owned or self.task is None or self.task.poll() is None:
+                return False
+            self.task = None
+            if self._lease is not None and self._lease.poll() is not None:
+                self._lease = None
+                self._take_lease()
+            with get_tracer().span("dockerd start", "docker", instance=self._instance_name, restarted=True):
+                self._start()
+            return True
+
+    @classmethod
+    def live_leases_command(cls) -> str:
+        # Prints a line for every lease whose shell still runs, leases of killed processes are left out
+        return (f"for lease in {cls.LEASE_DIR}/*; do [ -f \"$lease\" ] || continue; "
+                f"pid=$(cat \"$lease\"); [ -n \"$pid\" ] && kill -0 \"$pid\" 2> /dev/null && echo live; done")
+
+    def _take_lease(self) -> None:
+        lease_file = f"{self.LEASE_DIR}/{secrets.token_hex(8)}"
+        # The shell waits until its stdin is closed, which also happens when the WEO process is killed. A daemon
+        # handed off to this process is stopped then unless yet another process uses it
+        self._lease = subprocess.Popen(
+            ['wsl.exe', '-u', "root", '-d', self._instance_name, 'sh', '-c',
+             f"mkdir -p {self.LEASE_DIR} && echo $$ > {lease_file} && echo ready && cat > /dev/null; "
+             f"rm -f {lease_file}; pid=$(cat {self.PID_FILE} 2> /dev/null) && "
+             f"[ \"$(cat {self.HANDOFF_FILE} 2> /dev/null)\" = \"$pid\" ] && "
+             f"[ -z \"$({self.live_leases_command()})\" ] && rm -f {self.HANDOFF_FILE} && kill \"$pid\""],
+            stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
+            stderr=subprocess.DEVNULL)
+        if self._lease.stdout.readline().strip() != b"ready":
+            self._release_lease()
+            raise DockerDaemonError("The docker daemon could not be leased")
+
+    def _release_lease(self) -> None:
+        if self._lease is None:
+            return
+        lease, self._lease = self._lease, None
+        try:
+            lease.stdin.close()
+        except OSError:
+            pass
+        try:
+            lease.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            lease.kill()
+            lease.wait()
+        lease.stdout.close()
+
+    def _is_ready(self) -> bool:
+        result = self._wsl_api.execute_in_instance(
+            self._instance_name,
+            "test -S /var/run/docker.sock && docker version --format '{{.Server.Version}}'")
+        return result.returncode == 0
+
+    def _start(self) -> None:
+        start_time = time.monotonic()
+        if self._is_ready():
+            # A daemon which was not started by WEO is used but never stopped
+            self._owned = False
+            self._ready_times.append(time.monotonic() - start_time)
+            return
+
+        self.task = subprocess.Popen(
+            ['wsl.exe', '-u', "root", '-d', self._instance_name, 'sh', '-c',
+             f"exec /usr/bin/dockerd > {self.LOG_FILE} 2>&1"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+        self._owned = True
+        self._start_count += 1
+
+        while not self._is_ready():
+            if self.task.poll() is not None:
+                self.task = None
+                raise DockerDaemonError(f"The docker daemon exited during startup, see {self.LOG_FILE}")
+            if time.monotonic() - start_time > self._ready_timeout:
+                self._stop(handoff=False)
+                raise DockerDaemonError(f"The docker daemon was not ready within {self._ready_timeout} seconds")
+            time.sleep(self._poll_interval)
+        self._ready_times.append(time.monotonic() - start_time)
+
+    def _stop(self, handoff: bool = True) -> None:
+        if not self._owned or self.task is None:
+            return
+        self._owned = False
+        # Another WEO process which reused the daemon may still be building, the daemon is handed off to it then.
+        # The handoff is recorded before the leases are checked, so a lease ending meanwhile still finds it
+        stop_command = (f"kill \"$pid\"; "
+                        f"for i in $(seq 1 100); do test -f {self.PID_FILE} || break; sleep 0.1; done")
+        if handoff:
+            stop_command = (f"echo \"$pid\" > {self.HANDOFF_FILE}; "
+                            f"if [ -n \"$({self.live_leases_command()})\" ]; then echo handed-off; "
+                            f"else rm -f {self.HANDOFF_FILE}; {stop_command}; fi")
+        result = self._wsl_api.execute_in_instance(
+            self._instance_name, f"pid=$(cat {self.PID_FILE} 2> /dev/null) && {{ {stop_command}; }}")
+        if "handed-off" in (result.stdout or ""):
+            # The daemon keeps running within the instance, only this process lets go of it
+            self.task = None
+            return
+        try:
+            self.task.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.task.kill()
+            self.task.wait()
+        self.task = None
+        self._stop_count += 1
+
+
+class DockerDaemonLease:
+    def __init__(self, docker_daemon: DockerDaemon):
+        self._docker_daemon = docker_daemon
+        self._held = False
+
+    @property
+    def held(self) -> bool:
+        return self._held
+
+    def __enter__(self):
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.task.terminate()
+        self.release()
+
+    def acquire(self) -> None:
+        if not self._held:
+            self._docker_daemon.__enter__()
+            self._held = True
+
+    def release(self) -> None:
+        if self._held:
+            self._held = False
+            self._docker_daemon.__exit__(None, None, None)
@@ -1,28 +1,88 @@
 import subprocess
 import os
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Callable
 
 import click
 
+from tracing.tracer import get_tracer
+from wsl.wsl_registry import WslRegistry
+from wsl.wsl_session import WslSession, WslSessionError
+
 
 class WslApiError(Exception):
     pass
 
 
+class WslApiTimeoutError(WslApiError):
+    pass
+
+
+class _CountingWriter:
+    def __init__(self, target: BinaryIO):
+        self._target = target
+        self.written = 0
+
+    def write(self, data: bytes) -> int:
+        self._target.write(data)
+        self.written += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        self._target.flush()
+
+
+class StderrReader:
+    # Reads stderr while the other pipes are streamed, a process filling the stderr pipe would block otherwise
+    def __init__(self, process: subprocess.Popen):
+        self._stream = process.stderr
+        self._data = b""
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def text(self) -> str:
+        self._thread.join()
+        return self._data.decode("utf-8", errors="replace")
+
+    def _read(self) -> None:
+        self._data = self._stream.read()
+
+
 class WslApi:
-    def __init__(self, storage_path: str, verbose: bool):
-        if not storage_path.endswith("\\"):
-            storage_path = storage_path + "\\"
+    BUFFER_SIZE: int = 1024 * 1024
+    # Names of the instance dirs which WEO created in the storage path, only these are ever reclaimed
+    INSTANCE_DIRS_RECORD: str = ".weo-instances"
+
+    def __init__(self, storage_path: str, verbose: bool, registry: WslRegistry | None = None):
+        if not storage_path.endswith(os.sep):
+            storage_path = storage_path + os.sep
         self._storage_path = storage_path
         self._verbose = verbose
+        self._registry = registry or WslRegistry()
+        self._sessions = threading.local()
         os.makedirs(self._storage_path, exist_ok=True)
 
+    @property
+    def registry(self) -> WslRegistry:
+        return self._registry
+
+    @property
+    def storage_path(self) -> str:
+        return self._storage_path
+
     def create_instance(self, name: str, template_path: str) -> None:
-        wsl_create = subprocess.run(
-            ['wsl.exe', '--import', name, self._storage_path + name, template_path],
-            shell=True,
-            check=False,
-            capture_output=True,
-            text=True)
+        self._record_instance_dir(name)
+        try:
+            with get_tracer().span("wsl --import", "wsl", instance=name, spawn=True) as span:
+                wsl_create = subprocess.run(
+                    ['wsl.exe', '--import', name, self._storage_path + name, template_path],
+                    check=False,
+                    capture_output=True,
+                    text=True)
+                span.args["exit_code"] = wsl_create.returncode
+        finally:
+            self._registry.invalidate()
 
         if wsl_create.returncode != 0:
             stdout = "" if not wsl_create.stdout else " Stdout: " + wsl_create.stdout
@@ -31,26 +91,136 @@ class WslApi:
                 "Instance could not be created." + stdout + stderr)
 
     def remove_instance(self, name: str) -> None:
-        wsl_delete = subprocess.run(
-            ['wsl.exe', '--unregister', name],
-            shell=True,
-            check=False,
-            capture_output=True,
-            text=True)
+        try:
+            with get_tracer().span("wsl --unregister", "wsl", instance=name, spawn=True) as span:
+                wsl_delete = subprocess.run(
+                    ['wsl.exe', '--unregister', name],
+                    check=False,
+                    capture_output=True,
+                    text=True)
+                span.args["exit_code"] = wsl_delete.returncode
+        finally:
+            self._registry.invalidate()
         if wsl_delete.returncode != 0:
             stdout = "" if not wsl_delete.stdout else " Stdout: " + wsl_delete.stdout
             stderr = "" if not wsl_delete.stderr else " Stderr: " + wsl_delete.stderr
             raise WslApiError("Instance could not be removed." + stdout + stderr)
 
-    def run_command_in_instance(self, name: str, command: str, user: str = 'root') -> str:
+    def terminate_instance(self, name: str) -> None:
+        with get_tracer().span("wsl --terminate", "wsl", instance=name, spawn=True) as span:
+            wsl_terminate = subprocess.run(
+                ['wsl.exe', '--terminate', name],
+                check=False,
+                capture_output=True,
+                text=True)
+            span.args["exit_code"] = wsl_terminate.returncode
+        if wsl_terminate.returncode != 0:
+            stdout = "" if not wsl_terminate.stdout else " Stdout: " + wsl_terminate.stdout
+            stderr = "" if not wsl_terminate.stderr else " Stderr: " + wsl_terminate.stderr
+            raise WslApiError("Instance could not be terminated." + stdout + stderr)
+
+    @contextmanager
+    def session(self, name: str, user: str = 'root'):
+        sessions = self._get_sessions()
+        if (name, user) in sessions:
+            yield sessions[(name, user)]
+            return
+        with get_tracer().span("session", "wsl", instance=name, user=user, spawn=True), \
+                WslSession(name, user) as wsl_session:
+            sessions[(name, user)] = wsl_session
+            try:
+                yield wsl_session
+            finally:
+                del sessions[(name, user)]
+
+    def execute_in_instance(self, name: str, command: str, user: str = 'root',
+                            input: str | None = None) -> subprocess.CompletedProcess:
+        if self._verbose:
+            click.secho(f"[DEBUG:] {command}", fg="cyan")
+        wsl_session = self._get_sessions().get((name, user))
+        with get_tracer().span("execute", "wsl", instance=name, command=command,
+                               session=wsl_session is not None, spawn=wsl_session is None) as span:
+            if wsl_session:
+                try:
+                    result = wsl_session.run(command, input)
+                except WslSessionError as e:
+                    raise WslApiError(f"Command could not be run. {e}") from e
+            else:
+                result = subprocess.run(
+                    ['wsl.exe', '-u', user, '-d', name, 'sh', '-c',
+                     command],
+                    input=input,
+                    capture_output=True,
+                    text=True)
+            span.args.update(exit_code=result.returncode, stdout_bytes=len(result.stdout or ""),
+                             stderr_bytes=len(result.stderr or ""))
+        return result
+
+    def open_command_in_instance(self, name: str, command: str, user: str = 'root',
+                                 stdin=None, stdout=subprocess.PIPE) -> subprocess.Popen:
         if self._verbose:
             click.secho(f"[DEBUG:] {command}", fg="cyan")
-        wsl_command = subprocess.run(
-            ['wsl.exe', '-u', user, '-d', name, 'sh', '-c',
-             command],
-            shell=True,
-            capture_output=True,
-            text=True)
+        with get_tracer().span("open", "wsl", instance=name, command=command, spawn=True):
+            return subprocess.Popen(
+                ['wsl.exe', '-u', user, '-d', name, 'sh', '-c', command],
+                stdin=stdin,
+                stdout=stdout,
+                stderr=subprocess.PIPE)
+
+    def copy_to_instance(self, name: str, command: str, source: BinaryIO, user: str = 'root') -> int:
+        transferred = 0
+
+        def write(stdin: BinaryIO) -> None:
+            nonlocal transferred
+            while chunk := source.read(self.BUFFER_SIZE):
+                stdin.write(chunk)
+                transferred += len(chunk)
+
+        with get_tracer().span("copy to instance", "wsl", instance=name, command=command) as span:
+            self.stream_to_instance(name, command, write, user)
+            span.args["bytes"] = transferred
+        return transferred
+
+    def stream_to_instance(self, name: str, command: str, write: Callable[[BinaryIO], None],
+                           user: str = 'root') -> None:
+        process = self.open_command_in_instance(name, command, user, stdin=subprocess.PIPE,
+                                                stdout=subprocess.DEVNULL)
+        stderr_reader = StderrReader(process)
+        try:
+            write(process.stdin)
+        except BrokenPipeError:
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            stderr = stderr_reader.text()
+            process.wait()
+        if process.returncode != 0:
+            raise WslApiError("Data could not be copied into the instance. Stderr: " + stderr)
+
+    def copy_from_instance(self, name: str, command: str, target: BinaryIO, user: str = 'root') -> int:
+        with get_tracer().span("copy from instance", "wsl", instance=name, command=command) as span:
+            process = self.open_command_in_instance(name, command, user)
+            stderr_reader = StderrReader(process)
+            transferred = 0
+            try:
+                while chunk := process.stdout.read(self.BUFFER_SIZE):
+                    target.write(chunk)
+                    transferred += len(chunk)
+            finally:
+                process.stdout.close()
+                stderr = stderr_reader.text()
+                process.wait()
+                span.args.update(exit_code=process.returncode, bytes=transferred)
+        if process.returncode != 0:
+            raise WslApiError("Data could not be copied from the instance. Stderr: " + stderr)
+        return transferred
+
+    def run_command_in_instance(self, name: str, command: str, user: str = 'root', input: str | None = None) -> str:
+        # Secrets are passed as input, commands end up in verbose logs and traces
+        wsl_command = self.execute_in_instance(name, command, user, input)
 
         if wsl_command.returncode != 0:
             stdout = "" if not wsl_command.stdout else " Stdout: " + wsl_command.stdout
@@ -69,40 +239,97 @@ class WslApi:
             return False
         return True
 
-    @staticmethod
-    def export_instance(name, export_file_path) -> None:
-        wsl_script = subprocess.run(
-            ['wsl.exe', '--export', name, export_file_path],
-            shell=True,
-            check=True,
-            capture_output=True,
-            text=True)
-
-        if wsl_script.returncode != 0:
-            stdout = "" if not wsl_script.stdout else " Stdout: " + wsl_script.stdout
-            stderr = "" if not wsl_script.stderr else " Stderr: " + wsl_script.stderr
-            raise WslApiError(
-                "Instance could not be exported." + stdout + stderr)
+    def open_export_instance(self, name: str) -> subprocess.Popen:
+        return subprocess.Popen(
+            ['wsl.exe', '--export', name, '-'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
 
-    @staticmethod
-    def instance_exists(instance_name: str) -> bool:
-        return instance_name in WslApi._get_wsl_list()
+    def export_instance(self, name: str, target: BinaryIO) -> int:
+        with get_tracer().span("wsl --export", "wsl", instance=name, spawn=True) as span:
+            process = self.open_export_instance(name)
+            stderr_reader = StderrReader(process)
+            transferred = 0
+            try:
+                while chunk := process.stdout.read(self.BUFFER_SIZE):
+                    target.write(chunk)
+                    transferred += len(chunk)
+            finally:
+                process.stdout.close()
+                stderr = stderr_reader.text()
+                process.wait()
+                span.args.update(exit_code=process.returncode, bytes=transferred)
+        if process.returncode != 0:
+            raise WslApiError("Instance could not be exported. Stderr: " + stderr)
+        return transferred
 
-    @staticmethod
-    def _get_wsl_list() -> str:
-        wsl_list = subprocess.run(['wsl.exe', '--list'], shell=True, capture_output=True, text=True)
-        if wsl_list.returncode != 0:
-            # Either list could not be fetched or no distributions yet
-            return ""
-
-        wsl_list_string = wsl_list.stdout
-        wsl_list_string = wsl_list_string.replace('\x00', '')
-        wsl_list_string = wsl_list_string.split()
-        wsl_list_string = " ".join(wsl_list_string)
-        return wsl_list_string
+    def import_instance(self, name: str, source: BinaryIO) -> int:
+        def write(stdin: BinaryIO) -> None:
+            while chunk := source.read(self.BUFFER_SIZE):
+                stdin.write(chunk)
+
+        return self.import_instance_from(name, write)
+
+    def import_instance_from(self, name: str, write: Callable[[BinaryIO], None]) -> int:
+        self._record_instance_dir(name)
+        with get_tracer().span("wsl --import", "wsl", instance=name, spawn=True) as span:
+            process = subprocess.Popen(
+                ['wsl.exe', '--import', name, self._storage_path + name, '-'],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE)
+            stderr_reader = StderrReader(process)
+            stdin = _CountingWriter(process.stdin)
+            try:
+                write(stdin)
+            except BrokenPipeError:
+                pass
+            except BaseException:
+                # A rootfs which was not written completely must never end up as an instance
+                process.kill()
+                raise
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+                stderr = stderr_reader.text()
+                process.wait()
+                self._registry.invalidate()
+                span.args.update(exit_code=process.returncode, bytes=stdin.written)
+        if process.returncode != 0:
+            raise WslApiError("Instance could not be imported. Stderr: " + stderr)
+        return stdin.written
+
+    def instance_exists(self, instance_name: str) -> bool:
+        return self._registry.instance_exists(instance_name)
+
+    def instance_dir_recorded(self, name: str) -> bool:
+        return os.path.isfile(self._instance_dir_record(name))
+
+    def forget_instance_dir(self, name: str) -> None:
+        if os.path.exists(self._instance_dir_record(name)):
+            os.remove(self._instance_dir_record(name))
+
+    def _record_instance_dir(self, name: str) -> None:
+        # Recorded before the import, which leaves the dir behind when it fails or WEO is killed
+        os.makedirs(os.path.join(self._storage_path, self.INSTANCE_DIRS_RECORD), exist_ok=True)
+        with open(self._instance_dir_record(name), "w", encoding="utf-8"):
+            pass
+
+    def _instance_dir_record(self, name: str) -> str:
+        return os.path.join(self._storage_path, self.INSTANCE_DIRS_RECORD, name.lower())
+
+    def _get_sessions(self) -> dict[tuple[str, str], WslSession]:
+        if not hasattr(self._sessions, "open"):
+            self._sessions.open = {}
+        return self._sessions.open
 
     @staticmethod
     def linuxify(path: str) -> str:
+        # Paths of posix hosts, e.g. of the benchmark stand-in for wsl.exe, are used as they are
+        if os.name != "nt":
+            return path
         volume = path[:1]
         volume = volume.lower()
         new_path = path.replace(os.sep, '/')
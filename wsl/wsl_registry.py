@@ -1,20 +1,118 @@
+import os
 import subprocess
+import threading
+from enum import Enum
 
+from tracing.tracer import get_tracer
+
+
+class WslInstanceState(Enum):
+    RUNNING = "Running"
+    STOPPED = "Stopped"
+    INSTALLING = "Installing"
+    CONVERTING = "Converting"
+    UNINSTALLING = "Uninstalling"
+    UNKNOWN = "Unknown"
+
+
+class WslInstance:
+    def __init__(self, name: str, state: WslInstanceState, version: int | None, default: bool):
+        self.name = name
+        self.state = state
+        self.version = version
+        self.default = default
+
+
+class WslRegistry:
+    _LXSS_KEY: str = r"Software\Microsoft\Windows\CurrentVersion\Lxss"
+    # Hosts without the Windows registry cannot tell a re-imported instance from the original one
+    UNKNOWN_GUID: str = "unknown"
+
+    def __init__(self):
+        self._instances: list[WslInstance] | None = None
+        self._lock = threading.Lock()
+
+    def instances(self, refresh: bool = False) -> list[WslInstance]:
+        with self._lock:
+            if refresh or self._instances is None:
+                self._instances = self.parse(self._query())
+            return list(self._instances)
+
+    def get(self, instance_name: str) -> WslInstance | None:
+        for instance in self.instances():
+            # WSL treats distribution names case-insensitively
+            if instance.name.lower() == instance_name.lower():
+                return instance
+        return None
+
+    def instance_exists(self, instance_name: str) -> bool:
+        return self.get(instance_name) is not None
+
+    @classmethod
+    def instance_guid(cls, instance_name: str) -> str | None:
+        try:
+            import winreg
+        except ImportError:
+            return cls.UNKNOWN_GUID
+        try:
+            lxss_key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, cls._LXSS_KEY)
+        except OSError:
+            return None
+        with lxss_key:
+            index = 0
+            while True:
+                try:
+                    guid = winreg.EnumKey(lxss_key, index)
+                except OSError:
+                    # EnumKey raises an OSError once all subkeys were visited
+                    return None
+                index += 1
+                # Not every subkey is a distribution, those without a name are skipped
+                try:
+                    with winreg.OpenKey(lxss_key, guid) as distribution_key:
+                        name, _ = winreg.QueryValueEx(distribution_key, "DistributionName")
+                except OSError:
+                    continue
+                if isinstance(name, str) and name.lower() == instance_name.lower():
+                    return guid
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._instances = None
 
-class WSLRegistry:
     @staticmethod
-    def instance_exists(instance_name: str) -> bool:
-        return instance_name in WSLRegistry._get_wsl_list()
+    def parse(output: str) -> list[WslInstance]:
+        instances = []
+        # The header is localized, so it is only skipped and never used to find the columns
+        for line in output.splitlines()[1:]:
+            default = line.lstrip().startswith("*")
+            fields = line.strip().lstrip("*").split()
+            if len(fields) < 3:
+                continue
+            name, state, version = fields[0], " ".join(fields[1:-1]), fields[-1]
+            try:
+                instance_state = WslInstanceState(state)
+            except ValueError:
+                instance_state = WslInstanceState.UNKNOWN
+            instances.append(WslInstance(name, instance_state, int(version) if version.isdigit() else None, default))
+        return instances
 
     @staticmethod
-    def _get_wsl_list() -> str:
-        wsl_list = subprocess.run(['wsl.exe', '--list'], shell=True, capture_output=True, text=True)
+    def _query() -> str:
+        with get_tracer().span("wsl --list", "wsl", spawn=True) as span:
+            wsl_list = subprocess.run(
+                ['wsl.exe', '--list', '--verbose'],
+                capture_output=True,
+                env={**os.environ, "WSL_UTF8": "1"})
+            span.args.update(exit_code=wsl_list.returncode, stdout_bytes=len(wsl_list.stdout))
         if wsl_list.returncode != 0:
             # Either list could not be fetched or no distributions yet
             return ""
+        return WslRegistry._decode(wsl_list.stdout)
 
-        wsl_list_string = wsl_list.stdout
-        wsl_list_string = wsl_list_string.replace('\x00', '')
-        wsl_list_string = wsl_list_string.split()
-        wsl_list_string = " ".join(wsl_list_string)
-        return wsl_list_string
+    @staticmethod
+    def _decode(output: bytes) -> str:
+        # Older WSL versions ignore WSL_UTF8 and always write UTF-16
+        if b"\x00" in output:
+            return output.decode("utf-16-le", errors="replace").lstrip("\ufeff")
+        return output.decode("utf-8", errors="replace")
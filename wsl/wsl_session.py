@@ -0,0 +1,117 @@
+import queue
+import secrets
+import subprocess
+import threading
+
+
+class WslSessionError(Exception):
+    pass
+
+
+class WslSession:
+    def __init__(self, instance_name: str, user: str = 'root'):
+        self._instance_name = instance_name
+        self._user = user
+        self._sentinel = "__WEO_" + secrets.token_hex(8) + "__"
+        self._lock = threading.Lock()
+        self._process = None
+        self._stdout_lines = None
+        self._stderr_lines = None
+
+    @property
+    def instance_name(self) -> str:
+        return self._instance_name
+
+    @property
+    def user(self) -> str:
+        return self._user
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self) -> None:
+        if self._process is not None:
+            return
+        self._process = subprocess.Popen(
+            ['wsl.exe', '-u', self._user, '-d', self._instance_name, 'sh'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        self._stdout_lines = self._start_reader(self._process.stdout)
+        self._stderr_lines = self._start_reader(self._process.stderr)
+
+    def close(self) -> None:
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.write(b"exit 0\n")
+            self._process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+
+    def run(self, command: str, input: str | None = None) -> subprocess.CompletedProcess:
+        with self._lock:
+            if not self.alive:
+                raise WslSessionError(f"Session to instance {self._instance_name} is not running")
+            # The command runs in a subshell so that cd, exports and exit behave like a fresh
+            # 'sh -c'. The leading newline of each marker ensures it always starts a line of
+            # its own, it is stripped again when the output is collected.
+            stdin = "</dev/null"
+            if input is not None:
+                # Input is passed as a here-document, so it never becomes part of the command
+                lines = input.rstrip("\n")
+                stdin = f"<<'{self._sentinel}'\n{lines}\n{self._sentinel}"
+            script = (
+                f"(\n{command}\n) {stdin}\n"
+                f"printf '\\n{self._sentinel} %d\\n' $?\n"
+                f"printf '\\n{self._sentinel}\\n' >&2\n"
+            )
+            try:
+                self._process.stdin.write(script.encode("utf-8"))
+                self._process.stdin.flush()
+            except OSError as e:
+                raise WslSessionError(f"Session to instance {self._instance_name} was closed") from e
+
+            stdout, returncode = self._collect(self._stdout_lines, f"{self._sentinel} ")
+            stderr, _ = self._collect(self._stderr_lines, self._sentinel)
+            return subprocess.CompletedProcess(command, returncode, stdout, stderr)
+
+    def _collect(self, lines: queue.Queue, marker: str) -> tuple[str, int]:
+        output = []
+        while True:
+            line = lines.get()
+            if line is None:
+                raise WslSessionError(f"Session to instance {self._instance_name} terminated unexpectedly")
+            if line.startswith(marker) and line.rstrip("\r\n").rstrip(" 0123456789") == marker.rstrip():
+                value = line[len(marker):].strip()
+                text = "".join(output)
+                if text.endswith("\n"):
+                    text = text[:-1]
+                return text, int(value) if value else 0
+            output.append(line)
+
+    @staticmethod
+    def _start_reader(stream) -> queue.Queue:
+        lines = queue.Queue()
+
+        def read():
+            for raw_line in iter(stream.readline, b""):
+                lines.put(raw_line.decode("utf-8", errors="replace").replace("\r\n", "\n"))
+            lines.put(None)
+
+        threading.Thread(target=read, daemon=True).start()
+        return lines